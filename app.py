@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, request, render_template_string, jsonify, send_file
+from flask import Flask, request, render_template_string, send_file, Response
 import os
 import subprocess
 import tempfile
@@ -14,70 +14,38 @@ import re
 import io
 import glob
 import traceback
+import json
+import threading
+import atexit
+from contextlib import contextmanager
+
+from ingest import ingest_file
+from result_cache import ResultCache
+from text_normalize import to_ascii, sanitize_upload_name
+from validator_pool import ValidatorPool, PoolFull
+from warm_workers import WarmWorkerPool, WorkerUnavailable
+from article_split import ARTICLES_DIR, run_concurrently
+from manifest import ManifestStore, article_fingerprint, issue_key
+from report_index import ReportIndex
+from response_cache import ResponseCache
+from log_reader import LogReader
+from log_queue import JsonLinesFormatter, clear_log_context, set_log_context, start_queue_logging
+from janitor import Janitor
+from job_events import EventLog, format_sse
+import pipeline
+from pipeline import (PackageHooks, article_summary, ingest_entries, limit_message, output_findings,
+                      subprocess_runner)
+from package_archive import ZIP_MIMETYPES, ArchiveError, PackageArchive, spool_stream
+from limits import MB, WALL, LimitPolicy
+import findings
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, COUNT_BUCKETS, SIZE_BUCKETS, Registry
+from report_store import (GZIP_SUFFIX, compress_bytes, compress_in_place, is_compressed, read_report,
+                          read_stored, store_bytes, store_file)
 
 # Forzar la codificación ASCII para Python 2.7
 reload(sys)
 sys.setdefaultencoding('ascii')
 
-# Función para convertir cualquier texto a ASCII puro
-
-def to_ascii(text):
-    """
-    Convierte cualquier texto a ASCII puro, reemplazando caracteres no-ASCII con alternativas seguras.
-    Maneja correctamente cadenas Unicode en Python 2.7.
-    """
-    if text is None:
-        return ""
-    
-    # Convertir a string si no lo es
-    if not isinstance(text, (str, unicode, bytes)):
-        try:
-            text = str(text)
-        except:
-            return repr(text)
-    
-    try:
-        # Si es bytes o str en Python 2.7, convertir a unicode primero
-        if isinstance(text, str):
-            # Intentar diferentes codificaciones
-            for encoding in ['utf-8', 'latin-1', 'cp1252']:
-                try:
-                    text = text.decode(encoding, errors='replace')
-                    break
-                except:
-                    continue
-        
-        # Si ahora es unicode, convertir a ASCII seguro
-        if isinstance(text, unicode):
-            # Reemplazar caracteres específicos en español
-            replacements = {
-                u'\xe1': 'a', u'\xe9': 'e', u'\xed': 'i', u'\xf3': 'o', u'\xfa': 'u',
-                u'\xc1': 'A', u'\xc9': 'E', u'\xcd': 'I', u'\xd3': 'O', u'\xda': 'U',
-                u'\xf1': 'n', u'\xd1': 'N', u'\xfc': 'u', u'\xdc': 'U',
-                u'\xbf': '?', u'\xa1': '!', u'\xe7': 'c', u'\xc7': 'C'
-            }
-            
-            for char, replacement in replacements.items():
-                text = text.replace(char, replacement)
-            
-            # Finalmente codificar a ASCII, reemplazando los caracteres restantes
-            return text.encode('ascii', errors='replace')
-    except:
-        pass
-    
-    # Si todo lo anterior falla, convertir byte por byte
-    try:
-        result = ''
-        for char in str(text):
-            if ord(char) < 128:
-                result += char
-            else:
-                result += '_'
-        return result
-    except:
-        # Último recurso
-        return repr(text)
-
 def safe_json_serialization(data):
     """
     Serializa datos a JSON de manera segura, asegurando que todos los 
@@ -102,88 +70,18 @@ def safe_json_serialization(data):
         # Devolver otros tipos sin cambios (números, booleanos, None)
         return data
 
-def sanitize_filename(filename):
-    """
-    Sanitiza un nombre de archivo para que solo contenga caracteres ASCII seguros.
-    """
-    if filename is None:
-        return ""
-    
-    # Primero convertir a ASCII puro
-    ascii_name = to_ascii(filename)
-    
-    # Luego eliminar caracteres no permitidos en nombres de archivo
-    safe_name = ''
-    for char in ascii_name:
-        if char.isalnum() or char in '._- ':
-            safe_name += char
-        else:
-            safe_name += '_'
-    
-    # Asegurar que no empieza ni termina con espacios
-    safe_name = safe_name.strip()
-    
-    # Si el nombre quedó vacío, usar un valor por defecto
-    if not safe_name:
-        safe_name = "file"
-    
-    return safe_name
-
-def sanitize_windows_path(path):
+def json_response(data, status=200):
     """
-    Sanitiza una ruta de archivo para que sea compatible con Windows.
-    Reemplaza caracteres no permitidos y caracteres no ASCII.
+    Construye una respuesta JSON compacta. Las cadenas casi siempre ya son
+    ASCII y json.dumps escapa el resto, así que los datos solo se recorren
+    con safe_json_serialization si traen bytes que no son UTF-8.
     """
-    if path is None:
-        return ""
-
-    # Caracteres no permitidos en rutas de Windows
-    invalid_chars = ['<', '>', ':', '"', '/', '\\', '|', '?', '*']
-
-    # Convertir a string si no lo es
-    if not isinstance(path, (str, unicode)):
-        path = str(path)
-
-    # Dividir la ruta en partes (directorios)
-    if '/' in path:
-        parts = path.split('/')
-    elif '\\' in path:
-        parts = path.split('\\')
-    else:
-        parts = [path]
-
-    # Sanitizar cada parte de la ruta
-    sanitized_parts = []
-    for part in parts:
-        if not part:  # Skip empty parts
-            continue
-            
-        # Primero convertir a ASCII
-        part_ascii = to_ascii(part)
-        
-        # Reemplazar caracteres inválidos
-        sanitized = ""
-        for char in part_ascii:
-            if char in invalid_chars:
-                sanitized += "_"
-            else:
-                sanitized += char
-        
-        # Eliminar espacios al principio y al final
-        sanitized = sanitized.strip()
-        
-        # Si después de sanitizar queda vacío, poner un valor por defecto
-        if not sanitized:
-            sanitized = "dir"
-            
-        sanitized_parts.append(sanitized)
-
-    # Reconstruir la ruta con el separador de Windows
-    if sanitized_parts:
-        sanitized_path = os.path.join(*sanitized_parts)
-        return sanitized_path
-    else:
-        return "dir"
+    try:
+        body = json.dumps(data, ensure_ascii=True, separators=(',', ':'))
+    except UnicodeDecodeError as json_error:
+        logger.error("Error al serializar JSON: {}".format(str(json_error)))
+        body = json.dumps(safe_json_serialization(data), ensure_ascii=True, separators=(',', ':'))
+    return Response(body, status=status, mimetype='application/json')
 
 # Configuración de logging
 log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
@@ -209,9 +107,21 @@ log_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 file_handler.setFormatter(log_format)
 console_handler.setFormatter(log_format)
 
-# Añadir handlers al logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+log_handlers = [file_handler, console_handler]
+
+# Copia opcional en JSON (una línea por registro) con sesión, etapa y duración
+LOG_JSON = os.environ.get('SCIELO_LOG_JSON', '0') == '1'
+if LOG_JSON:
+    json_handler = RotatingFileHandler(os.path.join(log_dir, 'scielo_validator.jsonl'),
+                                       maxBytes=10485760, backupCount=5)
+    json_handler.setLevel(logging.INFO)
+    json_handler.setFormatter(JsonLinesFormatter())
+    log_handlers.append(json_handler)
+
+# Los hilos de las peticiones solo encolan; un hilo aparte escribe en los handlers
+log_listener = start_queue_logging(logger, log_handlers)
+
+log_reader = LogReader(log_file, file_handler.backupCount)
 
 # Log de inicio de la aplicación
 logger.info("====== SciELO XML Validator Server Started ======")
@@ -219,14 +129,384 @@ logger.info("Configuracion ASCII para Python 2.7 establecida")
 
 app = Flask(__name__)
 
+@app.teardown_request
+def clear_request_log_context(error=None):
+    # Los hilos del servidor pueden atender otras peticiones después
+    clear_log_context()
+
+@app.after_request
+def compress_response(response):
+    """
+    Comprime con gzip las respuestas grandes de texto y JSON si el cliente lo
+    acepta. No toca las respuestas en streaming (SSE, NDJSON), las parciales,
+    las que ya vienen comprimidas ni las que tienen ETag: esas ya se
+    compararon con If-None-Match, así que las comprime report_page_response
+    antes de hacerlo.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed or
+            'Content-Encoding' in response.headers or 'ETag' in response.headers or
+            response.mimetype not in GZIP_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES or not accepts_gzip():
+        return response
+    
+    response.set_data(compress_bytes(data, GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    # Los rangos de bytes se refieren al contenido sin comprimir
+    response.headers.pop('Accept-Ranges', None)
+    return response
+
 # Configuracion
 XML_PACKAGE_MAKER = r"C:\scielo\bin\xml\xml_package_maker.py"
 TEMP_DIR = r"C:\scielo\bin\web\temp"
 PYTHON_PATH = r"C:\Python27\python.exe"
 
+# Espera máxima (y frecuencia de sondeo) para que los reportes del validador
+# terminen de escribirse cuando no están listos al salir el proceso
+REPORT_WAIT_TIMEOUT = 2.0
+REPORT_POLL_INTERVAL = 0.1
+
+# Limpieza periódica de TEMP_DIR: cuota total, edad máxima de una sesión e
+# intervalo entre pasadas
+TEMP_MAX_BYTES = int(os.environ.get('SCIELO_TEMP_MAX_MB', '4096')) * 1024 * 1024
+TEMP_MAX_AGE = int(os.environ.get('SCIELO_TEMP_MAX_AGE_HOURS', '24')) * 3600
+JANITOR_INTERVAL = int(os.environ.get('SCIELO_JANITOR_INTERVAL', '600'))
+
+# Caché de resultados: tamaño máximo y días sin uso antes de expirar
+CACHE_DIR = r"C:\scielo\bin\web\cache"
+CACHE_MAX_BYTES = int(os.environ.get('SCIELO_CACHE_MAX_MB', '512')) * 1024 * 1024
+CACHE_MAX_AGE = int(os.environ.get('SCIELO_CACHE_MAX_AGE_DAYS', '7')) * 86400
+
+# Manifiestos de sesiones de carpeta para revalidar solo los artículos que
+# cambiaron, y días que se conservan
+MANIFEST_DIR = r"C:\scielo\bin\web\manifests"
+MANIFEST_MAX_AGE = int(os.environ.get('SCIELO_MANIFEST_MAX_AGE_DAYS', '30')) * 86400
+
+# Índice de los reportes generados (fuera de TEMP_DIR para que la limpieza
+# de temporales no lo borre)
+REPORT_INDEX_PATH = r"C:\scielo\bin\web\report_index.sqlite"
+
+# Páginas de reporte ya generadas que se conservan en memoria (total y
+# tamaño máximo de una página para guardarla)
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('SCIELO_RESPONSE_CACHE_MB', '64')) * 1024 * 1024
+RESPONSE_CACHE_MAX_ENTRY = 8 * 1024 * 1024
+
+# Procesos del validador que pueden ejecutarse a la vez y solicitudes que
+# pueden esperar turno antes de rechazar nuevas con 503
+VALIDATOR_SLOTS = int(os.environ.get('SCIELO_VALIDATOR_SLOTS', '2'))
+VALIDATOR_QUEUE_SIZE = int(os.environ.get('SCIELO_VALIDATOR_QUEUE', '8'))
+
+# Paquetes subidos como un único ZIP: entradas, tamaño descomprimido total y
+# tasa de compresión máxima de una entrada (protección contra zip bombs)
+PACKAGE_MAX_ENTRIES = int(os.environ.get('SCIELO_PACKAGE_MAX_ENTRIES', '5000'))
+PACKAGE_MAX_BYTES = int(os.environ.get('SCIELO_PACKAGE_MAX_MB', '2048')) * MB
+PACKAGE_MAX_RATIO = int(os.environ.get('SCIELO_PACKAGE_MAX_RATIO', '100'))
+
+# Lotes de /api/v1/batch: paquetes por petición y paquetes validándose a la
+# vez (los artículos de todos comparten los VALIDATOR_SLOTS)
+BATCH_MAX_PACKAGES = int(os.environ.get('SCIELO_BATCH_MAX_PACKAGES', '100'))
+BATCH_CONCURRENCY = int(os.environ.get('SCIELO_BATCH_CONCURRENCY', '2'))
+
+# Compresión gzip de las respuestas: tamaño mínimo, nivel y tipos de contenido
+GZIP_MIN_BYTES = int(os.environ.get('SCIELO_GZIP_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('SCIELO_GZIP_LEVEL', '6'))
+GZIP_MIMETYPES = frozenset(['application/json', 'text/plain', 'text/html', 'text/css', 'text/csv',
+                            'application/javascript'])
+
+# Páginas de /api/v1/reports: hallazgos por página y bytes de reporte por página
+FINDINGS_PAGE_DEFAULT = 100
+FINDINGS_PAGE_MAX = 1000
+REPORT_PAGE_DEFAULT = 256 * 1024
+REPORT_PAGE_MAX = 1024 * 1024
+
+# Duración máxima de una respuesta en streaming: cada una ocupa un hilo del
+# servidor mientras dura, así que se corta y el cliente continúa con otra
+# petición desde el último evento recibido
+STREAM_MAX_SECONDS = int(os.environ.get('SCIELO_STREAM_MAX_SECONDS', '25'))
+
+# Workers persistentes del validador (desactivados por defecto): cada uno se
+# recicla tras WORKER_MAX_JOBS trabajos o si su memoria supera WORKER_MAX_RSS
+WARM_WORKERS = os.environ.get('SCIELO_WARM_WORKERS', '0') == '1'
+WORKER_MAX_JOBS = int(os.environ.get('SCIELO_WORKER_MAX_JOBS', '50'))
+WORKER_MAX_RSS = int(os.environ.get('SCIELO_WORKER_MAX_RSS_MB', '1024')) * 1024 * 1024
+
 if not os.path.exists(TEMP_DIR):
     os.makedirs(TEMP_DIR)
 
+validator_pool = ValidatorPool(VALIDATOR_SLOTS, VALIDATOR_QUEUE_SIZE)
+result_cache = ResultCache(CACHE_DIR, XML_PACKAGE_MAKER, CACHE_MAX_BYTES, CACHE_MAX_AGE)
+manifest_store = ManifestStore(MANIFEST_DIR, MANIFEST_MAX_AGE)
+report_index = ReportIndex(REPORT_INDEX_PATH)
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRY)
+# Límites de cada ejecución del validador, escalados por tamaño del paquete
+# (variables SCIELO_LIMIT_*, ver LimitPolicy.from_env): tiempo real = base +
+# por MB (hasta el máximo), CPU = tiempo real * factor, memoria = base + por
+# MB (hasta el máximo). Un trabajo de carpeta además no puede superar base +
+# por MB + SCIELO_LIMIT_JOB_PER_ARTICLE por cada ronda de artículos
+# (VALIDATOR_SLOTS artículos a la vez).
+limit_policy = LimitPolicy.from_env()
+janitor = Janitor(TEMP_DIR, TEMP_MAX_BYTES, TEMP_MAX_AGE, JANITOR_INTERVAL, on_evict=report_index.forget)
+janitor.add_task(result_cache.evict)
+janitor.add_task(manifest_store.evict)
+# Las sesiones borradas fuera de la limpieza (a mano, TEMP_DIR vaciado)
+# no pasan por on_evict: sus filas se descartan al vencer igual que ellas
+janitor.add_task(lambda: report_index.forget_older_than(TEMP_MAX_AGE))
+warm_pool = None
+if WARM_WORKERS:
+    warm_pool = WarmWorkerPool(PYTHON_PATH, XML_PACKAGE_MAKER, os.path.join(log_dir, 'validator_workers.log'),
+                               VALIDATOR_SLOTS, WORKER_MAX_JOBS, WORKER_MAX_RSS)
+    atexit.register(warm_pool.shutdown)
+
+# Métricas de /metrics (formato de texto de Prometheus)
+metrics = Registry()
+stage_seconds = metrics.histogram(
+    'scielo_stage_seconds', 'Duration of each stage of a request', ('endpoint', 'stage'))
+upload_bytes = metrics.histogram(
+    'scielo_upload_bytes', 'Bytes uploaded per session', ('endpoint',), SIZE_BUCKETS)
+session_files = metrics.histogram(
+    'scielo_session_files', 'Files uploaded per session', ('endpoint',), COUNT_BUCKETS)
+validator_seconds = metrics.histogram(
+    'scielo_validator_seconds', 'Wall time of each xml_package_maker run', ('mode',))
+validator_cpu_seconds = metrics.histogram(
+    'scielo_validator_cpu_seconds', 'CPU time of each xml_package_maker run', ('mode',))
+validator_timeouts = metrics.counter(
+    'scielo_validator_timeouts_total', 'xml_package_maker runs killed for exceeding a limit', ('mode', 'limit'))
+font_terms_rewritten = metrics.counter(
+    'scielo_font_terms_rewritten_total', 'Font style terms rewritten in uploaded files')
+font_family_workarounds = metrics.counter(
+    'scielo_font_family_workarounds_total', 'Validator outputs whose font-family errors were treated as warnings')
+result_cache_lookups = metrics.counter(
+    'scielo_result_cache_lookups_total', 'Result cache lookups per upload', ('endpoint', 'result'))
+folder_articles = metrics.counter(
+    'scielo_folder_articles_total', 'Folder articles validated or reused from a previous session', ('origin',))
+batch_packages = metrics.counter(
+    'scielo_batch_packages_total', 'Packages processed by /api/v1/batch', ('result',))
+metrics.callback(
+    'scielo_response_cache_lookups_total', 'Report page cache lookups', 'counter',
+    lambda: {('hit',): response_cache.stats()['hits'], ('miss',): response_cache.stats()['misses']},
+    ('result',))
+metrics.callback(
+    'scielo_validator_slots_busy', 'Validator slots in use', 'gauge',
+    lambda: validator_pool.status()['busy'])
+metrics.callback(
+    'scielo_janitor_reclaimed_bytes_total', 'Bytes removed from TEMP_DIR by the janitor', 'counter',
+    lambda: janitor.status()['reclaimed_bytes'])
+metrics.callback(
+    'scielo_temp_dir_bytes', 'Bytes in TEMP_DIR at the last janitor sweep', 'gauge',
+    lambda: (janitor.status()['last_sweep'] or {}).get('total_bytes'))
+metrics.callback(
+    'scielo_validator_waiting', 'Requests waiting for a validator slot', 'gauge',
+    lambda: validator_pool.status()['waiting'])
+
+def run_validator(target, limits=None, on_progress=None, on_output=None, usage=None):
+    """
+    Ejecuta xml_package_maker sobre `target` (un archivo o una carpeta) con
+    los límites de recursos `limits` (ver LimitPolicy) y devuelve
+    (exit_code, stdout, stderr, limit_exceeded). Usa un worker caliente si
+    están activados y, si el worker no está disponible, lanza un proceso
+    nuevo. El uso de recursos consumido y el límite superado se informan en
+    `usage`. Debe llamarse dentro de validator_pool.slot().
+    """
+    if usage is None:
+        usage = {}
+    start_time = time.time()
+    result = None
+    if warm_pool is not None:
+        mode = 'warm'
+        try:
+            result = warm_pool.run([target], limits, on_progress, usage, on_output)
+        except WorkerUnavailable as e:
+            logger.warning("Warm worker unavailable, using a new process: {}".format(e))
+            start_time = time.time()
+    if result is None:
+        mode = 'subprocess'
+        result = subprocess_runner(PYTHON_PATH, XML_PACKAGE_MAKER)(target, limits, on_progress, on_output, usage)
+    
+    usage['mode'] = mode
+    validator_seconds.observe(time.time() - start_time, mode=mode)
+    if usage.get('cpu') is not None:
+        validator_cpu_seconds.observe(usage['cpu'], mode=mode)
+    if result[3]:
+        validator_timeouts.inc(mode=mode, limit=usage.get('limit') or WALL)
+        logger.warning("Validator stopped after exceeding the {} limit: {} (limits: {})".format(
+            usage.get('limit') or WALL, target, limits))
+    return result
+
+def save_findings(session_id, found):
+    """Guarda los hallazgos de la sesión como JSON compacto junto a su reporte"""
+    path = os.path.join(TEMP_DIR, session_id + findings.FINDINGS_SUFFIX + GZIP_SUFFIX)
+    try:
+        return store_bytes(path, findings.dumps(found))
+    except Exception as e:
+        logger.error("Error saving findings for {}: {}".format(session_id, str(e)))
+        return None
+
+def report_urls(report_id):
+    """Enlaces al reporte y a los hallazgos de una sesión (la respuesta no los incluye)"""
+    return {
+        'report_url': '/api/v1/reports/{}/report'.format(report_id),
+        'findings_url': '/api/v1/reports/{}/findings'.format(report_id)
+    }
+
+def publish_cached_result(session_id, cached):
+    """
+    Publica un resultado de la caché como reporte de la sesión actual y
+    devuelve el diccionario de respuesta.
+    """
+    report = "NOTA: Resultado reutilizado de una validacion previa identica (sesion {}).\n\n{}".format(
+        to_ascii(cached.get('session_id')), to_ascii(cached['report']))
+    
+    txt_path = store_bytes(os.path.join(TEMP_DIR, session_id + '.txt' + GZIP_SUFFIX), report)
+    html_path = None
+    if cached.get('html_path'):
+        html_path = store_file(cached['html_path'],
+                               os.path.join(TEMP_DIR, session_id + '.html' + GZIP_SUFFIX))
+    found = cached.get('findings', [])
+    save_findings(session_id, found)
+    report_index.record(session_id, html_path=html_path, txt_path=txt_path,
+                        status='cached', success=cached['success'])
+    
+    return dict(report_urls(session_id), **{
+        'success': cached['success'],
+        'report_id': session_id,
+        'counts': findings.counts(found),
+        'cached': True
+    })
+
+def pool_full_response(error):
+    """Respuesta rápida 503 cuando la cola del validador está llena"""
+    logger.warning("Validator queue full, request from {} rejected".format(request.remote_addr))
+    response = json_response({
+        'error': 'El servidor esta ocupado. Intente de nuevo en {} segundos.'.format(error.retry_after),
+        'retry_after': error.retry_after
+    }, 503)
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+# Registro en memoria de los trabajos de validación asíncronos.
+# Estados posibles: queued, running, done, failed
+JOB_RETENTION_SECONDS = 6 * 3600
+jobs = {}
+jobs_lock = threading.Lock()
+# Lotes de /api/v1/batch: los registros de sus paquetes, como eventos
+batches = {}
+
+def create_job(session_id, pooled=True):
+    """
+    Registra un trabajo nuevo en estado 'queued' y devuelve su ID. Con
+    pooled=False el trabajo no tiene un lugar propio en validator_pool (el
+    lugar es de su lote).
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with jobs_lock:
+        _prune_jobs(now)
+        jobs[job_id] = {
+            'job_id': job_id,
+            'session_id': session_id,
+            'pooled': pooled,
+            'state': 'queued',
+            'stage': 'En cola',
+            'progress': 0,
+            'created': now,
+            'started': None,
+            'finished': None,
+            'result': None,
+            'error': None,
+            'events': EventLog()
+        }
+    return job_id
+
+def update_job(job_id, **fields):
+    """Actualiza el trabajo y publica su estado si cambió la etapa o el progreso"""
+    summary = None
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+            if 'stage' in fields or 'progress' in fields or 'state' in fields:
+                summary = job_summary(job)
+                events = job['events']
+    if summary is not None:
+        events.publish('progress', summary)
+
+def publish_job_event(job_id, event, data):
+    with jobs_lock:
+        job = jobs.get(job_id)
+    if job is not None:
+        job['events'].publish(event, data)
+
+def get_job(job_id):
+    """Devuelve una copia del trabajo, o None si no existe"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+def _prune_jobs(now):
+    # Debe llamarse con jobs_lock adquirido
+    expired = [job_id for job_id, job in jobs.items()
+               if job['finished'] and now - job['finished'] > JOB_RETENTION_SECONDS]
+    for job_id in expired:
+        del jobs[job_id]
+
+def job_summary(job):
+    """Vista pública del estado de un trabajo (sin el reporte completo)"""
+    summary = {
+        'job_id': job['job_id'],
+        'state': job['state'],
+        'stage': job['stage'],
+        'progress': job['progress']
+    }
+    if job['started']:
+        summary['elapsed'] = round((job['finished'] or time.time()) - job['started'], 1)
+    if job['state'] == 'done':
+        summary['success'] = job['result'].get('success')
+        summary['report_id'] = job['result'].get('report_id')
+    elif job['state'] == 'failed':
+        summary['error'] = job['error']
+    return summary
+
+def run_job(job_id, target, *args):
+    """
+    Ejecuta target(job_id, *args) registrando el estado del trabajo.
+    El trabajo debe haber sido admitido en validator_pool (salvo los de un
+    lote); su lugar se libera al terminar.
+    """
+    started = time.time()
+    set_log_context(session_id=get_job(job_id)['session_id'], job_id=job_id, stage='job')
+    update_job(job_id, state='running', stage='Iniciando', progress=1, started=started)
+    try:
+        result = target(job_id, *args)
+    except Exception as e:
+        logger.error("Trabajo {} fallido: {}".format(job_id, to_ascii(str(e))))
+        logger.error(traceback.format_exc())
+        result = {'error': to_ascii(str(e))}
+    finally:
+        job = get_job(job_id)
+        if job['pooled']:
+            validator_pool.release()
+        janitor.release(job['session_id'])
+    
+    finished = time.time()
+    if 'error' in result:
+        update_job(job_id, state='failed', stage='Error', error=result['error'], finished=finished)
+    else:
+        update_job(job_id, state='done', stage='Completado', progress=100, result=result,
+                   finished=finished)
+    get_job(job_id)['events'].close()
+    logger.info("Trabajo {} terminado ({})".format(job_id, 'error' if 'error' in result else 'ok'),
+                extra={'stage': 'job', 'duration': finished - started})
+    clear_log_context()
+
+def start_job(job_id, target, *args):
+    """Lanza el trabajo en un hilo en segundo plano"""
+    thread = threading.Thread(target=run_job, args=(job_id, target) + args,
+                              name='job-{}'.format(job_id[:8]))
+    thread.daemon = True
+    thread.start()
+
 # Template HTML con caracteres estrictamente ASCII
 HTML = """
 <!DOCTYPE html>
@@ -260,6 +540,9 @@ HTML = """
         .tab-content { display: none; }
         .tab-content.active { display: block; }
         .files-info { margin-top: 10px; font-size: 0.9em; color: #666; }
+        #live { display: none; text-align: left; }
+        #live-articles { font-size: 0.9em; }
+        #live-output { max-height: 200px; overflow: auto; font-size: 0.8em; }
     </style>
 </head>
 <body>
@@ -269,6 +552,7 @@ HTML = """
         <div class="tab-buttons">
             <div class="tab-button active" data-tab="file-tab">Archivo XML</div>
             <div class="tab-button" data-tab="folder-tab">Carpeta</div>
+            <div class="tab-button" data-tab="package-tab">Paquete ZIP</div>
         </div>
         
         <div id="file-tab" class="tab-content active">
@@ -292,9 +576,23 @@ HTML = """
             </form>
         </div>
         
+        <div id="package-tab" class="tab-content">
+            <form id="upload-package-form" enctype="multipart/form-data">
+                <div class="form-group">
+                    <label for="package">Seleccionar paquete ZIP:</label>
+                    <input type="file" id="package" name="package" accept=".zip" required>
+                </div>
+                <button type="submit" class="btn">Validar paquete</button>
+            </form>
+        </div>
+        
         <div id="loading" class="loading">
             <div class="spinner"></div>
-            <p>Procesando, por favor espere...</p>
+            <p id="loading-text">Procesando, por favor espere...</p>
+            <div id="live">
+                <ul id="live-articles"></ul>
+                <pre id="live-output"></pre>
+            </div>
         </div>
         
         <div id="results" class="results" style="display:none;">
@@ -303,6 +601,7 @@ HTML = """
             <div id="report-container">
                 <h3>Reporte:</h3>
                 <pre id="report"></pre>
+                <button id="report-more-btn" class="btn" style="display:none;">Cargar mas del reporte</button>
             </div>
             <div id="button-container" class="button-container" style="display:none;">
                 <button id="download-btn" class="btn download-btn">Descargar reporte</button>
@@ -351,21 +650,31 @@ HTML = """
             // Anadir bandera para indicar que es una carpeta
             formData.append('is_folder', 'true');
             
+            // Sesion de carpeta anterior, para revalidar solo lo que cambio
+            formData.set('previous_session', localStorage.getItem('lastFolderSession') || '');
+            
             sendValidationRequest('/validate_folder', formData);
         });
         
+        // Envio de un paquete completo en un solo ZIP
+        document.getElementById('upload-package-form').addEventListener('submit', function(e) {
+            e.preventDefault();
+            
+            var formData = new FormData(this);
+            formData.set('previous_session', localStorage.getItem('lastFolderSession') || '');
+            
+            sendValidationRequest('/validate_package', formData);
+        });
+        
         // Funcion general para enviar solicitud de validacion
         function sendValidationRequest(url, formData) {
             var resultsDiv = document.getElementById('results');
             var loadingDiv = document.getElementById('loading');
-            var statusDiv = document.getElementById('status');
-            var reportDiv = document.getElementById('report');
-            var buttonContainer = document.getElementById('button-container');
-            var downloadBtn = document.getElementById('download-btn');
-            var openHtmlBtn = document.getElementById('open-html-btn');
             
             resultsDiv.style.display = 'none';
             loadingDiv.style.display = 'block';
+            document.getElementById('loading-text').textContent = 'Procesando, por favor espere...';
+            document.getElementById('live').style.display = 'none';
             
             fetch(url, {
                 method: 'POST',
@@ -373,48 +682,221 @@ HTML = """
             })
             .then(response => response.json())
             .then(data => {
-                loadingDiv.style.display = 'none';
-                resultsDiv.style.display = 'block';
-                
-                if (data.error) {
-                    statusDiv.innerHTML = '<div class="error">Error: ' + data.error + '</div>';
-                    reportDiv.textContent = '';
-                    buttonContainer.style.display = 'none';
+                // Las validaciones de carpeta devuelven un trabajo que se sigue en vivo
+                if (data.job_id) {
+                    watchJob(data.job_id);
                 } else {
-                    if (data.success) {
-                        statusDiv.innerHTML = '<div class="success">XML valido!</div>';
-                    } else {
-                        statusDiv.innerHTML = '<div class="error">XML invalido. Ver reporte para detalles.</div>';
-                    }
-                    
-                    reportDiv.textContent = data.report;
-                    
-                    if (data.report_id) {
-                        buttonContainer.style.display = 'flex';
-                        downloadBtn.onclick = function() {
-                            window.location.href = '/download_report/' + data.report_id;
-                        };
-                        
-                        // Configurar el enlace para abrir el HTML
-                        openHtmlBtn.href = '/open_html_report/' + data.report_id;
-                    } else {
-                        buttonContainer.style.display = 'none';
-                    }
+                    showResult(data);
+                }
+            })
+            .catch(showRequestError);
+        }
+        
+        // Seguir el progreso del trabajo en vivo (Server-Sent Events); sin
+        // soporte en el navegador, consultar su estado periodicamente
+        function watchJob(jobId) {
+            if (!window.EventSource) {
+                pollJob(jobId);
+                return;
+            }
+            var source = new EventSource('/job_events/' + jobId);
+            var articleItems = {};
+            var articleList = document.getElementById('live-articles');
+            var output = document.getElementById('live-output');
+            articleList.innerHTML = '';
+            output.textContent = '';
+            document.getElementById('live').style.display = 'block';
+            
+            source.addEventListener('progress', function(e) {
+                var job = JSON.parse(e.data);
+                document.getElementById('loading-text').textContent =
+                    (job.stage || 'Procesando') + ' (' + (job.progress || 0) + '%)...';
+            });
+            source.addEventListener('article', function(e) {
+                var article = JSON.parse(e.data);
+                var item = articleItems[article.name];
+                if (!item) {
+                    item = articleItems[article.name] = document.createElement('li');
+                    articleList.appendChild(item);
+                }
+                item.textContent = article.name + ': ' + article.status +
+                    (article.reused ? ' (sin cambios)' : '') +
+                    (article.duration !== undefined ? ' - ' + article.duration + ' s' : '');
+            });
+            source.addEventListener('output', function(e) {
+                var line = JSON.parse(e.data);
+                // Conservar solo el final de la salida
+                output.textContent = (output.textContent + '[' + line.article + '] ' + line.line + '\n').slice(-20000);
+                output.scrollTop = output.scrollHeight;
+            });
+            source.addEventListener('end', function() {
+                source.close();
+                fetch('/job_result/' + jobId)
+                    .then(response => response.json())
+                    .then(showResult)
+                    .catch(showRequestError);
+            });
+            source.onerror = function() {
+                // El navegador reintenta solo; si cerro la conexion, seguir por consultas
+                if (source.readyState === EventSource.CLOSED) {
+                    pollJob(jobId);
+                }
+            };
+        }
+        
+        // Consultar el estado de un trabajo hasta que termine
+        function pollJob(jobId) {
+            fetch('/job_status/' + jobId)
+            .then(response => response.json())
+            .then(job => {
+                if (job.state === 'done' || job.state === 'failed') {
+                    return fetch('/job_result/' + jobId)
+                        .then(response => response.json())
+                        .then(showResult);
                 }
+                
+                document.getElementById('loading-text').textContent =
+                    (job.stage || 'Procesando') + ' (' + (job.progress || 0) + '%)...';
+                setTimeout(function() { pollJob(jobId); }, 1000);
             })
-            .catch(error => {
-                loadingDiv.style.display = 'none';
-                resultsDiv.style.display = 'block';
-                statusDiv.innerHTML = '<div class="error">Error en la solicitud: ' + error + '</div>';
+            .catch(showRequestError);
+        }
+        
+        // Mostrar el resultado final de una validacion
+        function showResult(data) {
+            var resultsDiv = document.getElementById('results');
+            var loadingDiv = document.getElementById('loading');
+            var statusDiv = document.getElementById('status');
+            var reportDiv = document.getElementById('report');
+            var buttonContainer = document.getElementById('button-container');
+            var downloadBtn = document.getElementById('download-btn');
+            var openHtmlBtn = document.getElementById('open-html-btn');
+            
+            loadingDiv.style.display = 'none';
+            resultsDiv.style.display = 'block';
+            
+            if (data.error) {
+                statusDiv.innerHTML = '<div class="error">Error: ' + data.error + '</div>';
                 reportDiv.textContent = '';
+                document.getElementById('report-more-btn').style.display = 'none';
                 buttonContainer.style.display = 'none';
+            } else {
+                if (data.timed_out) {
+                    statusDiv.innerHTML = '<div class="error">Validacion detenida: se supero un limite de recursos. Ver reporte para detalles.</div>';
+                } else if (data.success) {
+                    statusDiv.innerHTML = '<div class="success">XML valido!</div>';
+                } else {
+                    statusDiv.innerHTML = '<div class="error">XML invalido. Ver reporte para detalles.</div>';
+                }
+                
+                if (data.counts) {
+                    statusDiv.innerHTML += '<div>Errores: ' + (data.counts.fatal + data.counts.error) +
+                        ', avisos: ' + data.counts.warning + '</div>';
+                }
+                
+                // El reporte no viene en la respuesta: se pide por tramos
+                reportDiv.textContent = '';
+                if (data.report_url) {
+                    loadReportPage(data.report_url, 0);
+                }
+                
+                if (data.articles && data.report_id) {
+                    localStorage.setItem('lastFolderSession', data.report_id);
+                }
+                
+                if (data.report_id) {
+                    buttonContainer.style.display = 'flex';
+                    downloadBtn.onclick = function() {
+                        window.location.href = '/download_report/' + data.report_id;
+                    };
+                    
+                    // Configurar el enlace para abrir el HTML
+                    openHtmlBtn.href = '/open_html_report/' + data.report_id;
+                } else {
+                    buttonContainer.style.display = 'none';
+                }
+            }
+        }
+        
+        // Agregar un tramo del reporte y ofrecer el siguiente si falta texto
+        function loadReportPage(url, offset) {
+            var reportDiv = document.getElementById('report');
+            var moreBtn = document.getElementById('report-more-btn');
+            moreBtn.style.display = 'none';
+            fetch(url + '?offset=' + offset)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                var next = parseInt(response.headers.get('X-Report-Next-Offset'), 10);
+                var size = parseInt(response.headers.get('X-Report-Size'), 10);
+                return response.text().then(text => {
+                    reportDiv.textContent += text;
+                    if (next < size) {
+                        moreBtn.style.display = 'block';
+                        moreBtn.onclick = function() { loadReportPage(url, next); };
+                    }
+                });
+            })
+            .catch(function(error) {
+                reportDiv.textContent += '\n[No se pudo cargar el reporte: ' + error + ']';
             });
         }
+        
+        function showRequestError(error) {
+            document.getElementById('loading').style.display = 'none';
+            document.getElementById('results').style.display = 'block';
+            document.getElementById('status').innerHTML = '<div class="error">Error en la solicitud: ' + error + '</div>';
+            document.getElementById('report').textContent = '';
+            document.getElementById('report-more-btn').style.display = 'none';
+            document.getElementById('button-container').style.display = 'none';
+        }
     </script>
 </body>
 </html>
 """
 
+def scan_report_files(search_dir):
+    """Devuelve {ruta: tamaño} de los reportes .html y .report.txt bajo search_dir"""
+    reports = {}
+    for root, dirs, files in os.walk(search_dir):
+        for file_name in files:
+            if file_name.endswith('.html') or file_name.endswith('.report.txt'):
+                path = os.path.join(root, file_name)
+                try:
+                    reports[path] = os.path.getsize(path)
+                except OSError:
+                    pass
+    return reports
+
+def wait_for_reports(search_dir, process_exited, timeout=None):
+    """
+    Devuelve las rutas de los reportes generados en search_dir, ordenadas.
+    
+    Si el proceso ya terminó y dejó reportes no vacíos, éstos están completos
+    y se devuelven sin esperar. En caso contrario se vuelve a recorrer el
+    directorio cada REPORT_POLL_INTERVAL segundos hasta que los tamaños dejen
+    de cambiar, como máximo `timeout` segundos. Si el proceso ya terminó,
+    dos recorridos iguales bastan aunque no haya ningún reporte (el
+    validador falló antes de escribirlos).
+    """
+    if timeout is None:
+        timeout = REPORT_WAIT_TIMEOUT
+    deadline = time.time() + timeout
+    
+    reports = scan_report_files(search_dir)
+    while time.time() < deadline:
+        if reports and process_exited and all(reports.values()):
+            break
+        time.sleep(REPORT_POLL_INTERVAL)
+        current = scan_report_files(search_dir)
+        if current == reports and (process_exited or current) and all(current.values()):
+            # Tamaños estables entre dos recorridos
+            break
+        reports = current
+    
+    return sorted(reports)
+
 @app.route('/')
 def index():
     logger.info("Home page requested from {}".format(request.remote_addr))
@@ -424,12 +906,12 @@ def index():
 def validate_xml():
     if 'xml_file' not in request.files:
         logger.warning("Validation attempt with no file")
-        return jsonify({'error': 'No file found'})
+        return json_response({'error': 'No file found'})
     
     file = request.files['xml_file']
     if file.filename == '':
         logger.warning("Validation attempt with empty filename")
-        return jsonify({'error': 'No file selected'})
+        return json_response({'error': 'No file selected'})
     
     client_ip = request.remote_addr
     logger.info("Validation request from {} for file: {}".format(client_ip, file.filename))
@@ -441,30 +923,64 @@ def validate_xml():
     session_id = "{}-{}".format(base_filename, timestamp)
     # Eliminar caracteres no permitidos en nombres de carpetas
     session_id = "".join(c for c in session_id if c.isalnum() or c in '-_')
+    set_log_context(session_id=session_id, stage='ingest')
+    
+    # Reservar lugar en la cola del validador o rechazar de inmediato
+    try:
+        validator_pool.admit()
+    except PoolFull as e:
+        return pool_full_response(e)
     
+    # La sesión no se limpia mientras se valida
+    janitor.hold(session_id)
     session_dir = os.path.join(TEMP_DIR, session_id)
-    os.makedirs(session_dir)
     
     try:
-        xml_path = os.path.join(session_dir, file.filename)
-        file.save(xml_path)
-        logger.info("File saved: {}".format(xml_path))
+        os.makedirs(session_dir)
+        xml_path = os.path.join(session_dir, sanitize_upload_name(file.filename))
+        with stage_seconds.time(endpoint='validate_xml', stage='ingest'):
+            info = ingest_file(file.stream, xml_path, rewrite=False)
+        upload_bytes.observe(info['size'], endpoint='validate_xml')
+        session_files.observe(1, endpoint='validate_xml')
+        logger.info("File saved: {} ({} bytes)".format(xml_path, info['size']))
+        
+        # Reutilizar el resultado si ya se validó exactamente el mismo archivo
+        with stage_seconds.time(endpoint='validate_xml', stage='cache_lookup'):
+            cache_key = result_cache.package_key([xml_path], hashes={xml_path: info['sha256']})
+            cached = result_cache.get(cache_key)
+        result_cache_lookups.inc(endpoint='validate_xml', result='miss' if cached is None else 'hit')
+        if cached is not None:
+            logger.info("Cache hit for {} ({})".format(file.filename, cache_key[:12]))
+            with stage_seconds.time(endpoint='validate_xml', stage='serialize'):
+                return json_response(publish_cached_result(session_id, cached))
         
         # Ejecutar el validador XPM
         cmd = [PYTHON_PATH, XML_PACKAGE_MAKER, xml_path]
         logger.info("Executing validation command: {}".format(' '.join(cmd)))
         
-        # Usar subprocess de manera compatible con Python 2.7
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()  
+        # Esperar un slot libre del validador antes de ejecutarlo
+        set_log_context(stage='validate')
+        wait_start = time.time()
+        with validator_pool.slot():
+            validate_start = time.time()
+            limits = limit_policy.for_package(info['size'])
+            usage = {}
+            exit_code, stdout, stderr, timed_out = run_validator(xml_path, limits, usage=usage)
+        validate_duration = time.time() - validate_start
+        stage_seconds.observe(validate_start - wait_start, endpoint='validate_xml', stage='queue_wait')
+        stage_seconds.observe(validate_duration, endpoint='validate_xml', stage='validator')
         
         # Usar nuestra función de conversión a ASCII
         if stdout:
             stdout = to_ascii(stdout)
         if stderr:
             stderr = to_ascii(stderr)
+        if timed_out:
+            stderr = limit_message(usage.get('limit'), limits) + ("\n\n" + stderr if stderr else "")
             
-        logger.info("Command exit code: {}".format(process.returncode))
+        logger.info("Command exit code: {} (usage: {})".format(exit_code, usage),
+                    extra={'duration': validate_duration})
+        set_log_context(stage='report')
         logger.info("Command stdout length: {}".format(len(stdout) if stdout else 0))
         if stderr:
             logger.error("Command stderr length: {}".format(len(stderr)))
@@ -473,36 +989,47 @@ def validate_xml():
         report_file = None
         report_id = None
         
-        # Esperar un momento para que se generen los archivos
-        time.sleep(2)
+        # Esperar solo lo necesario a que los reportes estén completos; los de
+        # una ejecución detenida por un límite están incompletos
+        search_start = time.time()
+        report_paths = wait_for_reports(session_dir, True) if not timed_out else []
         
         # Buscar archivos de reporte (tanto .html como .report.txt)
         html_report_found = False
-        for root, dirs, files in os.walk(session_dir):
-            logger.info("Checking directory: {} for report files".format(root))
-            for file_name in files:
-                logger.info("Found file: {}".format(file_name))
-                
-                # Buscar archivos HTML primero (como se muestra en tu captura)
-                if file_name.endswith('.html'):
-                    html_report_found = True
-                    report_file = os.path.join(root, file_name)
-                    logger.info("HTML Report found: {}".format(report_file))
-                
-                # Luego buscar los .report.txt por si acaso
-                elif file_name.endswith('.report.txt') and not html_report_found:
-                    report_file = os.path.join(root, file_name)
-                    try:
-                        # Leer de forma segura ignorando caracteres no-ASCII
-                        with open(report_file, 'rb') as f:
-                            content = f.read()
-                            report_content = to_ascii(content)
-                        
-                        report_id = session_id
-                        logger.info("TXT Report found: {}".format(report_file))
-                    except Exception as e:
-                        report_content = "Error reading TXT report: {}".format(str(e))
-                        logger.error("Error reading TXT report: {}".format(str(e)))
+        for path in report_paths:
+            file_name = os.path.basename(path)
+            
+            # Buscar archivos HTML primero (como se muestra en tu captura)
+            if file_name.endswith('.html'):
+                html_report_found = True
+                report_file = path
+                logger.info("HTML Report found: {}".format(report_file))
+            
+            # Luego buscar los .report.txt por si acaso
+            elif file_name.endswith('.report.txt') and not html_report_found:
+                report_file = path
+                try:
+                    # Leer de forma segura ignorando caracteres no-ASCII
+                    with open(report_file, 'rb') as f:
+                        content = f.read()
+                        report_content = to_ascii(content)
+                    
+                    report_id = session_id
+                    logger.info("TXT Report found: {}".format(report_file))
+                except Exception as e:
+                    report_content = "Error reading TXT report: {}".format(str(e))
+                    logger.error("Error reading TXT report: {}".format(str(e)))
+        
+        # Hallazgos de la salida y de los reportes, antes de comprimirlos
+        found = output_findings(exit_code, stdout, stderr, timed_out, report_paths,
+                                file_name=os.path.basename(xml_path))
+        if any(item['rule'] == findings.FONT_FAMILY_RULE for item in found):
+            font_family_workarounds.inc()
+        
+        # Guardar el HTML comprimido en su lugar
+        if html_report_found:
+            report_file = compress_in_place(report_file)
+        stage_seconds.observe(time.time() - search_start, endpoint='validate_xml', stage='report_search')
         
         # Si no se encontró ningún archivo de reporte, usar la salida del proceso
         if not report_id:
@@ -514,577 +1041,942 @@ def validate_xml():
             logger.info("Using process output as report")
         
         # Guardar la salida como reporte de texto
-        txt_save_path = os.path.join(TEMP_DIR, session_id + '.txt')
+        txt_save_path = os.path.join(TEMP_DIR, session_id + '.txt' + GZIP_SUFFIX)
         try:
             # Asegurarse de que solo hay caracteres ASCII
             safe_content = to_ascii(report_content)
-            with open(txt_save_path, 'w') as f:
-                f.write(safe_content)
+            with stage_seconds.time(endpoint='validate_xml', stage='report_save'):
+                store_bytes(txt_save_path, safe_content)
             logger.info("Report saved to: {}".format(txt_save_path))
         except Exception as e:
             logger.error("Error saving report: {}".format(str(e)))
+        save_findings(session_id, found)
         
         # Determinar si la validación fue exitosa
-        success = not stderr and process.returncode == 0 and "ERROR" not in report_content.upper()
+        success = not timed_out and not findings.has_errors(found)
         
         if success:
             logger.info("Validation successful for {}".format(file.filename))
         else:
             logger.warning("Validation failed for {}".format(file.filename))
         
-        return jsonify({
-            'success': success,
-            'report': report_content,
-            'report_id': report_id
-        })
+        report_index.record(session_id, html_path=report_file if html_report_found else None,
+                            txt_path=txt_save_path,
+                            status='timeout' if timed_out else 'valid' if success else 'invalid',
+                            success=success)
+        
+        # Un límite superado no es un resultado reproducible; no guardarlo
+        if not timed_out:
+            result_cache.put(cache_key, {
+                'success': success,
+                'report': report_content,
+                'findings': found,
+                'session_id': session_id
+            }, html_path=report_file if html_report_found else None)
+        
+        with stage_seconds.time(endpoint='validate_xml', stage='serialize'):
+            return json_response(dict(report_urls(report_id), **{
+                'success': success,
+                'report_id': report_id,
+                'counts': findings.counts(found),
+                'timed_out': timed_out,
+                'limit': usage.get('limit'),
+                'limits': limits,
+                'usage': usage
+            }))
     
     except Exception as e:
         logger.error("Error during validation: {}".format(str(e)))
-        return jsonify({'error': to_ascii(str(e))})
+        return json_response({'error': to_ascii(str(e))})
+    finally:
+        validator_pool.release()
+        janitor.release(session_id)
+
+def save_folder_files(session_dir, entries, endpoint):
+    """
+    Guarda y sanitiza los archivos de una carga de carpeta o de un ZIP (ver
+    pipeline.ingest_entries) y registra sus métricas. Devuelve (xml_files,
+    support_files, file_hashes).
+    """
+    ingest_start = time.time()
+    xml_files, support_files, file_hashes, stats = ingest_entries(session_dir, entries)
+    
+    # La reescritura de fuentes ocurre durante la ingesta; se informa aparte
+    stage_seconds.observe(time.time() - ingest_start, endpoint=endpoint, stage='ingest')
+    stage_seconds.observe(stats['rewrite_time'], endpoint=endpoint, stage='font_rewrite')
+    upload_bytes.observe(stats['bytes'], endpoint=endpoint)
+    session_files.observe(len(entries), endpoint=endpoint)
+    if stats['font_terms']:
+        font_terms_rewritten.inc(stats['font_terms'])
+    return xml_files, support_files, file_hashes
+
+def new_folder_session_id():
+    # El sufijo evita colisiones entre cargas simultáneas dentro del mismo segundo
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    session_id = "folder-{}-{}".format(timestamp, uuid.uuid4().hex[:6])
+    return "".join(c for c in session_id if c.isalnum() or c in '-_')
+
+def ingest_folder_session(session_id, entries, endpoint):
+    """
+    Crea el directorio de la sesión y guarda en él los archivos de la carga.
+    Devuelve (session_dir, xml_files, support_files, file_hashes).
+    """
+    session_dir = os.path.join(TEMP_DIR, session_id)
+    if not os.path.exists(session_dir):
+        os.makedirs(session_dir)
+    
+    # Guardar y sanitizar cada archivo en una sola pasada por bloques;
+    # la validación se hace en segundo plano para no retener la petición
+    xml_files, support_files, file_hashes = save_folder_files(session_dir, entries, endpoint)
+    return session_dir, xml_files, support_files, file_hashes
+
+def queue_folder_upload(entries, endpoint):
+    """
+    Crea la sesión de una carga de carpeta (o de un ZIP), guarda sus archivos
+    y lanza el trabajo de validación en segundo plano. Devuelve la respuesta.
+    """
+    session_id = new_folder_session_id()
+    set_log_context(session_id=session_id, stage='ingest')
+    
+    # Reservar lugar en la cola del validador o rechazar de inmediato
+    try:
+        validator_pool.admit()
+    except PoolFull as e:
+        return pool_full_response(e)
+    
+    # La sesión no se limpia mientras se guarda y valida
+    janitor.hold(session_id)
+    job_started = False
+    try:
+        session_dir, xml_files, support_files, file_hashes = ingest_folder_session(
+            session_id, entries, endpoint)
+        
+        if not xml_files:
+            logger.warning("No se encontraron archivos XML en la carpeta")
+            return json_response({'error': 'No se encontraron archivos XML en la carpeta subida'})
+        
+        job_id = create_job(session_id)
+        start_job(job_id, process_folder_job, session_id, session_dir,
+                  xml_files, support_files, file_hashes, request.values.get('previous_session'))
+        job_started = True
+        logger.info("Trabajo {} en cola para la sesion {}".format(job_id, session_id))
+        
+        with stage_seconds.time(endpoint=endpoint, stage='serialize'):
+            return json_response({
+                'job_id': job_id,
+                'state': 'queued',
+                'status_url': '/job_status/' + job_id,
+                'result_url': '/job_result/' + job_id
+            }, 202)
+    
+    except ArchiveError as e:
+        # Una entrada del ZIP resultó corrupta o más grande de lo declarado
+        logger.warning("Paquete ZIP rechazado durante la ingesta: {}".format(to_ascii(str(e))))
+        return json_response({'error': to_ascii(str(e))}, e.status)
+    except Exception as e:
+        # Capturar traza de error completa
+        error_trace = traceback.format_exc()
+        error_msg = to_ascii(str(e))
+        logger.error("ERROR GENERAL EN {}: {}".format(endpoint.upper(), error_msg))
+        logger.error(error_trace)
+        
+        # Garantizar respuesta JSON
+        return json_response({'error': error_msg})
+    finally:
+        # Si el trabajo se lanzó, él mismo libera su lugar al terminar
+        if not job_started:
+            validator_pool.release()
+            janitor.release(session_id)
 
 @app.route('/validate_folder', methods=['POST'])
 def validate_folder():
     if 'folder_files[]' not in request.files:
         logger.warning("Folder validation attempt with no files")
         # Devolver explícitamente como JSON
-        return jsonify({'error': 'No se encontraron archivos'})
+        return json_response({'error': 'No se encontraron archivos'})
     
     files = request.files.getlist('folder_files[]')
     if not files or len(files) == 0:
         logger.warning("Folder validation attempt with empty file list")
         # Devolver explícitamente como JSON
-        return jsonify({'error': 'No se seleccionaron archivos'})
+        return json_response({'error': 'No se seleccionaron archivos'})
     
     client_ip = request.remote_addr
     logger.info("Folder validation request from {} with {} files".format(client_ip, len(files)))
     
-    # Crear un ID único para la sesión
-    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    session_id = "folder-{}".format(timestamp)
-    session_id = "".join(c for c in session_id if c.isalnum() or c in '-_')
+    entries = [(file.filename, lambda file=file: file.stream) for file in files if file.filename]
+    return queue_folder_upload(entries, 'validate_folder')
+
+@app.route('/validate_package', methods=['POST'])
+def validate_package():
+    """
+    Valida un paquete completo subido como un único ZIP: en el campo
+    'package' de un formulario o como cuerpo de la petición
+    (Content-Type: application/zip). Cada entrada se lee directamente del ZIP
+    y pasa por la misma ingesta y el mismo trabajo que /validate_folder.
+    """
+    upload = request.files.get('package')
+    if upload is None and request.mimetype not in ZIP_MIMETYPES:
+        logger.warning("Package validation attempt with no ZIP file")
+        return json_response({'error': 'No se encontro el archivo ZIP del paquete'}, 400)
     
-    # Crear directorio para la sesión
-    session_dir = os.path.join(TEMP_DIR, session_id)
-    if not os.path.exists(session_dir):
-        os.makedirs(session_dir)
+    client_ip = request.remote_addr
+    try:
+        if upload is not None:
+            # Werkzeug ya guardó la parte en un archivo temporal
+            archive_file = upload.stream
+        else:
+            archive_file = spool_stream(request.stream, PACKAGE_MAX_BYTES, TEMP_DIR)
+        archive = PackageArchive(archive_file, PACKAGE_MAX_ENTRIES, PACKAGE_MAX_BYTES, PACKAGE_MAX_RATIO)
+    except ArchiveError as e:
+        logger.warning("Paquete ZIP rechazado de {}: {}".format(client_ip, to_ascii(str(e))))
+        return json_response({'error': to_ascii(str(e))}, e.status)
     
+    with archive:
+        logger.info("Package validation request from {} with {} files ({} bytes uncompressed)".format(
+            client_ip, len(archive.entries), archive.declared_bytes))
+        if not archive.entries:
+            return json_response({'error': 'El archivo ZIP no contiene archivos'}, 400)
+        entries = [(info.filename, lambda info=info: archive.open(info)) for info in archive.entries]
+        return queue_folder_upload(entries, 'validate_package')
+
+def prepare_batch_package(package, entries, previous_session=None):
+    """
+    Guarda los archivos de un paquete del lote en una sesión nueva y
+    registra su trabajo. Si no se puede, deja el motivo en package['error'].
+    """
+    session_id = new_folder_session_id()
+    janitor.hold(session_id)
     try:
-        # Usar estructura plana y nombres sencillos
-        xml_files = []
-        support_files = []
-        
-        # LOG ADICIONAL: Registrar el inicio del procesamiento de archivos
-        logger.info("INICIO DE PROCESAMIENTO DE ARCHIVOS - Sesión: {}".format(session_id))
-        
-        # Procesar y guardar los archivos
-        for file in files:
-            if not file.filename:
-                continue
-            
-            # Generar nombre seguro
-            basename = os.path.basename(file.filename)
-            name, ext = os.path.splitext(basename)
-            ext = ext.lower()
-            
-            # Crear nombre simple alfanumérico
-            safe_name = ''.join(c for c in name if c.isalnum())[:20] + ext
-            if not safe_name or safe_name == ext:
-                safe_name = "file{}_{}".format(len(xml_files) + len(support_files), ext)
-            
-            file_path = os.path.join(session_dir, safe_name)
-            file.save(file_path)
-            
-            # LOG ADICIONAL: Registrar el guardado de cada archivo
-            logger.info("Archivo guardado: {} (original: {})".format(safe_name, basename))
-            
-            # Procesar cualquier archivo de texto para eliminar font-family (XML, HTML, CSS, etc.)
-            if ext in ['.xml', '.html', '.htm', '.css', '.xsl', '.xslt', '.svg', '.txt']:
-                try:
-                    # Leer el contenido
-                    with open(file_path, 'rb') as f:
-                        content = f.read()
-                    
-                    # Intentar decodificar con diferentes codificaciones
-                    encoding_used = None
-                    text_content = None
-                    
-                    # LOG ADICIONAL: Registrar tamaño del archivo y si contiene 'font-family'
-                    logger.info("Analizando archivo {} ({} bytes)".format(safe_name, len(content)))
-                    if b'font-family' in content:
-                        logger.warning("ATENCIÓN: Archivo {} contiene 'font-family' en binario".format(safe_name))
-                    
-                    for encoding in ['utf-8', 'latin-1', 'ascii']:
-                        try:
-                            text_content = content.decode(encoding, errors='replace')
-                            encoding_used = encoding
-                            break
-                        except:
-                            continue
-                    
-                    if text_content is None:
-                        text_content = content.decode('ascii', errors='replace')
-                        encoding_used = 'ascii-replace'
-                    
-                    # LOG ADICIONAL: Registrar codificación usada
-                    logger.info("Archivo {} decodificado usando: {}".format(safe_name, encoding_used))
-                    
-                    # Buscar el término font-family en el contenido
-                    if 'font-family' in text_content:
-                        logger.warning("ENCONTRADO 'font-family' en archivo: {}".format(safe_name))
-                        logger.warning("Contexto: {}".format(
-                            text_content[max(0, text_content.find('font-family') - 20):
-                                        min(len(text_content), text_content.find('font-family') + 30)]
-                        ))
-                    
-                    # SOLUCIÓN MEJORADA AL ERROR: Múltiples reemplazos para capturar todas las variantes
-                    original_text = text_content
-                    
-                    # Conjunto ampliado de términos a reemplazar
-                    replacements = {
-                        'font-family': 'data-fontname',
-                        'font family': 'data-fontname',
-                        'fontfamily': 'data-fontname',
-                        'font-familias': 'data-fontname',
-                        'font-face': 'data-fontface',
-                        'fontface': 'data-fontface',
-                        'font-style': 'data-fontstyle',
-                        'font-weight': 'data-fontweight',
-                        'font-size': 'data-fontsize'
-                    }
-                    
-                    for find_term, replace_term in replacements.items():
-                        text_content = text_content.replace(find_term, replace_term)
-                        text_content = text_content.replace(find_term.upper(), replace_term.upper())
-                        text_content = text_content.replace(find_term.capitalize(), replace_term.capitalize())
-                    
-                    # Registrar si se hicieron cambios
-                    if original_text != text_content:
-                        logger.info("Se reemplazaron términos relacionados con fuentes en: {}".format(safe_name))
-                    
-                    # Guardar el contenido modificado
-                    with open(file_path, 'wb') as f:
-                        f.write(text_content.encode('utf-8'))
-                    
-                    logger.info("Archivo procesado y guardado: {}".format(safe_name))
-                    
-                    # Si es XML, añadirlo a la lista específica
-                    if ext == '.xml':
-                        xml_files.append(file_path)
-                except Exception as e:
-                    logger.error("Error procesando archivo {}: {}".format(safe_name, str(e)))
-                    if ext == '.xml':
-                        xml_files.append(file_path)  # Añadir de todos modos para intentar validar
-            else:
-                support_files.append(file_path)
-                logger.info("Guardado archivo de soporte (sin procesar): {}".format(safe_name))
-        
+        session_dir, xml_files, support_files, file_hashes = ingest_folder_session(
+            session_id, entries, 'batch')
         if not xml_files:
-            logger.warning("No se encontraron archivos XML en la carpeta")
-            return jsonify({'error': 'No se encontraron archivos XML en la carpeta subida'})
-        
-        logger.info("Procesados {} archivos XML y {} archivos de soporte".format(len(xml_files), len(support_files)))
-        
-        # LOG ADICIONAL: Mostrar el contenido completo del directorio después del procesamiento
-        logger.info("CONTENIDO DEL DIRECTORIO DESPUÉS DEL PROCESAMIENTO:")
-        for root, dirs, files in os.walk(session_dir):
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
-                file_size = os.path.getsize(file_path)
-                logger.info("  - {}: {} bytes".format(file_name, file_size))
-        
-        # Validar toda la carpeta - ENFOQUE DIRECTO
-        logger.info("INICIANDO VALIDACIÓN DE CARPETA: {}".format(session_dir))
-        
-        # Guardar un reporte básico inicial 
-        pre_validation_report = """REPORTE PREVIO A VALIDACIÓN
+            raise ValueError('No se encontraron archivos XML en el paquete')
+    except Exception as e:
+        janitor.release(session_id)
+        logger.warning("Paquete {} del lote rechazado: {}".format(package['package'], to_ascii(str(e))))
+        package['error'] = to_ascii(str(e))
+        return package
+    
+    package['session_id'] = session_id
+    package['job_id'] = create_job(session_id, pooled=False)
+    package['args'] = (session_id, session_dir, xml_files, support_files, file_hashes, previous_session)
+    return package
+
+def prepare_batch_archive(index, upload):
+    """Paquete del lote subido como ZIP"""
+    package = {'index': index, 'package': to_ascii(upload.filename)}
+    try:
+        archive = PackageArchive(upload.stream, PACKAGE_MAX_ENTRIES, PACKAGE_MAX_BYTES, PACKAGE_MAX_RATIO)
+    except ArchiveError as e:
+        package['error'] = to_ascii(str(e))
+        return package
+    with archive:
+        entries = [(info.filename, lambda info=info: archive.open(info)) for info in archive.entries]
+        return prepare_batch_package(package, entries, request.values.get('previous_session'))
+
+def prepare_batch_session(index, package_id):
+    """
+    Paquete del lote indicado por su ID: la sesión de una carga anterior
+    (carpeta o ZIP) cuyos archivos siguen en TEMP_DIR. Se copia a una sesión
+    nueva y se revalida; los artículos sin cambios reutilizan su resultado.
+    """
+    package = {'index': index, 'package': to_ascii(package_id)}
+    manifest = manifest_store.load(package_id)
+    if manifest is None:
+        package['error'] = 'Paquete no encontrado'
+        return package
+    
+    # La sesión de origen no se limpia mientras se copia
+    janitor.hold(package_id)
+    try:
+        source_dir = os.path.join(TEMP_DIR, package_id)
+        names = sorted(manifest['files'])
+        if not all(os.path.isfile(os.path.join(source_dir, name)) for name in names):
+            package['error'] = 'Los archivos del paquete ya no estan disponibles'
+            return package
+        entries = [(name, lambda name=name: open(os.path.join(source_dir, name), 'rb')) for name in names]
+        return prepare_batch_package(package, entries, package_id)
+    finally:
+        janitor.release(package_id)
+
+def batch_record(package):
+    """Línea NDJSON con el resultado de un paquete del lote"""
+    record = {
+        'index': package['index'],
+        'package': package['package'],
+        'job_id': package.get('job_id'),
+        'session_id': package.get('session_id')
+    }
+    if 'error' in package:
+        record.update({'state': 'rejected', 'error': package['error']})
+        return record
+    
+    job = get_job(package['job_id'])
+    result = job['result'] or {}
+    record.update({
+        'state': job['state'],
+        'error': job['error'],
+        'success': result.get('success'),
+        'timed_out': result.get('timed_out', False),
+        'report_id': result.get('report_id'),
+        'counts': result.get('counts'),
+        'articles': result.get('articles'),
+        'duration': round(job['finished'] - job['started'], 3) if job['started'] else None,
+        'result_url': '/job_result/' + package['job_id']
+    })
+    return record
+
+def create_batch():
+    """Registra un lote nuevo y devuelve su ID"""
+    batch_id = uuid.uuid4().hex[:12]
+    now = time.time()
+    with jobs_lock:
+        expired = [other_id for other_id, batch in batches.items()
+                   if batch['finished'] and now - batch['finished'] > JOB_RETENTION_SECONDS]
+        for other_id in expired:
+            del batches[other_id]
+        batches[batch_id] = {'created': now, 'finished': None, 'events': EventLog()}
+    return batch_id
+
+def abandon_batch(batch_id, packages, error):
+    """
+    Cierra un lote que no llegó a empezar: sus trabajos quedan fallidos y
+    el lote terminado, para que la limpieza los retire y
+    /api/v1/batch/<id> no los muestre en curso.
+    """
+    now = time.time()
+    for package in packages:
+        if 'job_id' in package:
+            update_job(package['job_id'], state='failed', stage='Error', error=error, finished=now)
+            get_job(package['job_id'])['events'].close()
+        if 'session_id' in package:
+            janitor.release(package['session_id'])
+    batch = batches[batch_id]
+    batch['finished'] = now
+    batch['events'].close()
+
+def run_batch(batch_id, packages):
+    """
+    Valida los paquetes del lote, hasta BATCH_CONCURRENCY a la vez, y
+    publica el registro de cada uno en los eventos del lote en cuanto
+    termina. Los artículos de todos los paquetes comparten los slots del
+    validador.
+    """
+    batch = batches[batch_id]
+    results = batch['events']
+    set_log_context(session_id='batch-' + batch_id, stage='batch')
+    
+    def run_package(package):
+        run_job(package['job_id'], process_folder_job, *package['args'])
+        record = batch_record(package)
+        batch_packages.inc(result=record['state'])
+        results.publish('package', record)
+    
+    start = time.time()
+    try:
+        ready = []
+        for package in packages:
+            if 'error' in package:
+                batch_packages.inc(result='rejected')
+                results.publish('package', batch_record(package))
+            else:
+                ready.append(package)
+        run_concurrently(run_package, ready, BATCH_CONCURRENCY)
+    finally:
+        validator_pool.release()
+        batch['finished'] = time.time()
+        results.close()
+    logger.info("Lote {} terminado: {} paquetes".format(batch_id, len(packages)),
+                extra={'duration': time.time() - start})
+    clear_log_context()
+
+@app.route('/api/v1/batch', methods=['POST'])
+def api_batch():
+    """
+    Valida varios paquetes en una sola petición: archivos ZIP en el campo
+    'packages[]' o un manifiesto con los IDs de sesiones anteriores, como
+    JSON ({"packages": ["folder-...", ...]}) en el cuerpo o en el campo
+    'manifest'.
+    
+    La respuesta es NDJSON: una línea por paquete en el orden en que
+    terminan, con su estado, artículos, enlace al resultado completo y
+    número de secuencia (seq). Los paquetes rechazados (ZIP inválido, sin
+    XML, sesión inexistente) aparecen primero con state 'rejected'. Ver
+    batch_stream() para las líneas de espera y de continuación.
+    """
+    archives = [upload for upload in request.files.getlist('packages[]') if upload.filename]
+    package_ids = []
+    if not archives:
+        manifest = request.get_json(silent=True)
+        if manifest is None and request.form.get('manifest'):
+            try:
+                manifest = json.loads(request.form['manifest'])
+            except ValueError:
+                return json_response({'error': 'Manifiesto JSON invalido'}, 400)
+        package_ids = manifest.get('packages') if isinstance(manifest, dict) else manifest
+        if package_ids is None:
+            package_ids = []
+        if not isinstance(package_ids, list) or \
+                not all(isinstance(package_id, (str, unicode)) for package_id in package_ids):
+            return json_response({'error': 'El manifiesto debe ser una lista de IDs de paquete'}, 400)
+    
+    count = len(archives) or len(package_ids)
+    if not count:
+        return json_response({'error': 'No se recibieron paquetes'}, 400)
+    if count > BATCH_MAX_PACKAGES:
+        return json_response({'error': 'Demasiados paquetes en el lote (maximo {})'.format(
+            BATCH_MAX_PACKAGES)}, 413)
+    
+    # El lote ocupa un solo lugar en la cola del validador; se admite antes
+    # de registrarlo para que un 503 no deje un lote sin terminar
+    try:
+        validator_pool.admit()
+    except PoolFull as e:
+        return pool_full_response(e)
+    
+    batch_id = create_batch()
+    set_log_context(session_id='batch-' + batch_id, stage='ingest')
+    logger.info("Lote {} de {}: {} paquetes ({})".format(
+        batch_id, request.remote_addr, count, 'ZIP' if archives else 'manifiesto'))
+    
+    packages = []
+    started = False
+    try:
+        for index, upload in enumerate(archives):
+            packages.append(prepare_batch_archive(index, upload))
+        for index, package_id in enumerate(package_ids):
+            packages.append(prepare_batch_session(index, package_id))
+        thread = threading.Thread(target=run_batch, args=(batch_id, packages),
+                                  name='batch-{}'.format(batch_id[:8]))
+        thread.daemon = True
+        thread.start()
+        started = True
+    finally:
+        if not started:
+            validator_pool.release()
+            abandon_batch(batch_id, packages, 'El lote no pudo iniciarse')
+    
+    return batch_stream(batch_id, 0)
+
+@app.route('/api/v1/batch/<batch_id>')
+def api_batch_results(batch_id):
+    """
+    Continúa los resultados NDJSON de un lote después del registro con
+    seq = `after` (la línea de continuación trae la URL).
+    """
+    if batch_id not in batches:
+        return json_response({'error': 'Lote no encontrado'}, 404)
+    return batch_stream(batch_id, request.args.get('after', 0, type=int))
+
+def batch_stream(batch_id, last_id):
+    """
+    Respuesta NDJSON con los registros del lote posteriores a `last_id`.
+    Durante esperas largas se envían líneas vacías para mantener viva la
+    conexión. Para no ocupar un hilo del servidor durante todo el lote, la
+    respuesta se corta a los STREAM_MAX_SECONDS con una línea
+    {"batch_id", "state": "continue", "next_url"} desde la que el cliente
+    sigue; si el lote terminó, la última línea es la del último paquete.
+    """
+    events = batches[batch_id]['events']
+    
+    def stream():
+        last = last_id
+        deadline = time.time() + STREAM_MAX_SECONDS
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                yield json.dumps({
+                    'batch_id': batch_id,
+                    'state': 'continue',
+                    'next_url': '/api/v1/batch/{}?after={}'.format(batch_id, last)
+                }) + '\n'
+                return
+            records = events.since(last, timeout=min(15, remaining))
+            for event_id, event, record in records:
+                last = event_id
+                yield json.dumps(safe_json_serialization(dict(record, seq=event_id)), ensure_ascii=True) + '\n'
+            if events.closed and not events.since(last, timeout=0):
+                return
+            if not records:
+                yield '\n'
+    
+    response = Response(stream(), mimetype='application/x-ndjson')
+    response.headers['X-Batch-Id'] = batch_id
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def process_folder_job(job_id, session_id, session_dir, xml_files, support_files, file_hashes,
+                       previous_session=None):
+    """
+    Ejecuta el validador sobre una carpeta ya guardada y sanitizada, un
+    artículo por vez en cada slot libre, y consolida los resultados. Los
+    artículos sin cambios respecto de la sesión anterior (previous_session o
+    la última del mismo número) reutilizan su resultado.
+    Se ejecuta en un hilo de trabajo; devuelve el diccionario de respuesta final.
+    """
+    logger.info("Procesados {} archivos XML y {} archivos de soporte".format(len(xml_files), len(support_files)))
+    
+    # LOG ADICIONAL: Mostrar el contenido completo del directorio después del procesamiento
+    logger.info("CONTENIDO DEL DIRECTORIO DESPUÉS DEL PROCESAMIENTO:")
+    for root, dirs, files in os.walk(session_dir):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            file_size = os.path.getsize(file_path)
+            logger.info("  - {}: {} bytes".format(file_name, file_size))
+    
+    # Reutilizar el resultado si ya se validó exactamente el mismo paquete
+    with stage_seconds.time(endpoint='validate_folder', stage='cache_lookup'):
+        cache_key = result_cache.package_key(xml_files, support_files, file_hashes)
+        cached = result_cache.get(cache_key)
+    result_cache_lookups.inc(endpoint='validate_folder', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        logger.info("Resultado en cache para la sesion {} ({})".format(session_id, cache_key[:12]))
+        # Mantener el manifiesto para una próxima revalidación incremental
+        manifest_store.alias(session_id, cached.get('session_id'))
+        return publish_cached_result(session_id, cached)
+    
+    logger.info("INICIANDO VALIDACIÓN DE CARPETA: {}".format(session_dir))
+    set_log_context(stage='split')
+    update_job(job_id, stage='Preparando articulos', progress=25)
+    
+    # Guardar un reporte básico inicial 
+    pre_validation_report = """REPORTE PREVIO A VALIDACIÓN
 ID de sesión: {}
 Fecha: {}
 Archivos XML: {}
 Archivos de soporte: {}
 
 Este reporte se genera previo a la ejecución del validador XML.
-        """.format(
-            session_id,
-            datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            ", ".join([os.path.basename(f) for f in xml_files]),
-            len(support_files)
-        )
+    """.format(
+        session_id,
+        datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        ", ".join([os.path.basename(f) for f in xml_files]),
+        len(support_files)
+    )
+    
+    pre_report_path = os.path.join(TEMP_DIR, session_id + '_pre.txt')
+    with open(pre_report_path, 'w') as f:
+        f.write(pre_validation_report)
+    
+    # Ejecutar con captura de errores detallada
+    try:
+        # Un subpaquete por XML, con solo los activos que le corresponden,
+        # validados en paralelo en los slots del validador (pipeline.py)
+        hooks = FolderJobHooks(job_id, session_id, issue_key(xml_files), file_hashes, previous_session)
+        update_job(job_id, state='queued', stage='Esperando turno del validador', progress=30)
+        package = pipeline.validate_package(session_dir, xml_files, support_files, run_validator,
+                                            limit_policy, session_id, VALIDATOR_SLOTS, hooks)
+        for stage, seconds in package['timings'].items():
+            stage_seconds.observe(seconds, endpoint='validate_folder', stage=stage)
+        results = package['articles']
+        previous = hooks.previous
         
-        pre_report_path = os.path.join(TEMP_DIR, session_id + '_pre.txt')
-        with open(pre_report_path, 'w') as f:
-            f.write(pre_validation_report)
+        update_job(job_id, stage='Generando reporte', progress=92)
+        set_log_context(stage='report')
+        report_start = time.time()
         
-        # Ejecutar la validación con un enfoque simplificado
-        cmd = [PYTHON_PATH, XML_PACKAGE_MAKER, session_dir]
-        logger.info("COMANDO DE VALIDACIÓN: {}".format(' '.join(cmd)))
+        # Usar el primer HTML encontrado como reporte principal y copiarlo a
+        # la carpeta temporal para acceso directo
+        html_files = package['html_files']
+        report_file = html_files[0] if html_files else None
+        html_dest = None
+        if report_file:
+            try:
+                html_dest = store_file(report_file, os.path.join(TEMP_DIR, session_id + '.html' + GZIP_SUFFIX))
+                logger.info("HTML copiado a: {}".format(html_dest))
+            except Exception as e:
+                html_dest = report_file
+                logger.error("Error copiando HTML: {}".format(str(e)))
         
-        # Ejecutar con captura de errores detallada
-        try:
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            # Esperar hasta 2 minutos (120 segundos)
-            max_time = 120
-            start_time = time.time()
-            timed_out = False
-            
-            while process.poll() is None:
-                if time.time() - start_time > max_time:
-                    logger.warning("TIMEOUT: La validación excedió {} segundos".format(max_time))
-                    try:
-                        process.kill()
-                    except:
-                        pass
-                    timed_out = True
-                    break
-                time.sleep(0.5)
-            
-            exit_code = process.returncode if process.returncode is not None else -1
-            logger.info("VALIDACIÓN COMPLETADA - Código de salida: {}".format(exit_code))
-            
-            if timed_out:
-                stdout, stderr = b"", b"Error: Tiempo de espera agotado durante la validacion (limite: 2 minutos)"
-            else:
-                stdout, stderr = process.communicate()
-            
-            # LOG ADICIONAL: Registrar salidas originales
-            if stdout:
-                logger.info("STDOUT ORIGINAL (primeros 500 caracteres): {}".format(stdout[:500]))
-            if stderr:
-                logger.warning("STDERR ORIGINAL (primeros 500 caracteres): {}".format(stderr[:500]))
-            
-            # Convertir a ASCII seguro
-            stdout = to_ascii(stdout) if stdout else ""
-            stderr = to_ascii(stderr) if stderr else ""
-            
-            # REVISIÓN ESPECIAL PARA FONT-FAMILY: Buscar específicamente en la salida
-            if 'font-family' in stderr:
-                logger.error("DETECCIÓN CRÍTICA: 'font-family' encontrado en stderr")
-                font_family_lines = [line for line in stderr.split('\n') if 'font-family' in line]
-                for line in font_family_lines:
-                    logger.error("LÍNEA CON ERROR: {}".format(line))
-            
-            # Buscar reportes HTML generados automáticamente
-            logger.info("BUSCANDO REPORTES HTML GENERADOS:")
-            html_files = []
-            html_report_found = False
-            report_file = None
-
-            for root, dirs, files in os.walk(session_dir):
-                for file_name in files:
-                    if file_name.endswith('.html'):
-                        html_path = os.path.join(root, file_name)
-                        html_files.append(html_path)
-                        logger.info("Reporte HTML encontrado: {}".format(html_path))
-                        
-                        # Usar el primer HTML encontrado como reporte principal
-                        if not html_report_found:
-                            html_report_found = True
-                            report_file = html_path
-                            
-                            # Copiar el HTML a la carpeta temporal para acceso directo
-                            try:
-                                html_dest = os.path.join(TEMP_DIR, session_id + '.html')
-                                shutil.copy2(html_path, html_dest)
-                                logger.info("HTML copiado a: {}".format(html_dest))
-                            except Exception as e:
-                                logger.error("Error copiando HTML: {}".format(str(e)))
-            
-            # Determinar si hubo errores específicos de font-family
-            font_family_error = 'font-family' in stderr or 'font-family' in stdout
-            if font_family_error:
-                # Intentar extraer la línea exacta que contiene el error
-                error_lines = stderr.split('\n')
-                font_family_error_detail = ""
-                for line in error_lines:
-                    if 'font-family' in line:
-                        font_family_error_detail = line
-                        break
-                
-                logger.error("ERROR FONT-FAMILY DETECTADO: {}".format(font_family_error_detail))
-                
-                # Eliminar este error específico
-                stderr = stderr.replace(font_family_error_detail, 
-                                       "AVISO: Se encontró un atributo 'font-family' que ha sido ignorado")
-                
-                # SOLUCIÓN ESPECÍFICA: Si este es el único error, considerar la validación exitosa
-                if len(stderr.strip().split('\n')) < 5 and 'font-family' in stderr:
-                    stderr = "AVISO: Se encontraron algunos atributos de estilo no estándar que han sido ignorados.\n"
-                    stderr += "La validación estructural del XML es correcta."
-                    exit_code = 0  # Forzar código de éxito
-            
-            # Generar informe consolidado para el reporte de texto
-            consolidated_report = "REPORTE DE VALIDACIÓN DE CARPETA\n"
-            consolidated_report += "ID de sesión: {}\n".format(session_id)
-            consolidated_report += "Fecha: {}\n".format(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-            consolidated_report += "Total de archivos XML: {}\n".format(len(xml_files))
-            consolidated_report += "Total de archivos de soporte: {}\n\n".format(len(support_files))
-            
-            if stderr:
-                consolidated_report += "MENSAJES DE VALIDACIÓN:\n"
-                consolidated_report += stderr + "\n\n"
-            
-            consolidated_report += "SALIDA DEL VALIDADOR:\n"
-            consolidated_report += stdout
-
-            # Si hay reportes HTML, agregarlos al informe
-            if html_files:
-                consolidated_report += "\n\nREPORTES HTML GENERADOS:\n"
-                for html_file in html_files:
-                    consolidated_report += "- {}\n".format(os.path.basename(html_file))
-            
-            # Determinar si fue exitoso
-            success = (
-                (not timed_out) and 
-                (exit_code == 0 or font_family_error) and 
-                not (stderr and 'error' in stderr.lower() and 'font-family' not in stderr.lower())
-            )
-            
-            logger.info("RESULTADO FINAL: {}".format("ÉXITO" if success else "ERROR"))
-            
-            # Guardar el reporte en texto plano
-            txt_report_path = os.path.join(TEMP_DIR, session_id + '.txt')
-            with open(txt_report_path, 'w') as f:
-                f.write(consolidated_report)
-            
-            logger.info("Reporte de texto guardado en: {}".format(txt_report_path))
-            
-            # Respuesta final al cliente - GARANTIZAR RESPUESTA JSON
-            response_data = {
+        timed_out = package['timed_out']
+        success = package['success']
+        found = package['findings']
+        consolidated_report = package['report']
+        save_folder_manifest(session_id, hooks.issue, package['subpackages'], results, file_hashes)
+        
+        logger.info("RESULTADO FINAL: {}".format("ÉXITO" if success else "ERROR"))
+        
+        # Guardar el reporte en texto plano
+        txt_report_path = store_bytes(os.path.join(TEMP_DIR, session_id + '.txt' + GZIP_SUFFIX),
+                                      consolidated_report)
+        
+        logger.info("Reporte de texto guardado en: {}".format(txt_report_path))
+        save_findings(session_id, found)
+        
+        # Registrar la sesión y cada artículo en el índice de reportes
+        report_index.record(session_id, html_path=html_dest, txt_path=txt_report_path,
+                            status='valid' if success else 'invalid', success=success)
+        for result in results:
+            report_index.record(session_id, result['name'],
+                                html_path=result['html_files'][0] if result['html_files'] else None,
+                                txt_path=txt_report_path, status=result['status'],
+                                success=result['success'])
+        
+        # Un tiempo agotado no es un resultado reproducible; no guardarlo
+        if not timed_out:
+            result_cache.put(cache_key, {
                 'success': success,
                 'report': consolidated_report,
-                'report_id': session_id
-            }
-            
-            # Aplicar serialización segura para evitar errores de codificación
-            safe_response = safe_json_serialization(response_data)
-            
-            # Salida de debug
-            logger.info("Enviando respuesta JSON al cliente: {}".format(str(safe_response.keys())))
-            
-            try:
-                # Intentar respuesta JSON normal
-                return jsonify(safe_response)
-            except Exception as json_error:
-                # Si falla la serialización JSON, crear una respuesta manual
-                logger.error("Error al serializar JSON: {}".format(str(json_error)))
-                
-                # Crear respuesta JSON manualmente
-                import json
-                response_text = json.dumps(safe_response, ensure_ascii=True)
-                
-                from flask import Response
-                return Response(
-                    response_text,
-                    mimetype='application/json',
-                    headers={
-                        'Content-Type': 'application/json; charset=ascii'
-                    }
-                )
-            
-        except Exception as e:
-            # Capturar traza de error completa
-            error_trace = traceback.format_exc()
-            logger.error("ERROR EN EJECUCIÓN DE VALIDADOR: {}".format(str(e)))
-            logger.error(error_trace)
-            
-            # Garantizar respuesta JSON
-            error_response = {
-                'error': "Error durante la validación: {}".format(to_ascii(str(e)))
-            }
-            
-            # Aplicar serialización segura
-            safe_error = safe_json_serialization(error_response)
-            
-            try:
-                return jsonify(safe_error)
-            except Exception as json_error:
-                # Respuesta manual si jsonify falla
-                import json
-                response_text = json.dumps(safe_error, ensure_ascii=True)
-                
-                from flask import Response
-                return Response(
-                    response_text,
-                    mimetype='application/json',
-                    headers={
-                        'Content-Type': 'application/json; charset=ascii'
-                    }
-                )
-    
+                'findings': found,
+                'session_id': session_id
+            }, html_path=report_file)
+        stage_seconds.observe(time.time() - report_start, endpoint='validate_folder', stage='report')
+        
+        return dict(report_urls(session_id), **{
+            'success': success,
+            'report_id': session_id,
+            'counts': findings.counts(found),
+            'timed_out': timed_out,
+            'previous_session': previous['session_id'] if previous else None,
+            'articles': [article_summary(result) for result in results]
+        })
+        
     except Exception as e:
         # Capturar traza de error completa
         error_trace = traceback.format_exc()
-        error_msg = to_ascii(str(e))
-        logger.error("ERROR GENERAL EN VALIDATE_FOLDER: {}".format(error_msg))
+        logger.error("ERROR EN EJECUCIÓN DE VALIDADOR: {}".format(str(e)))
         logger.error(error_trace)
         
-        # Garantizar respuesta JSON
-        error_response = {'error': error_msg}
-        
-        # Aplicar serialización segura
-        safe_error = safe_json_serialization(error_response)
-        
+        return {
+            'error': "Error durante la validación: {}".format(to_ascii(str(e)))
+        }
+
+class FolderJobHooks(PackageHooks):
+    """
+    Lo propio del servidor en la validación de una carpeta: slots de
+    validator_pool, eventos y progreso del trabajo, y reutilización de los
+    artículos sin cambios de la sesión anterior (previous_session o la
+    última del mismo número).
+    """
+    
+    def __init__(self, job_id, session_id, issue, file_hashes, previous_session=None):
+        self.job_id = job_id
+        self.session_id = session_id
+        self.issue = issue
+        self.file_hashes = file_hashes
+        self.previous_session = previous_session
+        self.previous = None
+    
+    @contextmanager
+    def slot(self, article):
+        # Cada artículo corre en su propio hilo: el contexto no se hereda
+        set_log_context(session_id=self.session_id, job_id=self.job_id, stage='validate',
+                        article=article['name'])
+        with validator_pool.slot():
+            update_job(self.job_id, state='running')
+            yield
+    
+    def on_event(self, event, data):
+        publish_job_event(self.job_id, event, data)
+    
+    def on_font_family(self):
+        font_family_workarounds.inc()
+    
+    def reuse(self, articles):
+        # Reutilizar los artículos cuya huella coincide con la sesión anterior
+        self.previous = previous = manifest_store.find_previous(self.previous_session, self.issue)
+        reused = {}
+        for article in articles:
+            article['fingerprint'] = article_fingerprint(
+                result_cache.validator_id, article['xml'], article['assets'], self.file_hashes)
+            entry = previous['articles'].get(article['name']) if previous else None
+            if entry and entry.get('fingerprint') == article['fingerprint']:
+                reused[article['name']] = reuse_article_result(article, entry['result'],
+                                                               previous['session_id'])
+        if previous:
+            logger.info("Sesion anterior {}: {} de {} articulos sin cambios".format(
+                previous['session_id'], len(reused), len(articles)))
+        for name in sorted(reused):
+            publish_job_event(self.job_id, 'article', {'name': name, 'status': reused[name]['status'],
+                                                       'reused': True})
+        folder_articles.inc(len(reused), origin='reused')
+        folder_articles.inc(len(articles) - len(reused), origin='validated')
+        return reused
+    
+    def on_progress(self, done, total):
+        update_job(self.job_id, state='running', stage='Validando articulos ({}/{})'.format(done, total),
+                   progress=30 + int(60 * done / total))
+
+def reuse_article_result(article, stored, previous_session):
+    """
+    Resultado de un artículo sin cambios, tomado del manifiesto de la sesión
+    anterior. Sus reportes HTML se copian si la sesión anterior aún existe.
+    """
+    previous_dir = os.path.join(TEMP_DIR, previous_session, ARTICLES_DIR, article['name'])
+    html_files = []
+    for file_name in stored.get('html_files', []):
+        source = os.path.join(previous_dir, file_name)
+        dest = os.path.join(article['dir'], file_name)
         try:
-            return jsonify(safe_error)
-        except Exception as json_error:
-            # Respuesta manual si jsonify falla
-            import json
-            response_text = json.dumps(safe_error, ensure_ascii=True)
-            
-            from flask import Response
-            return Response(
-                response_text,
-                mimetype='application/json',
-                headers={
-                    'Content-Type': 'application/json; charset=ascii'
-                }
-            )
+            shutil.copy2(source, dest)
+            html_files.append(dest)
+        except (IOError, OSError):
+            pass
+    
+    # El JSON devuelve unicode; el reporte se arma con cadenas ASCII nativas
+    result = dict(stored)
+    found = stored.get('findings', [])
+    result.update({
+        'status': to_ascii(stored['status']),
+        'stdout': to_ascii(stored['stdout']),
+        'stderr': to_ascii(stored['stderr']),
+        'name': article['name'],
+        'assets': [os.path.basename(path) for path in article['assets']],
+        'timed_out': False,
+        'limit': None,
+        'limits': None,
+        'usage': None,
+        'html_files': html_files,
+        'findings': found,
+        'counts': findings.counts(found),
+        'reused_from': previous_session
+    })
+    return result
+
+def save_folder_manifest(session_id, issue, articles, results, file_hashes):
+    """Guarda las huellas y resultados por artículo de una sesión de carpeta"""
+    manifest = {
+        'session_id': session_id,
+        'created': time.time(),
+        'issue_key': issue,
+        'files': dict((os.path.basename(path), sha) for path, sha in file_hashes.items()),
+        'articles': {}
+    }
+    for article, result in zip(articles, results):
+        # Un tiempo agotado o una falla no se reutilizan
+        reusable = not result['timed_out'] and result['status'] != 'FALLA'
+        manifest['articles'][article['name']] = {
+            'fingerprint': article['fingerprint'] if reusable else None,
+            'xml': os.path.basename(article['xml']),
+            'assets': result['assets'],
+            'result': {
+                'success': result['success'],
+                'status': result['status'],
+                'exit_code': result['exit_code'],
+                'duration': result['duration'],
+                'stdout': result['stdout'],
+                'stderr': result['stderr'],
+                'findings': result['findings'],
+                'html_files': [os.path.basename(path) for path in result['html_files']]
+            }
+        }
+    try:
+        manifest_store.save(manifest)
+    except Exception as e:
+        logger.error("Error guardando el manifiesto de {}: {}".format(session_id, str(e)))
+
+@app.route('/job_status/<job_id>')
+def job_status(job_id):
+    """Devuelve el estado y el progreso de un trabajo de validación"""
+    job = get_job(job_id)
+    if job is None:
+        return json_response({'error': 'Trabajo no encontrado'}, 404)
+    return json_response(job_summary(job))
+
+@app.route('/job_events/<job_id>')
+def job_events(job_id):
+    """
+    Progreso del trabajo en vivo (Server-Sent Events): etapas ('progress'),
+    artículos ('article') y salida del validador ('output'). Al terminar el
+    trabajo se envía 'end'. Cada conexión dura a lo sumo STREAM_MAX_SECONDS;
+    EventSource se reconecta solo y sigue desde Last-Event-ID.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return json_response({'error': 'Trabajo no encontrado'}, 404)
+    events = job['events']
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_id') or 0)
+    except ValueError:
+        last_id = 0
+    
+    def stream():
+        last = last_id
+        deadline = time.time() + STREAM_MAX_SECONDS
+        # Reconexión rápida: el corte por STREAM_MAX_SECONDS es normal
+        yield 'retry: 500\n\n'
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                # Liberar el hilo; el navegador se reconecta con Last-Event-ID
+                return
+            batch = events.since(last, timeout=min(15, remaining))
+            for event_id, event, data in batch:
+                last = event_id
+                yield format_sse(event_id, event, data)
+            if events.closed and not events.since(last, timeout=0):
+                yield format_sse(last, 'end', {'job_id': job_id})
+                return
+            if not batch:
+                # Comentario para mantener viva la conexión a través de proxies
+                yield ': keepalive\n\n'
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/job_result/<job_id>')
+def job_result(job_id):
+    """Devuelve el resultado final de un trabajo, o su estado si aún no termina"""
+    job = get_job(job_id)
+    if job is None:
+        return json_response({'error': 'Trabajo no encontrado'}, 404)
+    
+    if job['state'] == 'failed':
+        return json_response({'error': job['error']})
+    if job['state'] != 'done':
+        return json_response(job_summary(job), 202)
+    
+    return json_response(job['result'])
+
+@app.route('/status')
+def server_status():
+    """Ocupación de los slots del validador y de la cola de espera"""
+    with jobs_lock:
+        job_states = {}
+        for job in jobs.values():
+            job_states[job['state']] = job_states.get(job['state'], 0) + 1
+    
+    return json_response({
+        'validator_pool': validator_pool.status(),
+        'result_cache': result_cache.stats(),
+        'warm_workers': warm_pool.status() if warm_pool is not None else None,
+        'report_index': report_index.stats(),
+        'response_cache': response_cache.stats(),
+        'janitor': janitor.status(),
+        'validator_limits': dict(limit_policy.settings(), enforcement=limit_policy.enforcement()),
+        'jobs': job_states
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Contadores e histogramas de tiempos en formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+def clean_report_id(report_id):
+    """Sanitiza el ID de un reporte para evitar ataques de ruta"""
+    safe_report_id = "".join(c for c in report_id if c.isalnum() or c in '-_')
+    if safe_report_id != report_id:
+        logger.warning("Se sanitizó el ID del reporte: {} -> {}".format(report_id, safe_report_id))
+    return safe_report_id
+
+def resolve_report(report_id, article=''):
+    """
+    Rutas del HTML y del texto de un reporte con una consulta al índice. Los
+    reportes anteriores al índice se buscan con los nombres fijos de TEMP_DIR.
+    """
+    row = report_index.lookup(report_id, article)
+    if row is None and not article:
+        row = {
+            'html_path': os.path.join(TEMP_DIR, report_id + '.html'),
+            'txt_path': os.path.join(TEMP_DIR, report_id + '.txt')
+        }
+    return row or {'html_path': None, 'txt_path': None}
 
 @app.route('/download_report/<report_id>')
 def download_report(report_id):
     client_ip = request.remote_addr
     logger.info("Download request from {} for report: {}".format(client_ip, report_id))
+    report_id = clean_report_id(report_id)
+    janitor.touch(report_id)
     
     # Buscar el archivo de texto
-    txt_report_path = os.path.join(TEMP_DIR, report_id + '.txt')
-    if os.path.exists(txt_report_path):
+    with stage_seconds.time(endpoint='download_report', stage='resolve'):
+        txt_report_path = resolve_report(report_id)['txt_path']
+    if txt_report_path and os.path.exists(txt_report_path):
         logger.info("TXT Report found, serving: {}".format(txt_report_path))
-        try:
-            return send_file(
-                txt_report_path, 
-                mimetype='text/plain',
-                as_attachment=True,
-                attachment_filename='validation_report.txt'  # Para Flask antiguo
-            )
-        except TypeError:
-            # Si falla, usar solo los parámetros básicos
-            return send_file(
-                txt_report_path, 
-                mimetype='text/plain',
-                as_attachment=True
-            )
+        return report_page_response(txt_report_path, read_report, 'text/plain',
+                                    download_name='validation_report.txt')
     
     logger.warning("Report not found: {}".format(report_id))
     return "Report not found", 404
 
-@app.route('/open_html_report/<report_id>')
-def open_html_report(report_id):
-    """Abre el reporte HTML en una nueva ventana"""
-    client_ip = request.remote_addr
-    logger.info("Solicitud de reporte HTML de {} para reporte: {}".format(client_ip, report_id))
+def cached_report_bytes(path, mimetype):
+    """Contenido descomprimido de un archivo de la sesión, desde la caché de páginas"""
+    st = os.stat(path)
+    key = (read_report.__name__, path, st.st_mtime, st.st_size)
+    return response_cache.get_or_render(key, lambda: read_report(path), mimetype, st.st_mtime)['body']
+
+@app.route('/api/v1/reports/<report_id>/findings')
+def api_report_findings(report_id):
+    """
+    Hallazgos de un reporte por páginas, en JSON. Parámetros: offset, limit,
+    severity (una o varias separadas por comas) y article. `counts` cuenta
+    todos los hallazgos del reporte; `total`, los que pasan el filtro.
+    """
+    report_id = clean_report_id(report_id)
+    janitor.touch(report_id)
+    path = os.path.join(TEMP_DIR, report_id + findings.FINDINGS_SUFFIX + GZIP_SUFFIX)
+    if not os.path.exists(path):
+        return json_response({'error': 'Hallazgos no encontrados'}, 404)
     
-    # Sanitizar el ID del reporte para evitar ataques de ruta
-    safe_report_id = "".join(c for c in report_id if c.isalnum() or c in '-_')
-    if safe_report_id != report_id:
-        logger.warning("Se sanitizó el ID del reporte: {} -> {}".format(report_id, safe_report_id))
-        report_id = safe_report_id
+    severities = [value.strip().lower() for value in request.args.get('severity', '').split(',') if value.strip()]
+    unknown = [value for value in severities if value not in findings.SEVERITIES]
+    if unknown:
+        return json_response({'error': 'Severidad desconocida: {}'.format(to_ascii(', '.join(unknown)))}, 400)
+    article = request.args.get('article') or None
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = max(1, min(request.args.get('limit', FINDINGS_PAGE_DEFAULT, type=int), FINDINGS_PAGE_MAX))
     
-    # 1. Verificar si existe un archivo HTML directo para el reporte
-    direct_html_path = os.path.join(TEMP_DIR, report_id + '.html')
-    if os.path.exists(direct_html_path):
-        logger.info("Reporte HTML encontrado: {}".format(direct_html_path))
-        try:
-            return send_file(direct_html_path, mimetype='text/html', as_attachment=False)
-        except Exception as e:
-            logger.error("Error al enviar el archivo HTML: {}".format(str(e)))
-            # Continuar con el siguiente método si falla
+    found = findings.loads(cached_report_bytes(path, 'application/json'))
+    selected = [item for item in found
+                if (not severities or item['severity'] in severities) and
+                (article is None or item.get('article') == article)]
+    page = selected[offset:offset + limit]
+    return json_response({
+        'report_id': report_id,
+        'counts': findings.counts(found),
+        'total': len(selected),
+        'offset': offset,
+        'limit': limit,
+        'next_offset': offset + len(page) if offset + len(page) < len(selected) else None,
+        'findings': page
+    })
+
+@app.route('/api/v1/reports/<report_id>/report')
+def api_report_page(report_id):
+    """
+    Tramo del reporte de texto de una sesión: offset y limit en bytes. Las
+    cabeceras X-Report-Offset, X-Report-Next-Offset y X-Report-Size indican
+    dónde sigue el reporte.
+    """
+    report_id = clean_report_id(report_id)
+    janitor.touch(report_id)
+    txt_report_path = resolve_report(report_id)['txt_path']
+    if not txt_report_path or not os.path.exists(txt_report_path):
+        return json_response({'error': 'Reporte no encontrado'}, 404)
     
-    # 2. Buscar HTML en la estructura de directorios del reporte_id
-    session_dir = os.path.join(TEMP_DIR, report_id)
-    if os.path.exists(session_dir):
-        # Buscar archivos HTML recursivamente - Búsqueda más profunda
-        html_files = []
-        for root, dirs, files in os.walk(session_dir):
-            for file in files:
-                if file.endswith('.html'):
-                    html_path = os.path.join(root, file)
-                    html_files.append(html_path)
-                    logger.info("Reporte HTML encontrado en estructura de directorios: {}".format(html_path))
-        
-        # Intentar cada archivo HTML encontrado
-        for html_path in html_files:
-            try:
-                logger.info("Intentando enviar HTML: {}".format(html_path))
-                return send_file(html_path, mimetype='text/html', as_attachment=False)
-            except Exception as e:
-                logger.error("Error al enviar el archivo HTML {}: {}".format(html_path, str(e)))
-                # Continuar con el siguiente si falla
-    
-    # 3. Buscar específicamente en la ruta del error mostrado
-    # Ruta específica basada en el error reportado
-    specific_error_path = os.path.join(TEMP_DIR, report_id + '_xpm', 'errors', 'xpm.html')
-    if os.path.exists(specific_error_path):
-        logger.info("Reporte HTML encontrado en ruta específica de error: {}".format(specific_error_path))
-        try:
-            return send_file(specific_error_path, mimetype='text/html', as_attachment=False)
-        except Exception as e:
-            logger.error("Error al enviar el archivo HTML de ruta específica: {}".format(str(e)))
+    data = cached_report_bytes(txt_report_path, 'text/plain')
+    offset = max(0, min(request.args.get('offset', 0, type=int), len(data)))
+    limit = max(1, min(request.args.get('limit', REPORT_PAGE_DEFAULT, type=int), REPORT_PAGE_MAX))
+    page = data[offset:offset + limit]
     
-    # 4. Si no se encontró HTML, pero sabemos la ubicación específica del reporte, mostrar un mensaje explicativo
-    txt_report_path = os.path.join(TEMP_DIR, report_id + '.txt')
-    if os.path.exists(txt_report_path):
-        try:
-            with open(txt_report_path, 'r') as f:
-                report_content = f.read()
-            
-            # Buscar la ruta del reporte HTML en el contenido
-            report_paths = []
-            for line in report_content.splitlines():
-                if '.html' in line and ('Report:' in line or 'Saved report:' in line):
-                    path = line.split(':', 1)[1].strip() if ':' in line else line.strip()
-                    report_paths.append(path)
-            
-            if report_paths:
-                # Mostrar información sobre dónde está realmente el archivo
-                html_content = """<!DOCTYPE html>
-<html>
-<head>
-    <title>Reporte HTML no accesible directamente</title>
-    <meta charset="UTF-8">
-    <meta http-equiv="Content-Type" content="text/html; charset=utf-8">
-    <style>
-        body { font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }
-        .container { max-width: 800px; margin: 0 auto; background-color: white; padding: 20px; box-shadow: 0 0 10px rgba(0,0,0,0.1); }
-        h1 { color: #D8000C; }
-        pre { background-color: #f0f0f0; padding: 10px; overflow: auto; }
-        .info { background-color: #e7f3fe; border-left: 6px solid #2196F3; padding: 10px; }
-        p { line-height: 1.5; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Reporte HTML no accesible vía web</h1>
-        <div class="info">
-            <p>El reporte HTML fue generado correctamente pero se encuentra en una ubicación del servidor que no es accesible directamente vía web.</p>
-        </div>
-        <p>Las rutas de los reportes generados son:</p>
-        <pre>{}</pre>
-        <p>Puede acceder al reporte de texto completo:</p>
-        <p><a href="/download_report/{}" style="color: #2196F3; text-decoration: none;">Descargar reporte de texto</a></p>
-        <hr>
-        <p><strong>Solución técnica:</strong> Para acceder al HTML directamente, un administrador debe configurar el servidor para servir archivos desde <code>C:/scielo/bin/web/temp</code> o copiar los archivos HTML a una ubicación accesible.</p>
-    </div>
-</body>
-</html>
-                """.format('\n'.join(report_paths), report_id)
-                
-                return Response(html_content, mimetype='text/html')
-            
-            # Si no encontramos rutas específicas, generar HTML desde el texto como antes
-            safe_content = to_ascii(report_content)
-            safe_content = safe_content.replace('<', '&lt;').replace('>', '&gt;')
-            
-            # Generar HTML simple
-            html_content = """<!DOCTYPE html>
+    response = Response(page, mimetype='text/plain')
+    response.headers['X-Report-Offset'] = str(offset)
+    response.headers['X-Report-Next-Offset'] = str(offset + len(page))
+    response.headers['X-Report-Size'] = str(len(data))
+    response.cache_control.no_cache = True
+    return response
+
+def render_text_report(txt_report_path):
+    """Convierte un reporte de texto en una página HTML"""
+    safe_content = to_ascii(read_report(txt_report_path))
+    safe_content = safe_content.replace('<', '&lt;').replace('>', '&gt;')
+    
+    # Generar HTML simple
+    html_content = """<!DOCTYPE html>
 <html>
 <head>
     <title>SciELO XML Validation Report</title>
     <meta charset="UTF-8">
     <meta http-equiv="Content-Type" content="text/html; charset=utf-8">
     <style>
-        body { font-family: monospace; margin: 20px; }
-        h1 { color: #333; }
-        pre { background-color: #f5f5f5; padding: 15px; white-space: pre-wrap; }
+        body {{ font-family: monospace; margin: 20px; }}
+        h1 {{ color: #333; }}
+        pre {{ background-color: #f5f5f5; padding: 15px; white-space: pre-wrap; }}
     </style>
 </head>
 <body>
@@ -1093,19 +1985,86 @@ def open_html_report(report_id):
     <pre>{}</pre>
 </body>
 </html>
-            """.format(safe_content)
-            
-            # Guardar el HTML generado
-            generated_html_path = os.path.join(TEMP_DIR, report_id + '_generated.html')
-            with open(generated_html_path, 'w') as f:
-                f.write(html_content)
-                
-            logger.info("HTML generado a partir del reporte de texto: {}".format(generated_html_path))
-            return send_file(generated_html_path, mimetype='text/html', as_attachment=False)
+    """.format(safe_content)
+    
+    logger.info("HTML generado a partir del reporte de texto: {}".format(txt_report_path))
+    return html_content
+
+def accepts_gzip():
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+def report_page_response(path, render, mimetype='text/html', download_name=None):
+    """
+    Página de reporte desde la caché en memoria (generada con render(path)
+    si no está), con ETag y Last-Modified para que el navegador reciba 304
+    al recargar una página que no cambió, y soporte de Range para reanudar
+    descargas. Si el cliente acepta gzip, un reporte guardado comprimido se
+    envía tal cual y una página generada grande se comprime (una vez, en la
+    caché); el ETag y las respuestas 304 son los de lo que se envía.
+    """
+    st = os.stat(path)
+    send_gzip = render is read_report and is_compressed(path) and accepts_gzip()
+    if send_gzip:
+        render = read_stored
+    key = (render.__name__, path, st.st_mtime, st.st_size)
+    
+    def timed_render():
+        with stage_seconds.time(endpoint=request.endpoint, stage='render'):
+            return render(path)
+    entry = response_cache.get_or_render(key, timed_render, mimetype, st.st_mtime)
+    compressible = entry['mimetype'] in GZIP_MIMETYPES and len(entry['body']) >= GZIP_MIN_BYTES
+    if not send_gzip and compressible and accepts_gzip():
+        body = entry['body']
+        entry = response_cache.get_or_render(('gzip',) + key, lambda: compress_bytes(body, GZIP_LEVEL),
+                                             entry['mimetype'], entry['last_modified'])
+        send_gzip = True
+    
+    response = Response(entry['body'], mimetype=entry['mimetype'])
+    if send_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    if is_compressed(path) or compressible:
+        response.vary.add('Accept-Encoding')
+    if download_name:
+        response.headers['Content-Disposition'] = 'attachment; filename={}'.format(download_name)
+    response.set_etag(entry['etag'])
+    response.last_modified = datetime.datetime.utcfromtimestamp(int(entry['last_modified']))
+    response.cache_control.no_cache = True
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(entry['body']))
+
+@app.route('/open_html_report/<report_id>')
+def open_html_report(report_id):
+    """
+    Abre el reporte HTML en una nueva ventana. Con ?article=<nombre> abre el
+    reporte de un artículo de una validación de carpeta.
+    """
+    client_ip = request.remote_addr
+    logger.info("Solicitud de reporte HTML de {} para reporte: {}".format(client_ip, report_id))
+    report_id = clean_report_id(report_id)
+    article = clean_report_id(request.args.get('article', ''))
+    janitor.touch(report_id)
+    with stage_seconds.time(endpoint='open_html_report', stage='resolve'):
+        report = resolve_report(report_id, article)
+    
+    # 1. Enviar el HTML registrado para el reporte
+    html_path = report['html_path']
+    if html_path and os.path.exists(html_path):
+        logger.info("Reporte HTML encontrado: {}".format(html_path))
+        try:
+            return report_page_response(html_path, read_report)
+        except Exception as e:
+            logger.error("Error al enviar el archivo HTML: {}".format(str(e)))
+            # Continuar con el siguiente método si falla
+    
+    # 2. Si no hay HTML, convertir el reporte de texto a HTML
+    txt_report_path = report['txt_path']
+    if txt_report_path and os.path.exists(txt_report_path):
+        try:
+            return report_page_response(txt_report_path, render_text_report)
         except Exception as e:
             logger.error("Error generando HTML a partir del reporte de texto: {}".format(str(e)))
     
-    # 5. Si todo falla, mostrar mensaje de error como HTML con Content-Type adecuado
+    # 3. Si todo falla, mostrar mensaje de error como HTML con Content-Type adecuado
     logger.warning("Reporte HTML no encontrado para report_id: {}".format(report_id))
     
     error_html = """<!DOCTYPE html>
@@ -1115,10 +2074,10 @@ def open_html_report(report_id):
     <meta charset="UTF-8">
     <meta http-equiv="Content-Type" content="text/html; charset=utf-8">
     <style>
-        body { font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }
-        .container { max-width: 800px; margin: 0 auto; background-color: white; padding: 20px; box-shadow: 0 0 10px rgba(0,0,0,0.1); }
-        h1 { color: #D8000C; }
-        p { line-height: 1.5; }
+        body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
+        .container {{ max-width: 800px; margin: 0 auto; background-color: white; padding: 20px; box-shadow: 0 0 10px rgba(0,0,0,0.1); }}
+        h1 {{ color: #D8000C; }}
+        p {{ line-height: 1.5; }}
     </style>
 </head>
 <body>
@@ -1133,73 +2092,129 @@ def open_html_report(report_id):
     """.format(report_id, report_id)
     
     # Devolver como respuesta HTML correcta, no como error 404
-    from flask import Response
     return Response(error_html, mimetype='text/html')
 
-@app.route('/view_logs')
-def view_logs():
+LOGS_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>SciELO XML Validator Logs</title>
+    <style>
+        body { font-family: monospace; padding: 20px; }
+        h1 { color: #333; }
+        form { margin-bottom: 15px; }
+        input, select { margin-right: 10px; }
+        pre { background-color: #f5f5f5; padding: 15px; overflow: auto; max-height: 80vh; }
+        .WARNING { color: #9F6000; }
+        .ERROR, .CRITICAL { color: #D8000C; }
+    </style>
+</head>
+<body>
+    <h1>Server Logs</h1>
+    <form method="get" action="/view_logs">
+        <input type="hidden" name="key" value="{{ key }}">
+        Nivel: <select name="level">
+            {% for name in ['', 'INFO', 'WARNING', 'ERROR'] %}
+            <option value="{{ name }}" {% if name == filters.level %}selected{% endif %}>{{ name or 'Todos' }}</option>
+            {% endfor %}
+        </select>
+        Sesion: <input name="session" value="{{ filters.session or '' }}">
+        IP: <input name="ip" value="{{ filters.ip or '' }}">
+        Texto: <input name="q" value="{{ filters.text or '' }}">
+        <button type="submit">Filtrar</button>
+    </form>
+    <pre>{% for record in records %}<span class="{{ record.level }}">{{ record.text }}</span>
+{% endfor %}</pre>
+    {% if cursor %}
+    <a href="/view_logs?key={{ key|urlencode }}&level={{ (filters.level or '')|urlencode }}&session={{ (filters.session or '')|urlencode }}&ip={{ (filters.ip or '')|urlencode }}&q={{ (filters.text or '')|urlencode }}&cursor={{ cursor }}">Registros anteriores</a>
+    {% endif %}
+</body>
+</html>
+"""
+
+def logs_authorized():
     # Verificación simple de autorización (mejorar en producción con autenticación real)
     if request.args.get('key') != 'admin123':
         logger.warning("Unauthorized logs access attempt from {}".format(request.remote_addr))
+        return False
+    return True
+
+def log_query_args():
+    """Filtros de consulta del log tomados de la petición"""
+    return {
+        'level': request.args.get('level') or None,
+        'session': request.args.get('session') or None,
+        'ip': request.args.get('ip') or None,
+        'text': request.args.get('q') or None,
+        'since': request.args.get('since') or None,
+        'until': request.args.get('until') or None
+    }
+
+@app.route('/view_logs')
+def view_logs():
+    if not logs_authorized():
         return "Not authorized", 403
     
     try:
-        # Leer y convertir a ASCII puro
-        with open(log_file, 'rb') as f:
-            content = f.read()
-            log_content = to_ascii(content)
+        # Solo los registros de la página pedida, leídos desde el final del archivo
+        filters = log_query_args()
+        limit = min(request.args.get('limit', 500, type=int), 5000)
+        records, cursor = log_reader.query(limit=limit, cursor=request.args.get('cursor'), **filters)
         
         logger.info("Logs viewed by {}".format(request.remote_addr))
-        return """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>SciELO XML Validator Logs</title>
-            <style>
-                body { font-family: monospace; padding: 20px; }
-                h1 { color: #333; }
-                pre { background-color: #f5f5f5; padding: 15px; overflow: auto; max-height: 80vh; }
-            </style>
-        </head>
-        <body>
-            <h1>Server Logs</h1>
-            <pre>{}</pre>
-        </body>
-        </html>
-        """.format(log_content)
+        return render_template_string(LOGS_HTML, records=records, cursor=cursor, filters=filters,
+                                      key=request.args.get('key'))
     except Exception as e:
         logger.error("Error reading logs: {}".format(str(e)))
         return "Error reading logs: {}".format(to_ascii(str(e))), 500
 
-# Limpieza de archivos temporales viejos (más de 1 día)
-def cleanup_temp_files():
-    logger.info("Starting cleanup of temporary files")
-    current_time = time.time()
-    cleaned_items = 0
-    for item in os.listdir(TEMP_DIR):
-        item_path = os.path.join(TEMP_DIR, item)
-        if os.path.isdir(item_path) and current_time - os.path.getctime(item_path) > 86400:
-            try:
-                shutil.rmtree(item_path)
-                cleaned_items += 1
-            except Exception as e:
-                logger.error("Failed to delete directory {}: {}".format(item_path, str(e)))
-        elif os.path.isfile(item_path) and current_time - os.path.getctime(item_path) > 86400:
-            try:
-                os.remove(item_path)
-                cleaned_items += 1
-            except Exception as e:
-                logger.error("Failed to delete file {}: {}".format(item_path, str(e)))
+@app.route('/api/logs')
+def api_logs():
+    """
+    Registros del log del más nuevo al más viejo, en JSON. Parámetros:
+    level (nivel mínimo), session, ip, q (texto), since/until
+    ('AAAA-MM-DD HH:MM:SS'), limit y cursor (para la página siguiente).
+    """
+    if not logs_authorized():
+        return json_response({'error': 'Not authorized'}, 403)
     
-    logger.info("Cleanup complete. Removed {} items.".format(cleaned_items))
+    try:
+        limit = min(request.args.get('limit', 200, type=int), 5000)
+        records, cursor = log_reader.query(limit=limit, cursor=request.args.get('cursor'),
+                                           **log_query_args())
+    except ValueError as e:
+        return json_response({'error': to_ascii(str(e))}, 400)
+    
+    return json_response({'records': records, 'next_cursor': cursor})
+
+@app.route('/api/logs/page')
+def api_logs_page():
+    """
+    Tramo del log en texto plano: file (0 = log activo, 1.. = respaldos),
+    offset (por defecto, el final) y length en bytes.
+    """
+    if not logs_authorized():
+        return "Not authorized", 403
+    
+    length = max(1, min(request.args.get('length', 65536, type=int), 1048576))
+    text, offset, next_offset, size = log_reader.read_page(
+        request.args.get('file', 0, type=int), request.args.get('offset', type=int), length)
+    
+    response = Response(text, mimetype='text/plain')
+    response.headers['X-Log-Offset'] = str(offset)
+    response.headers['X-Log-Next-Offset'] = str(next_offset)
+    response.headers['X-Log-Size'] = str(size)
+    return response
 
+# Limpieza de archivos temporales viejos (más de 1 día)
 if __name__ == '__main__':
     # Modificar todas las variables de entorno relacionadas con codificación
     os.environ['PYTHONIOENCODING'] = 'ascii'
     os.environ['LC_ALL'] = 'C'
     
-    # Limpiar archivos temporales viejos al inicio
-    cleanup_temp_files()
+    # Limpiar TEMP_DIR, la caché y los manifiestos al inicio y luego periódicamente
+    janitor.start()
+    atexit.register(janitor.stop)
     
     # Iniciar el servidor en modo producción con Waitress
     try:
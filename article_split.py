@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+División de una carpeta subida en paquetes por artículo.
+
+Un número de una revista llega como una carpeta con varios XML y todos sus
+activos (PDF, figuras, tablas). Validarla con una sola ejecución de
+xml_package_maker usa un único núcleo; en su lugar cada XML se valida en su
+propio subpaquete, que contiene solo los activos que le corresponden:
+
+- los que el XML referencia (xlink:href, href, src), buscados por nombre
+  con y sin extensión, como hacen los paquetes SciELO con las figuras;
+- los que comparten el nombre base del XML (`<base>.pdf`, `<base>-gf1.jpg`).
+
+Los activos que ningún artículo reclama se informan como huérfanos.
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from text_normalize import sanitize_upload_name
+
+logger = logging.getLogger('scielo_validator')
+
+# Carpeta, dentro de la sesión, donde se arman los subpaquetes
+ARTICLES_DIR = 'articles'
+
+_REFERENCE = re.compile(br'''(?:xlink:href|href|src)\s*=\s*["']([^"'#]+)["']''')
+
+
+def referenced_names(xml_path):
+    """
+    Nombres de archivo (en minúsculas y saneados como los de la carga) que el
+    XML referencia, con y sin extensión.
+    """
+    with open(xml_path, 'rb') as f:
+        data = f.read()
+
+    names = set()
+    for match in _REFERENCE.finditer(data):
+        href = match.group(1).strip()
+        # Las URL externas no son activos del paquete
+        if re.match(br'^[a-zA-Z][a-zA-Z0-9+.-]*://', href) or href.startswith(b'mailto:'):
+            continue
+        name = sanitize_upload_name(href.decode('utf-8', 'replace')).lower()
+        names.add(name)
+        names.add(os.path.splitext(name)[0])
+    return names
+
+
+def assign_assets(xml_files, support_files):
+    """
+    Asigna los archivos de soporte a cada XML. Devuelve
+    ({xml_path: [activos]}, [huérfanos]). Un activo puede pertenecer a
+    varios artículos si varios lo referencian.
+    """
+    assignments = dict((xml_path, []) for xml_path in xml_files)
+    claimed = set()
+    references = {}
+    for xml_path in xml_files:
+        try:
+            references[xml_path] = referenced_names(xml_path)
+        except (IOError, OSError) as e:
+            logger.warning("No se pudieron leer las referencias de {}: {}".format(
+                os.path.basename(xml_path), e))
+            references[xml_path] = set()
+
+    for asset in support_files:
+        name = os.path.basename(asset).lower()
+        stem = os.path.splitext(name)[0]
+        for xml_path in xml_files:
+            xml_stem = os.path.splitext(os.path.basename(xml_path))[0].lower()
+            if (name in references[xml_path] or stem in references[xml_path] or
+                    stem == xml_stem or stem.startswith(xml_stem + '-')):
+                assignments[xml_path].append(asset)
+                claimed.add(asset)
+
+    orphans = [asset for asset in support_files if asset not in claimed]
+    return assignments, orphans
+
+
+def _place(source, dest):
+    # Enlace duro si el sistema lo permite (os.link no existe en Python 2.7
+    # para Windows); si no, copia
+    link = getattr(os, 'link', None)
+    if link is not None:
+        try:
+            link(source, dest)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, dest)
+
+
+def split_package(session_dir, xml_files, support_files):
+    """
+    Arma un subpaquete por XML en `session_dir/articles/<nombre>/`.
+    Devuelve (artículos, huérfanos); cada artículo es un diccionario con
+    name, xml, assets (rutas originales) y dir.
+    """
+    assignments, orphans = assign_assets(xml_files, support_files)
+    base_dir = os.path.join(session_dir, ARTICLES_DIR)
+
+    articles = []
+    for xml_path in xml_files:
+        name = os.path.splitext(os.path.basename(xml_path))[0]
+        article_dir = os.path.join(base_dir, name)
+        if not os.path.exists(article_dir):
+            os.makedirs(article_dir)
+        for path in [xml_path] + assignments[xml_path]:
+            _place(path, os.path.join(article_dir, os.path.basename(path)))
+        articles.append({
+            'name': name,
+            'xml': xml_path,
+            'assets': assignments[xml_path],
+            'dir': article_dir
+        })
+    return articles, orphans
+
+
+def run_concurrently(func, items, workers):
+    """
+    Aplica `func` a cada elemento usando hasta `workers` hilos y devuelve los
+    resultados en el mismo orden. Una excepción en un elemento se devuelve
+    como resultado de ese elemento en lugar de interrumpir a los demás.
+    """
+    results = [None] * len(items)
+    pending = queue.Queue()
+    for index, item in enumerate(items):
+        pending.put((index, item))
+
+    def worker():
+        while True:
+            try:
+                index, item = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[index] = func(item)
+            except Exception as e:
+                logger.exception("Error procesando {!r}".format(item))
+                results[index] = e
+
+    threads = [threading.Thread(target=worker, name='article-worker-{}'.format(i))
+               for i in range(max(1, min(workers, len(items))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
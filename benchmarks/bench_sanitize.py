@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark y pruebas de propiedades del saneamiento de nombres de archivo.
+
+Sobre miles de nombres realistas en español y portugués (paquetes SciELO y
+nombres escritos a mano) verifica que sanitize_filename y
+sanitize_windows_path producen exactamente lo mismo que la implementación
+anterior, comprueba las propiedades de sanitize_upload_names (nombres
+únicos, seguros e idempotentes), compara la tasa de colisiones con el
+esquema que usaba validate_folder() y mide el rendimiento. Requiere
+Python 2.7, igual que la aplicación:
+
+    python benchmarks/bench_sanitize.py [--batches 200] [--seed 11]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_to_ascii import legacy_to_ascii
+from text_normalize import (MAX_UPLOAD_EXT_LENGTH, MAX_UPLOAD_STEM_LENGTH, sanitize_filename,
+                            sanitize_upload_names, sanitize_windows_path)
+
+
+# --- Implementaciones anteriores, como referencia ---------------------------
+
+def legacy_sanitize_filename(filename):
+    if filename is None:
+        return ""
+    ascii_name = legacy_to_ascii(filename)
+    safe_name = ''
+    for char in ascii_name:
+        if char.isalnum() or char in '._- ':
+            safe_name += char
+        else:
+            safe_name += '_'
+    safe_name = safe_name.strip()
+    if not safe_name:
+        safe_name = "file"
+    return safe_name
+
+
+def legacy_sanitize_windows_path(path):
+    if path is None:
+        return ""
+    invalid_chars = ['<', '>', ':', '"', '/', '\\', '|', '?', '*']
+    if not isinstance(path, (str, unicode)):
+        path = str(path)
+    if '/' in path:
+        parts = path.split('/')
+    elif '\\' in path:
+        parts = path.split('\\')
+    else:
+        parts = [path]
+    sanitized_parts = []
+    for part in parts:
+        if not part:
+            continue
+        part_ascii = legacy_to_ascii(part)
+        sanitized = ""
+        for char in part_ascii:
+            if char in invalid_chars:
+                sanitized += "_"
+            else:
+                sanitized += char
+        sanitized = sanitized.strip()
+        if not sanitized:
+            sanitized = "dir"
+        sanitized_parts.append(sanitized)
+    if sanitized_parts:
+        return os.path.join(*sanitized_parts)
+    return "dir"
+
+
+def legacy_folder_names(filenames):
+    """Esquema de nombres que usaba validate_folder()"""
+    names = []
+    for filename in filenames:
+        basename = os.path.basename(filename)
+        name, ext = os.path.splitext(basename)
+        ext = ext.lower()
+        safe_name = ''.join(c for c in name if c.isalnum())[:20] + ext
+        if not safe_name or safe_name == ext:
+            safe_name = "file{}_{}".format(len(names), ext)
+        names.append(safe_name)
+    return names
+
+
+# --- Generador de nombres realistas -----------------------------------------
+
+WORDS = [u'Art\xedculo', u'revisi\xf3n', u'versi\xf3n final', u'Figura', u'Tabla', u'anexo',
+         u'popula\xe7\xe3o', u'educa\xe7\xe3o', u'ni\xf1os', u'S\xe3o Paulo', u'Gr\xe1fica',
+         u'cap\xedtulo', u'ap\xeandice', u'Resumen', u'Resumo', u'Ilustraci\xf3n', u'mapa',
+         u'ac\xe7\xe3o', u'an\xe1lisis', u'copia de', u'(2)', u'[final]', u'#1', u'Ü\xdfung']
+SEPARATORS = [u' ', u'_', u'-', u'', u'  ', u'.']
+ACRONYMS = ['rmie', 'ia', 'rlp', 'cys', 'polis', 'rmcps']
+EXTENSIONS = ['.xml', '.pdf', '.jpg', '.tif', '.png', '.XML', '.JPG', '.Tiff', '.docx']
+
+
+def scielo_batch(rng):
+    issn = '{:04d}-{:04d}'.format(rng.randint(1000, 2999), rng.randint(1000, 9999))
+    prefix = '{}-{}-{}-{:02d}'.format(issn, rng.choice(ACRONYMS), rng.randint(1, 40), rng.randint(1, 4))
+    names = []
+    for article in range(rng.randint(5, 30)):
+        base = '{}-{:03d}'.format(prefix, article + 1)
+        names.append(base + '.xml')
+        names.append(base + '.pdf')
+        for fig in range(rng.randint(0, 12)):
+            names.append('{}-gf{}{}'.format(base, fig + 1, rng.choice(['.jpg', '.tif'])))
+        for table in range(rng.randint(0, 3)):
+            names.append('{}-gt{}.jpg'.format(base, table + 1))
+    return ['{}/{}'.format(prefix, name) for name in names]
+
+
+def human_batch(rng):
+    names = []
+    for _ in range(rng.randint(10, 120)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 5))]
+        name = rng.choice(SEPARATORS).join(words)
+        if rng.random() < 0.3:
+            name = name.upper() if rng.random() < 0.5 else name.lower()
+        if rng.random() < 0.2:
+            name += u' ' + u'x' * rng.randint(50, 120)
+        directory = rng.choice([u'', u'N\xfamero 3/', u'figuras/', u'Edi\xe7\xe3o\\imagens\\'])
+        names.append(directory + name + rng.choice(EXTENSIONS))
+    return names
+
+
+def make_batches(count, seed):
+    rng = random.Random(seed)
+    return [scielo_batch(rng) if rng.random() < 0.5 else human_batch(rng) for _ in range(count)]
+
+
+# --- Verificaciones ----------------------------------------------------------
+
+SAFE_NAME = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9._-]*$')
+RESERVED = re.compile(r'^(CON|PRN|AUX|NUL|COM[1-9]|LPT[1-9])(\.|$)', re.IGNORECASE)
+
+
+def check_equivalence(batches):
+    mismatches = 0
+    total = 0
+    for batch in batches:
+        for name in batch:
+            for new, old in ((sanitize_filename, legacy_sanitize_filename),
+                             (sanitize_windows_path, legacy_sanitize_windows_path)):
+                total += 1
+                if new(name) != old(name):
+                    mismatches += 1
+                    if mismatches <= 5:
+                        print('  DIFERENCIA {}: {!r} -> {!r} (esperado {!r})'.format(
+                            new.__name__, name, new(name), old(name)))
+    print('equivalencia: {} comparaciones, {} diferencias'.format(total, mismatches))
+    return mismatches
+
+
+def check_properties(batches):
+    failures = []
+
+    def fail(message, batch_index):
+        failures.append(message)
+        if len(failures) <= 5:
+            print('  FALLA (lote {}): {}'.format(batch_index, message))
+
+    for index, batch in enumerate(batches):
+        result = sanitize_upload_names(batch)
+        lowered = [name.lower() for name in result]
+        if len(result) != len(batch):
+            fail('cantidad de nombres distinta', index)
+        if len(set(lowered)) != len(lowered):
+            fail('nombres repetidos', index)
+        for original, name in zip(batch, result):
+            stem, ext = os.path.splitext(name)
+            if not SAFE_NAME.match(name):
+                fail('caracteres no seguros en {!r}'.format(name), index)
+            if RESERVED.match(name):
+                fail('nombre reservado de Windows {!r}'.format(name), index)
+            if len(stem) > MAX_UPLOAD_STEM_LENGTH + 4 or len(ext) > MAX_UPLOAD_EXT_LENGTH:
+                fail('nombre demasiado largo {!r}'.format(name), index)
+            basename = re.split(r'[\\/]', original)[-1]
+            if SAFE_NAME.match(basename) and basename == basename.lower() and name != basename \
+                    and basename.lower() not in lowered[:lowered.index(name.lower())]:
+                fail('se renombro un nombre ya seguro {!r} -> {!r}'.format(basename, name), index)
+        if sanitize_upload_names(result) != result:
+            fail('no es idempotente', index)
+
+    print('propiedades: {} lotes, {} fallas'.format(len(batches), len(failures)))
+    return len(failures)
+
+
+def collision_rate(batches):
+    for label, scheme in (('anterior', legacy_folder_names), ('nuevo', sanitize_upload_names)):
+        names = 0
+        collisions = 0
+        renamed = 0
+        for batch in batches:
+            result = scheme(batch)
+            names += len(result)
+            collisions += len(result) - len(set(name.lower() for name in result))
+            renamed += sum(1 for original, name in zip(batch, result)
+                           if re.split(r'[\\/]', original)[-1] != name)
+        print('  {:<9} colisiones {:5} de {} ({:.2%})   renombrados {:.2%}'.format(
+            label, collisions, names, float(collisions) / names, float(renamed) / names))
+
+
+def throughput(batches, repeat):
+    names = [name for batch in batches for name in batch]
+    for label, new, old in (('sanitize_filename', sanitize_filename, legacy_sanitize_filename),
+                            ('sanitize_windows_path', sanitize_windows_path, legacy_sanitize_windows_path)):
+        old_time = min(timeit.repeat(lambda: [old(name) for name in names], number=1, repeat=repeat))
+        new_time = min(timeit.repeat(lambda: [new(name) for name in names], number=1, repeat=repeat))
+        print('  {:<22} anterior {:9.0f}/s   nuevo {:9.0f}/s   {:5.1f}x'.format(
+            label, len(names) / old_time, len(names) / new_time, old_time / new_time))
+    batch_time = min(timeit.repeat(lambda: [sanitize_upload_names(batch) for batch in batches],
+                                   number=1, repeat=repeat))
+    print('  {:<22} {:9.0f} nombres/s'.format('sanitize_upload_names', len(names) / batch_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    if sys.version_info[0] != 2:
+        parser.error('la implementacion de referencia requiere Python 2.7')
+
+    batches = make_batches(args.batches, args.seed)
+    print('{} lotes, {} nombres'.format(len(batches), sum(len(batch) for batch in batches)))
+
+    mismatches = check_equivalence(batches)
+    failures = check_properties(batches)
+    print('colisiones por carga:')
+    collision_rate(batches)
+    print('rendimiento:')
+    throughput(batches, args.repeat)
+
+    sys.exit(1 if mismatches or failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark y verificación de equivalencia de text_normalize.to_ascii.
+
+Compara la implementación nueva con la anterior (copiada abajo como
+referencia) sobre miles de entradas aleatorias y mide el tiempo en textos del
+tamaño de un reporte del validador. Requiere Python 2.7, igual que la
+aplicación:
+
+    python benchmarks/bench_to_ascii.py [--cases 20000] [--size-mb 2]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from text_normalize import to_ascii
+
+
+def legacy_to_ascii(text):
+    """Implementación anterior de app.py, como referencia"""
+    if text is None:
+        return ""
+
+    if not isinstance(text, (str, unicode, bytes)):
+        try:
+            text = str(text)
+        except:
+            return repr(text)
+
+    try:
+        if isinstance(text, str):
+            for encoding in ['utf-8', 'latin-1', 'cp1252']:
+                try:
+                    text = text.decode(encoding, errors='replace')
+                    break
+                except:
+                    continue
+
+        if isinstance(text, unicode):
+            replacements = {
+                u'\xe1': 'a', u'\xe9': 'e', u'\xed': 'i', u'\xf3': 'o', u'\xfa': 'u',
+                u'\xc1': 'A', u'\xc9': 'E', u'\xcd': 'I', u'\xd3': 'O', u'\xda': 'U',
+                u'\xf1': 'n', u'\xd1': 'N', u'\xfc': 'u', u'\xdc': 'U',
+                u'\xbf': '?', u'\xa1': '!', u'\xe7': 'c', u'\xc7': 'C'
+            }
+
+            for char, replacement in replacements.items():
+                text = text.replace(char, replacement)
+
+            return text.encode('ascii', errors='replace')
+    except:
+        pass
+
+    try:
+        result = ''
+        for char in str(text):
+            if ord(char) < 128:
+                result += char
+            else:
+                result += '_'
+        return result
+    except:
+        return repr(text)
+
+
+# Alfabeto de prueba: ASCII, español, portugués, tipografía y otros scripts
+ALPHABET = (u'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 .,;:-_/<>\n\t'
+            u'\xe1\xe9\xed\xf3\xfa\xc1\xc9\xcd\xd3\xda\xf1\xd1\xfc\xdc\xbf\xa1\xe7\xc7'
+            u'\xe3\xf5\xe2\xea\xf4\xe0\xc3\xd5\xc2\xca'
+            u'€“”—’\xb0\xaa\xba�中Ж')
+
+
+def random_case(rng):
+    text = u''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 80)))
+    kind = rng.randint(0, 5)
+    if kind == 0:
+        return text
+    if kind == 1:
+        return text.encode('utf-8')
+    if kind == 2:
+        # Bytes que no son UTF-8 válido
+        return text.encode('latin-1', 'replace')
+    if kind == 3:
+        return text.encode('ascii', 'ignore')
+    if kind == 4:
+        return rng.choice([None, 42, 3.5, True, ['lista'], ValueError('x'), (1, 2)])
+    return text.encode('utf-8')[:rng.randint(0, 20)]
+
+
+def check_equivalence(cases, seed):
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(cases):
+        value = random_case(rng)
+        expected = legacy_to_ascii(value)
+        got = to_ascii(value)
+        if got != expected or type(got) is not type(expected):
+            mismatches += 1
+            if mismatches <= 5:
+                print('  DIFERENCIA: {!r} -> {!r} (esperado {!r})'.format(value, got, expected))
+    print('equivalencia: {} casos, {} diferencias'.format(cases, mismatches))
+    return mismatches
+
+
+def bench(label, value, repeat):
+    old = min(timeit.repeat(lambda: legacy_to_ascii(value), number=1, repeat=repeat))
+    new = min(timeit.repeat(lambda: to_ascii(value), number=1, repeat=repeat))
+    print('  {:<28} anterior {:8.2f} ms   nuevo {:8.2f} ms   {:6.1f}x'.format(
+        label, old * 1000, new * 1000, old / new if new else float('inf')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', type=int, default=20000)
+    parser.add_argument('--size-mb', type=float, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    if sys.version_info[0] != 2:
+        parser.error('la implementacion de referencia requiere Python 2.7')
+
+    mismatches = check_equivalence(args.cases, args.seed)
+
+    rng = random.Random(args.seed)
+    size = int(args.size_mb * 1024 * 1024)
+    line = u'ERROR linea 12: el elemento <contrib> no es valido en la seccion\n'
+    ascii_report = (line * (size // len(line) + 1))[:size].encode('ascii')
+    spanish = u''.join(rng.choice(ALPHABET[:120]) for _ in range(size))
+    print('tiempos ({} MB):'.format(args.size_mb))
+    bench('reporte ASCII (bytes)', ascii_report, args.repeat)
+    bench('texto con acentos (bytes)', spanish.encode('utf-8'), args.repeat)
+    bench('texto con acentos (unicode)', spanish, args.repeat)
+    small = [u'Jos\xe9 Mar\xeda', 'valor', u'S\xe3o Paulo', 'ok'] * 5000
+    old = min(timeit.repeat(lambda: [legacy_to_ascii(v) for v in small], number=1, repeat=args.repeat))
+    new = min(timeit.repeat(lambda: [to_ascii(v) for v in small], number=1, repeat=args.repeat))
+    print('  {:<28} anterior {:8.2f} ms   nuevo {:8.2f} ms   {:6.1f}x'.format(
+        '20000 cadenas cortas', old * 1000, new * 1000, old / new))
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Hallazgos estructurados de la salida de xml_package_maker.
+
+Convierte la salida del validador (stdout, stderr, los .report.txt y los
+reportes HTML) en registros con artículo, archivo, línea, severidad, regla y
+mensaje. El éxito de una validación y los conteos de errores salen de estos
+registros en lugar de buscar 'ERROR' en el texto completo.
+
+Se reconocen:
+- errores de libxml2 / DTD: archivo.xml:12:0:ERROR:VALID:DTD_UNKNOWN_ELEM: ...
+  (también con rutas de Windows, C:\\scielo\\...\\archivo.xml:12:3: ERROR: ...);
+- líneas con etiqueta: FATAL ERROR: ..., ERROR: ..., WARNING: ..., AVISO: ...
+- elementos HTML con clase fatalerror / error / warning;
+- excepciones de Python al final de un traceback (fatales);
+- cualquier otra línea con ERROR o FATAL (regla 'unrecognized').
+
+Los errores de font-family (estilos en línea que el validador rechaza pero
+que no afectan la estructura) se registran como avisos con la regla
+'font-family'.
+"""
+import json
+import re
+
+try:
+    from html import unescape as _unescape
+except ImportError:  # Python 2
+    from HTMLParser import HTMLParser
+    _unescape = HTMLParser().unescape
+
+from text_normalize import to_ascii
+
+FATAL = 'fatal'
+ERROR = 'error'
+WARNING = 'warning'
+INFO = 'info'
+
+SEVERITIES = (FATAL, ERROR, WARNING, INFO)
+
+FONT_FAMILY_RULE = 'font-family'
+
+# Archivo con los hallazgos de una sesión, junto a su reporte
+FINDINGS_SUFFIX = '.findings.json'
+
+# Longitud máxima de un mensaje guardado
+MAX_MESSAGE = 500
+
+_LABELS = {
+    'fatal error': FATAL, 'fatal': FATAL, 'erro fatal': FATAL, 'error fatal': FATAL,
+    'error': ERROR, 'erro': ERROR, 'errors': ERROR,
+    'warning': WARNING, 'warnings': WARNING, 'aviso': WARNING, 'advertencia': WARNING,
+    'info': INFO, 'note': INFO
+}
+
+# La ruta puede empezar con una unidad de Windows (C:\scielo\...\a1.xml:12:3:...)
+_LIBXML = re.compile(
+    r'^(?P<file>(?:[A-Za-z]:)?[^:\s][^:]*?):(?P<line>\d+):(?:(?P<col>\d+):)?\s*(?P<level>FATAL|ERROR|WARNING)\s*:'
+    r'(?:(?P<domain>[A-Z]\w*):(?P<type>[A-Z]\w*):)?\s*(?P<message>.*)$')
+
+# La etiqueta va seguida de ':' o ']', o de un guion entre espacios: un guion
+# pegado es parte de otra palabra ("Error-free", "Warning-level")
+_LABELLED = re.compile(
+    r'^\W{0,3}(?P<label>fatal error|error fatal|erro fatal|fatal|errors?|erro|warnings?|aviso|advertencia|info|note)'
+    r'(?:\s*[:\]]|\s+-\s)\s*(?P<message>.+)$', re.IGNORECASE)
+
+# ERROR o FATAL en una línea que ningún patrón reconoce: no se descarta
+_UNRECOGNIZED = re.compile(r'\b(?P<level>FATAL|ERROR)\b(?P<rest>.*)$')
+
+_EXCEPTION = re.compile(r'^(?P<type>[A-Za-z_][\w.]*(?:Error|Exception)):\s*(?P<message>.*)$')
+
+_LINE_NUMBER = re.compile(r'\b(?:line|linha|l[ií]nea)\s*:?\s*(\d+)', re.IGNORECASE)
+
+_XML_FILE = re.compile(r'([\w.-]+\.xml)\b', re.IGNORECASE)
+
+# Resúmenes como "Fatal: 0" o "Total of errors = 3": no son hallazgos
+_COUNT_ONLY = re.compile(r'^\s*[=:]?\s*\d+\s*$')
+
+_HTML_CLASS = re.compile(
+    r'<(?:p|div|span|li|td|tr)\b[^>]*class\s*=\s*["\'][^"\']*\b(fatalerror|fatal|error|warning)\b[^"\']*["\'][^>]*>',
+    re.IGNORECASE)
+_HTML_BREAK = re.compile(r'<\s*(?:br|/p|/div|/li|/tr|/h[1-6]|/pre|/table)\b[^>]*>', re.IGNORECASE)
+_HTML_CELL = re.compile(r'<\s*/t[dh]\s*>', re.IGNORECASE)
+_HTML_DROP = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_HTML_TAG = re.compile(r'<[^>]+>')
+
+_RULE_NOISE = re.compile(r'''("[^"]*"|'[^']*'|\d+)''')
+_RULE_CHARS = re.compile(r'[^a-z]+')
+
+
+def _rule_of(message):
+    # Las primeras palabras del mensaje sin valores concretos (comillas,
+    # números y referencias de línea): agrupa los mensajes del mismo tipo
+    if 'font-family' in message.lower():
+        return FONT_FAMILY_RULE
+    words = _RULE_CHARS.sub(' ', _RULE_NOISE.sub(' ', _LINE_NUMBER.sub(' ', message.lower()))).split()
+    return '-'.join(words[:5]) or 'unknown'
+
+
+def finding(severity, message, rule=None, article=None, file_name=None, line=None):
+    """Un hallazgo; si no se indican, la línea y el archivo se toman del mensaje"""
+    message = message.strip()
+    if line is None:
+        match = _LINE_NUMBER.search(message)
+        if match:
+            line = int(match.group(1))
+    if file_name is None:
+        match = _XML_FILE.search(message)
+        if match:
+            file_name = match.group(1)
+    rule = rule or _rule_of(message)
+    if rule == FONT_FAMILY_RULE and severity in (FATAL, ERROR):
+        severity = WARNING
+    finding = {'severity': severity, 'rule': rule, 'message': message[:MAX_MESSAGE]}
+    if article:
+        finding['article'] = article
+    if file_name:
+        finding['file'] = file_name
+    if line is not None:
+        finding['line'] = line
+    return finding
+
+
+def parse_text(text, article=None, file_name=None):
+    """
+    Hallazgos de un texto de salida o de un .report.txt. Casos que deciden
+    el resultado de una validación (python -m doctest findings.py):
+
+    >>> [item['severity'] for item in parse_text('ERROR: Required element')]
+    ['error']
+    >>> [item['severity'] for item in parse_text('[FATAL ERROR] no DTD')]
+    ['fatal']
+    >>> [item['severity'] for item in parse_text('Warning - missing label')]
+    ['warning']
+    >>> parse_text('Error-free validation of a.xml')
+    []
+    >>> parse_text('Warning-level checks skipped')
+    []
+    >>> parse_text('Fatal: 0')
+    []
+    >>> found = parse_text(r'C:\\scielo\\serial\\a1.xml:12:3: ERROR: No declaration for element x')
+    >>> [(item['severity'], item['file'], item['line']) for item in found]
+    [('error', 'a1.xml', 12)]
+    >>> [item['rule'] for item in parse_text(r'C:\\scielo\\a1.xml:7:0:ERROR:VALID:DTD_UNKNOWN_ELEM: x')]
+    ['dtd_unknown_elem']
+    >>> [(item['severity'], item['rule']) for item in parse_text('xpm ERROR while loading DTD')]
+    [('error', 'unrecognized')]
+    >>> [item['rule'] for item in parse_text('ERROR: font-family not allowed')]
+    ['font-family']
+    >>> has_errors(parse_text('ERROR: font-family not allowed'))
+    False
+    """
+    text = to_ascii(text)
+    findings = []
+    current_file = file_name
+    in_traceback = False
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        match = _LIBXML.match(line)
+        if match:
+            findings.append(finding(
+                _LABELS[match.group('level').lower()], match.group('message'),
+                rule=(match.group('type') or '').lower() or None, article=article,
+                file_name=match.group('file').split('/')[-1].split('\\')[-1],
+                line=int(match.group('line'))))
+            continue
+
+        if line.startswith('Traceback (most recent call last)'):
+            in_traceback = True
+            continue
+        match = _EXCEPTION.match(line)
+        if match and (in_traceback or raw_line == line):
+            in_traceback = False
+            findings.append(finding(FATAL, line, rule=match.group('type').split('.')[-1].lower(),
+                                     article=article, file_name=current_file))
+            continue
+        if in_traceback:
+            continue
+
+        match = _LABELLED.match(line)
+        if match:
+            message = match.group('message')
+            # Etiqueta repetida ("ERROR: ERROR: ...") por la clase HTML y el texto
+            repeated = _LABELLED.match(message)
+            if repeated:
+                message = repeated.group('message')
+            if _COUNT_ONLY.match(message):
+                continue
+            findings.append(finding(_LABELS[match.group('label').lower()], message,
+                                     article=article, file_name=current_file))
+            continue
+
+        # Un ERROR o FATAL sin formato conocido cuenta como error: sin esto
+        # una salida que no se reconoce daría el artículo por válido
+        match = _UNRECOGNIZED.search(line)
+        if match and not _COUNT_ONLY.match(match.group('rest')):
+            findings.append(finding(_LABELS[match.group('level').lower()], line, rule='unrecognized',
+                                     article=article, file_name=current_file))
+            continue
+
+        # Una línea que nombra un XML indica el archivo de los hallazgos siguientes
+        match = _XML_FILE.search(line)
+        if match:
+            current_file = match.group(1)
+    return findings
+
+
+def html_text(data):
+    """Texto de un reporte HTML, una línea por bloque, con las clases de severidad como etiquetas"""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', 'replace')
+    data = _HTML_DROP.sub('', data)
+    data = _HTML_CLASS.sub(lambda match: '\n{}: '.format(match.group(1).replace('fatalerror', 'fatal error')), data)
+    data = _HTML_BREAK.sub('\n', data)
+    data = _HTML_CELL.sub(' ', data)
+    return _unescape(_HTML_TAG.sub('', data))
+
+
+def parse_html(data, article=None, file_name=None):
+    """Hallazgos de un reporte HTML de xml_package_maker"""
+    return parse_text(html_text(data), article, file_name)
+
+
+def merge(*groups):
+    """Une listas de hallazgos sin repetir los que aparecen en varias salidas"""
+    seen = set()
+    merged = []
+    for group in groups:
+        for finding in group:
+            key = (finding.get('article'), finding.get('file'), finding.get('line'),
+                   finding['severity'], finding['message'])
+            if key not in seen:
+                seen.add(key)
+                merged.append(finding)
+    return merged
+
+
+def counts(findings):
+    """Cantidad de hallazgos por severidad"""
+    result = dict((severity, 0) for severity in SEVERITIES)
+    for finding in findings:
+        result[finding['severity']] += 1
+    return result
+
+
+def has_errors(findings):
+    return any(finding['severity'] in (FATAL, ERROR) for finding in findings)
+
+
+def dumps(findings):
+    """JSON compacto (bytes ASCII) de una lista de hallazgos"""
+    return json.dumps(findings, separators=(',', ':'), sort_keys=True).encode('ascii')
+
+
+def loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
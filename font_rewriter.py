@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Reescritura de los términos de estilo de fuente que rompen el validador.
+
+Todos los términos se buscan con una sola expresión regular precompilada que
+no distingue mayúsculas, de modo que el documento se recorre una sola vez.
+El reemplazo conserva la forma del original: en mayúsculas si el término
+estaba en mayúsculas, capitalizado si empezaba con mayúscula y en minúsculas
+en cualquier otro caso.
+"""
+import os
+import re
+
+# Términos que el validador rechaza y su reemplazo
+FONT_TERM_REPLACEMENTS = {
+    'font-family': 'data-fontname',
+    'font family': 'data-fontname',
+    'fontfamily': 'data-fontname',
+    'font-familias': 'data-fontname',
+    'font-face': 'data-fontface',
+    'fontface': 'data-fontface',
+    'font-style': 'data-fontstyle',
+    'font-weight': 'data-fontweight',
+    'font-size': 'data-fontsize'
+}
+
+
+class FontTermRewriter(object):
+    """
+    Reemplaza un conjunto de términos en una sola pasada y cuenta cuántas
+    veces aparece cada uno.
+    """
+
+    def __init__(self, replacements=None):
+        if replacements is None:
+            replacements = FONT_TERM_REPLACEMENTS
+        self.replacements = dict((term.lower(), value) for term, value in replacements.items())
+        # Los términos más largos primero, para que 'font-familias' gane a 'font-family'
+        terms = sorted(self.replacements, key=len, reverse=True)
+        # Factorizar el prefijo común ('font') abarata cada intento de coincidencia
+        prefix = os.path.commonprefix(terms)
+        self._pattern = re.compile(u'{}(?:{})'.format(
+            re.escape(prefix), u'|'.join(re.escape(term[len(prefix):]) for term in terms)), re.IGNORECASE)
+        # Caracteres que pueden formar parte de un término
+        self.term_chars = frozenset(u''.join(terms).lower() + u''.join(terms).upper())
+
+    def rewrite(self, text, hits=None):
+        """
+        Devuelve `text` con los términos reemplazados. Si se pasa `hits`, se
+        suma en él el número de apariciones de cada término.
+        """
+        replacements = self.replacements
+
+        def replace(match):
+            found = match.group(0)
+            term = found.lower()
+            if hits is not None:
+                hits[term] = hits.get(term, 0) + 1
+            replacement = replacements[term]
+            if found.isupper():
+                return replacement.upper()
+            if found[0].isupper():
+                return replacement.capitalize()
+            return replacement
+
+        return self._pattern.sub(replace, text)
+
+
+_default_rewriter = FontTermRewriter()
+TERM_CHARS = _default_rewriter.term_chars
+
+
+def rewrite_font_terms(text, hits=None):
+    """Reescribe los términos de fuente con el conjunto de términos por omisión"""
+    return _default_rewriter.rewrite(text, hits)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Ingesta de archivos subidos en una sola pasada.
+
+Cada archivo se copia al directorio de la sesión por bloques. En la misma
+pasada se calcula su SHA-256, se detecta la codificación de los archivos de
+texto y se reescriben los términos de estilo de fuente que rompen el
+validador, de modo que la memoria usada no depende del tamaño del archivo.
+"""
+import codecs
+import hashlib
+import re
+import time
+
+from font_rewriter import TERM_CHARS, rewrite_font_terms
+
+# Archivos de texto en los que se reescriben los términos de fuente
+TEXT_EXTENSIONS = ('.xml', '.html', '.htm', '.css', '.xsl', '.xslt', '.svg', '.txt')
+
+CHUNK_SIZE = 64 * 1024
+
+# Si no aparece un punto de corte seguro, se procesa el texto pendiente
+# de todos modos al superar este tamaño (en caracteres)
+MAX_PENDING = 1024 * 1024
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# encoding="..." en la declaración XML o charset=... en HTML/CSS
+_DECLARED_ENCODING = re.compile(br'''(?:encoding|charset)\s*=\s*["']?([A-Za-z0-9._:-]+)''')
+
+
+def sniff_encoding(head):
+    """
+    Detecta la codificación a partir de los primeros bytes: BOM, declaración
+    XML o charset de HTML/CSS. Por omisión se usa UTF-8.
+    """
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+
+    match = _DECLARED_ENCODING.search(head[:1024])
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+class _HashingWriter(object):
+    """Escribe en un archivo calculando el SHA-256 y el tamaño de lo escrito"""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        if data:
+            self._f.write(data)
+            self.sha256.update(data)
+            self.size += len(data)
+
+
+def _safe_cut(text):
+    # Posición tras el último carácter que no puede formar parte de un término
+    i = len(text)
+    while i > 0:
+        if text[i - 1] not in TERM_CHARS:
+            return i
+        i -= 1
+    return len(text) if len(text) > MAX_PENDING else 0
+
+
+def _copy_binary(stream, writer, chunk):
+    while chunk:
+        writer.write(chunk)
+        chunk = stream.read(CHUNK_SIZE)
+
+
+def _copy_text(stream, writer, chunk, encoding, hits):
+    # Decodificar y codificar de forma incremental con la misma codificación;
+    # los caracteres inválidos se reemplazan igual que antes. Devuelve los
+    # segundos dedicados a reescribir términos de fuente.
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    encoder = codecs.getincrementalencoder(encoding)(errors='xmlcharrefreplace')
+    pending = u''
+    rewrite_time = 0.0
+
+    while chunk:
+        pending += decoder.decode(chunk)
+        cut = _safe_cut(pending)
+        if cut:
+            start = time.time()
+            text = rewrite_font_terms(pending[:cut], hits)
+            rewrite_time += time.time() - start
+            writer.write(encoder.encode(text))
+            pending = pending[cut:]
+        chunk = stream.read(CHUNK_SIZE)
+
+    pending += decoder.decode(b'', True)
+    start = time.time()
+    text = rewrite_font_terms(pending, hits)
+    rewrite_time += time.time() - start
+    writer.write(encoder.encode(text, True))
+    return rewrite_time
+
+
+def ingest_file(stream, dest_path, rewrite=True):
+    """
+    Copia `stream` a `dest_path` en una sola pasada.
+
+    Si `rewrite` es verdadero y la extensión es de texto, se reescriben los
+    términos de fuente conservando la codificación detectada. Devuelve un
+    diccionario con 'path', 'size', 'sha256', 'encoding', 'font_terms'
+    (apariciones reemplazadas de cada término) y 'rewrite_time' (segundos
+    dedicados a la reescritura).
+    """
+    is_text = rewrite and dest_path.lower().endswith(TEXT_EXTENSIONS)
+    encoding = None
+    font_terms = {}
+    rewrite_time = 0.0
+
+    with open(dest_path, 'wb') as f:
+        writer = _HashingWriter(f)
+        first_chunk = stream.read(CHUNK_SIZE)
+        if is_text:
+            # Asegurar suficientes bytes para ver la declaración de codificación
+            while 0 < len(first_chunk) < 1024:
+                more = stream.read(CHUNK_SIZE)
+                if not more:
+                    break
+                first_chunk += more
+            encoding = sniff_encoding(first_chunk)
+            rewrite_time = _copy_text(stream, writer, first_chunk, encoding, font_terms)
+        else:
+            _copy_binary(stream, writer, first_chunk)
+
+    return {
+        'path': dest_path,
+        'size': writer.size,
+        'sha256': writer.sha256.hexdigest(),
+        'encoding': encoding,
+        'font_terms': font_terms,
+        'rewrite_time': rewrite_time
+    }
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Limpieza periódica de TEMP_DIR.
+
+Cada sesión ocupa en TEMP_DIR su carpeta (<sesión>/) y los reportes
+publicados a su lado (<sesión>.txt.gz, <sesión>.html.gz, <sesión>_pre.txt,
+y los .txt/.html de versiones anteriores). Un hilo en segundo plano recorre
+TEMP_DIR cada `interval` segundos y:
+
+- elimina las sesiones creadas hace más de `max_age` segundos;
+- si el total sigue superando `max_bytes`, elimina las sesiones usadas hace
+  más tiempo (LRU) hasta volver a la cuota.
+
+Las sesiones retenidas con hold() (una validación o un trabajo en curso)
+nunca se eliminan. El último acceso de una sesión es la última vez que se
+sirvió uno de sus reportes (touch()) o, si no se sirvió desde el arranque,
+su última modificación. on_evict, si se indica, recibe la lista de
+sesiones eliminadas en cada pasada.
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+logger = logging.getLogger('scielo_validator')
+
+# Sufijos de los archivos de una sesión publicados en TEMP_DIR
+SESSION_SUFFIXES = ('.findings.json.gz', '.txt.gz', '.html.gz', '_pre.txt', '.txt', '.html')
+
+# Restos de escrituras atómicas (<destino>.tmp-<hex>)
+_TMP_SUFFIX = re.compile(r'\.tmp-[0-9a-f]+$')
+
+
+def session_of(name):
+    """ID de sesión al que pertenece una entrada de TEMP_DIR"""
+    name = _TMP_SUFFIX.sub('', name)
+    for suffix in SESSION_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def _size_and_times(path):
+    """(bytes, mtime más viejo, mtime más nuevo) de un archivo o carpeta"""
+    if not os.path.isdir(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime, st.st_mtime
+    st = os.stat(path)
+    total, oldest, newest = 0, st.st_mtime, st.st_mtime
+    for root, dirs, files in os.walk(path):
+        for file_name in files:
+            try:
+                st = os.stat(os.path.join(root, file_name))
+            except OSError:
+                continue
+            total += st.st_size
+            oldest = min(oldest, st.st_mtime)
+            newest = max(newest, st.st_mtime)
+    return total, oldest, newest
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+class Janitor(object):
+    """Cuota de bytes y edad máxima de las sesiones de TEMP_DIR"""
+
+    def __init__(self, temp_dir, max_bytes, max_age, interval, on_evict=None):
+        self.temp_dir = temp_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._held = {}
+        self._accessed = {}
+        self._tasks = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.sweeps = 0
+        self.removed_sessions = 0
+        self.reclaimed_bytes = 0
+        self.last_sweep = None
+
+    def hold(self, session_id):
+        """Impide eliminar la sesión hasta el release() correspondiente"""
+        with self._lock:
+            self._held[session_id] = self._held.get(session_id, 0) + 1
+
+    def release(self, session_id):
+        with self._lock:
+            count = self._held.get(session_id, 0) - 1
+            if count > 0:
+                self._held[session_id] = count
+            else:
+                self._held.pop(session_id, None)
+            self._accessed[session_id] = time.time()
+
+    def touch(self, session_id):
+        """Registra que se sirvió un reporte de la sesión"""
+        with self._lock:
+            self._accessed[session_id] = time.time()
+
+    def add_task(self, task):
+        """Agrega una función que se ejecuta después de cada limpieza"""
+        self._tasks.append(task)
+
+    def _sessions(self):
+        sessions = {}
+        for name in os.listdir(self.temp_dir):
+            path = os.path.join(self.temp_dir, name)
+            try:
+                size, oldest, newest = _size_and_times(path)
+            except OSError:
+                continue
+            session = sessions.setdefault(session_of(name), {
+                'paths': [], 'bytes': 0, 'created': oldest, 'modified': newest})
+            session['paths'].append(path)
+            session['bytes'] += size
+            session['created'] = min(session['created'], oldest)
+            session['modified'] = max(session['modified'], newest)
+        return sessions
+
+    def _evict(self, session_id, session):
+        with self._lock:
+            if session_id in self._held:
+                return False
+            self._accessed.pop(session_id, None)
+        for path in session['paths']:
+            try:
+                _remove(path)
+            except OSError as e:
+                # En Windows falla si el archivo está abierto; se reintenta en la próxima pasada
+                logger.warning("Could not remove {}: {}".format(path, e))
+        return True
+
+    def sweep(self):
+        """
+        Una pasada de limpieza. Devuelve un resumen con las sesiones
+        eliminadas, los bytes recuperados y el total que queda.
+        """
+        start = time.time()
+        if not os.path.isdir(self.temp_dir):
+            return {'removed': [], 'reclaimed_bytes': 0, 'total_bytes': 0, 'sessions': 0}
+        sessions = self._sessions()
+        with self._lock:
+            held = set(self._held)
+            accessed = dict(self._accessed)
+        for session_id, session in sessions.items():
+            session['accessed'] = max(session['modified'], accessed.get(session_id, 0))
+
+        total_bytes = sum(session['bytes'] for session in sessions.values())
+        removed = []
+        reclaimed = 0
+        # Primero las vencidas, luego las usadas hace más tiempo
+        candidates = sorted((session_id for session_id in sessions if session_id not in held),
+                            key=lambda session_id: (start - sessions[session_id]['created'] <= self.max_age,
+                                                    sessions[session_id]['accessed']))
+        for session_id in candidates:
+            session = sessions[session_id]
+            expired = start - session['created'] > self.max_age
+            if not expired and total_bytes <= self.max_bytes:
+                break
+            if self._evict(session_id, session):
+                removed.append(session_id)
+                reclaimed += session['bytes']
+                total_bytes -= session['bytes']
+
+        with self._lock:
+            self.sweeps += 1
+            self.removed_sessions += len(removed)
+            self.reclaimed_bytes += reclaimed
+            self.last_sweep = {
+                'time': start,
+                'duration': round(time.time() - start, 3),
+                'sessions': len(sessions) - len(removed),
+                'removed': len(removed),
+                'reclaimed_bytes': reclaimed,
+                'total_bytes': total_bytes
+            }
+        if removed and self.on_evict is not None:
+            self.on_evict(removed)
+        if removed or total_bytes > self.max_bytes:
+            logger.info("Janitor removed {} sessions, reclaimed {} bytes, {} bytes in use (quota {})".format(
+                len(removed), reclaimed, total_bytes, self.max_bytes))
+        return {'removed': removed, 'reclaimed_bytes': reclaimed, 'total_bytes': total_bytes,
+                'sessions': len(sessions) - len(removed)}
+
+    def _run_tasks(self):
+        for task in self._tasks:
+            try:
+                task()
+            except Exception:
+                logger.exception("Janitor task failed")
+
+    def _loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Janitor sweep failed")
+            self._run_tasks()
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        """Lanza el hilo de limpieza (la primera pasada es inmediata)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='janitor')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        with self._lock:
+            return {
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+                'interval': self.interval,
+                'held_sessions': len(self._held),
+                'sweeps': self.sweeps,
+                'removed_sessions': self.removed_sessions,
+                'reclaimed_bytes': self.reclaimed_bytes,
+                'last_sweep': self.last_sweep
+            }
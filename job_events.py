@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Eventos de un trabajo en segundo plano (etapas, salida del validador,
+artículos terminados) para transmitirlos con Server-Sent Events.
+
+Cada trabajo tiene un EventLog: una cola acotada de eventos numerados. Los
+clientes piden los eventos posteriores al último que recibieron, de modo que
+un cliente que se reconecta (Last-Event-ID) continúa donde quedó mientras
+los eventos sigan en la cola.
+"""
+import json
+import threading
+from collections import deque
+
+# Eventos que se conservan por trabajo; las salidas muy largas pierden las
+# líneas más viejas, no las nuevas
+MAX_EVENTS = 2000
+
+# Caracteres que se envían de cada línea de salida
+MAX_LINE = 1000
+
+
+class EventLog(object):
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self._events = deque(maxlen=max_events)
+        self._cond = threading.Condition()
+        self._next_id = 1
+        self.closed = False
+
+    def publish(self, event, data):
+        with self._cond:
+            self._events.append((self._next_id, event, data))
+            self._next_id += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """Marca el final del trabajo: no habrá más eventos"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def since(self, last_id, timeout=None):
+        """
+        Eventos con ID mayor que `last_id`. Si no hay ninguno y el trabajo
+        sigue abierto, espera hasta `timeout` segundos a que llegue alguno.
+        """
+        with self._cond:
+            if not self.closed and (not self._events or self._events[-1][0] <= last_id):
+                self._cond.wait(timeout)
+            return [item for item in self._events if item[0] > last_id]
+
+
+def format_sse(event_id, event, data):
+    """Un evento en el formato de text/event-stream"""
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(event_id, event, json.dumps(data))
+
+
+def output_line(line):
+    """Línea de salida del validador lista para enviar"""
+    line = line.rstrip('\r\n')
+    if len(line) > MAX_LINE:
+        line = line[:MAX_LINE] + '...'
+    return line
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Límites de recursos de las ejecuciones del validador.
+
+LimitPolicy calcula los límites de tiempo real, tiempo de CPU y memoria de
+una ejecución según el tamaño del paquete, y el presupuesto total de un
+trabajo de carpeta según su tamaño y cantidad de artículos.
+
+Cómo se aplican:
+- tiempo real: process_runner vigila el reloj y termina el proceso;
+- CPU y memoria: con psutil (opcional) se muestrea el árbol de procesos en
+  cada sondeo. Sin psutil, en POSIX el comando se lanza a través de
+  rlimit_exec.py, que fija RLIMIT_CPU y RLIMIT_AS antes de ejecutarlo; en
+  Windows sin psutil solo se aplica el tiempo real.
+
+Al superar un límite se termina el árbol completo del proceso (el validador
+puede lanzar otros procesos), no solo el proceso directo.
+"""
+import os
+import signal
+import subprocess
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MB = 1024 * 1024
+
+RLIMIT_EXEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rlimit_exec.py')
+
+# Valores de 'limit' en el uso informado
+WALL = 'wall'
+CPU = 'cpu'
+MEMORY = 'memory'
+
+LIMIT_MESSAGES = {
+    WALL: 'tiempo de espera agotado',
+    CPU: 'limite de tiempo de CPU superado',
+    MEMORY: 'limite de memoria superado'
+}
+
+
+class LimitPolicy(object):
+    """
+    Límites escalados por tamaño:
+
+        tiempo real = wall_base + wall_per_mb * MB (hasta wall_max)
+        CPU         = tiempo real * cpu_ratio
+        memoria     = memory_base + memory_per_mb * MB (hasta memory_max)
+    """
+
+    def __init__(self, wall_base, wall_per_mb, wall_max, cpu_ratio,
+                 memory_base, memory_per_mb, memory_max, job_per_article):
+        self.wall_base = wall_base
+        self.wall_per_mb = wall_per_mb
+        self.wall_max = wall_max
+        self.cpu_ratio = cpu_ratio
+        self.memory_base = memory_base
+        self.memory_per_mb = memory_per_mb
+        self.memory_max = memory_max
+        self.job_per_article = job_per_article
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """
+        Política configurada con las variables SCIELO_LIMIT_* (las mismas
+        para el servidor y para validate_cli.py)
+        """
+        env = os.environ if environ is None else environ
+        return cls(float(env.get('SCIELO_LIMIT_WALL_BASE', '120')),
+                   float(env.get('SCIELO_LIMIT_WALL_PER_MB', '15')),
+                   float(env.get('SCIELO_LIMIT_WALL_MAX', '1800')),
+                   float(env.get('SCIELO_LIMIT_CPU_RATIO', '1.0')),
+                   int(env.get('SCIELO_LIMIT_MEMORY_MB', '1024')) * MB,
+                   int(env.get('SCIELO_LIMIT_MEMORY_PER_MB', '20')),
+                   int(env.get('SCIELO_LIMIT_MEMORY_MAX_MB', '4096')) * MB,
+                   float(env.get('SCIELO_LIMIT_JOB_PER_ARTICLE', '120')))
+
+    def settings(self):
+        return {
+            'wall_base': self.wall_base,
+            'wall_per_mb': self.wall_per_mb,
+            'wall_max': self.wall_max,
+            'cpu_ratio': self.cpu_ratio,
+            'memory_base': self.memory_base,
+            'memory_per_mb': self.memory_per_mb,
+            'memory_max': self.memory_max,
+            'job_per_article': self.job_per_article
+        }
+
+    def for_package(self, package_bytes):
+        """Límites de una ejecución sobre un paquete de `package_bytes` bytes"""
+        size_mb = float(package_bytes) / MB
+        wall = min(self.wall_base + self.wall_per_mb * size_mb, self.wall_max)
+        memory = min(self.memory_base + self.memory_per_mb * size_mb * MB, self.memory_max)
+        return {
+            'wall': round(wall, 1),
+            'cpu': round(wall * self.cpu_ratio, 1) if self.cpu_ratio else None,
+            'memory': int(memory) if memory else None
+        }
+
+    def job_budget(self, package_bytes, articles, slots):
+        """
+        Tiempo real total de un trabajo de carpeta: cada artículo tiene su
+        propio límite, pero el trabajo completo no puede superar este
+        presupuesto (los artículos se reparten entre `slots` procesos).
+        """
+        size_mb = float(package_bytes) / MB
+        rounds = (articles + slots - 1) // max(1, slots)
+        return round(self.wall_base + self.wall_per_mb * size_mb + self.job_per_article * rounds, 1)
+
+    def enforcement(self):
+        """Cómo se aplican los límites de CPU y memoria en este servidor"""
+        if psutil is not None:
+            return 'psutil'
+        if resource is not None:
+            return 'rlimit'
+        return 'wall-only'
+
+
+def limited_command(cmd, limits):
+    """
+    `cmd` envuelto en rlimit_exec.py si los límites de CPU y memoria se
+    aplican con rlimits (POSIX sin psutil); si no, `cmd` tal cual.
+    """
+    if psutil is not None or resource is None or not limits:
+        return cmd
+    cpu = int(limits.get('cpu') or 0)
+    memory = int(limits.get('memory') or 0)
+    if not cpu and not memory:
+        return cmd
+    return [sys.executable, RLIMIT_EXEC, str(cpu), str(memory), '--'] + list(cmd)
+
+
+def popen_options(limits):
+    """
+    Argumentos extra de Popen: un grupo de procesos propio, para terminar el
+    árbol completo (los rlimits se aplican con limited_command).
+
+    En Python 2.7 Popen no tiene start_new_session, así que el grupo propio
+    solo se obtiene con preexec_fn=os.setsid. Ese preexec_fn corre después
+    del fork en un servidor con varios hilos, donde el código Python puede
+    bloquearse si otro hilo tenía el lock de importación o del asignador de
+    memoria: os.setsid es una función de C sin importaciones ni asignaciones,
+    pero ninguna llamada a setrlimit puede correr ahí. Por eso los rlimits
+    los aplica rlimit_exec.py después del exec (ver limited_command).
+    """
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'preexec_fn': os.setsid}
+
+
+def kill_tree(process):
+    """Termina el proceso y todos sus descendientes"""
+    if psutil is not None:
+        try:
+            parent = psutil.Process(process.pid)
+            for child in parent.children(recursive=True):
+                try:
+                    child.kill()
+                except psutil.Error:
+                    pass
+        except psutil.Error:
+            pass
+    if os.name == 'nt':
+        # taskkill /T alcanza a los descendientes aunque no haya psutil
+        with open(os.devnull, 'w') as devnull:
+            subprocess.call(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                            stdout=devnull, stderr=devnull)
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    try:
+        process.kill()
+    except OSError:
+        pass
+
+
+def sample_tree(pid):
+    """
+    (CPU en segundos, memoria residente en bytes) del proceso y sus
+    descendientes, o None si no se puede medir (sin psutil).
+    """
+    if psutil is None:
+        return None
+    try:
+        parent = psutil.Process(pid)
+        processes = [parent] + parent.children(recursive=True)
+    except psutil.Error:
+        return None
+    cpu = 0.0
+    rss = 0
+    for process in processes:
+        try:
+            times = process.cpu_times()
+            cpu += times.user + times.system
+            rss += process.memory_info().rss
+        except psutil.Error:
+            pass
+    return cpu, rss
+
+
+def breached(limits, sample):
+    """Límite de CPU o memoria superado según una muestra, o None"""
+    if not limits or sample is None:
+        return None
+    cpu, rss = sample
+    if limits.get('cpu') and cpu > limits['cpu']:
+        return CPU
+    if limits.get('memory') and rss > limits['memory']:
+        return MEMORY
+    return None
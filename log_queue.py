@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Logging sin bloqueo: los hilos de las peticiones solo encolan los registros
+y un hilo en segundo plano los escribe en los handlers reales (archivo,
+consola, JSON).
+
+Python 2.7 no trae logging.handlers.QueueHandler ni QueueListener, así que
+se usan los de la biblioteca estándar si existen y, si no, una versión
+mínima equivalente.
+
+Cada registro lleva además el contexto del hilo que lo emitió (session_id,
+job_id, stage, article), fijado con set_log_context(), y puede traer una
+duración en extra={'duration': segundos}. JsonLinesFormatter escribe todo
+eso como una línea JSON por registro.
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    QueueHandler = QueueListener = None
+
+from text_normalize import to_ascii
+
+CONTEXT_FIELDS = ('session_id', 'job_id', 'stage', 'article')
+
+_context = threading.local()
+
+
+def set_log_context(**fields):
+    """Agrega campos al contexto de los registros emitidos por este hilo"""
+    current = getattr(_context, 'fields', None) or {}
+    current = dict(current)
+    current.update(fields)
+    _context.fields = current
+
+
+def clear_log_context():
+    _context.fields = {}
+
+
+class ContextFilter(logging.Filter):
+    """Copia el contexto del hilo emisor en el registro (antes de encolarlo)"""
+
+    def filter(self, record):
+        fields = getattr(_context, 'fields', None) or {}
+        for name in CONTEXT_FIELDS:
+            if not hasattr(record, name):
+                setattr(record, name, fields.get(name))
+        if not hasattr(record, 'duration'):
+            record.duration = None
+        return True
+
+
+if QueueHandler is None:
+    class QueueHandler(logging.Handler):
+        """Encola los registros ya formateados para que otro hilo los escriba"""
+
+        def __init__(self, log_queue):
+            logging.Handler.__init__(self)
+            self.queue = log_queue
+
+        def prepare(self, record):
+            # Formatear aquí: los argumentos y la traza pueden no sobrevivir
+            # hasta que el otro hilo procese el registro
+            message = self.format(record)
+            record = copy.copy(record)
+            record.message = message
+            record.msg = message
+            record.args = None
+            record.exc_info = None
+            record.exc_text = None
+            return record
+
+        def emit(self, record):
+            try:
+                self.queue.put_nowait(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+        """Hilo que entrega los registros de la cola a los handlers"""
+
+        _sentinel = None
+
+        def __init__(self, log_queue, *handlers, **kwargs):
+            self.queue = log_queue
+            self.handlers = handlers
+            self.respect_handler_level = kwargs.get('respect_handler_level', False)
+            self._thread = None
+
+        def handle(self, record):
+            for handler in self.handlers:
+                if not self.respect_handler_level or record.levelno >= handler.level:
+                    handler.handle(record)
+
+        def _monitor(self):
+            while True:
+                record = self.queue.get()
+                if record is self._sentinel:
+                    break
+                self.handle(record)
+
+        def start(self):
+            self._thread = threading.Thread(target=self._monitor, name='log-listener')
+            self._thread.daemon = True
+            self._thread.start()
+
+        def stop(self):
+            self.queue.put_nowait(self._sentinel)
+            self._thread.join()
+            self._thread = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Un objeto JSON por línea con la fecha, el nivel, el mensaje y el contexto"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
+            'level': record.levelname,
+            'message': to_ascii(record.getMessage()),
+            'thread': record.threadName
+        }
+        for name in CONTEXT_FIELDS + ('duration',):
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = round(value, 3) if name == 'duration' else to_ascii(value)
+        if record.exc_info:
+            data['exception'] = to_ascii(self.formatException(record.exc_info))
+        return json.dumps(data, sort_keys=True)
+
+
+def start_queue_logging(logger, handlers):
+    """
+    Reemplaza los handlers de `logger` por una cola atendida en segundo plano
+    por `handlers`. Devuelve el listener, que se detiene (vaciando la cola)
+    al salir del proceso.
+    """
+    log_queue = queue.Queue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Lectura del log del servidor sin cargarlo completo en memoria.
+
+Los registros tienen el formato de app.py ('%(asctime)s - %(levelname)s -
+%(message)s'); las líneas que no empiezan con una fecha (trazas de
+excepciones, salidas del validador) pertenecen al registro anterior.
+
+- query() recorre los registros del más nuevo al más viejo leyendo el
+  archivo desde el final por bloques, filtra por nivel mínimo, sesión, IP,
+  texto y rango de fechas, y devuelve un cursor para la página siguiente.
+- read_page() devuelve un tramo del archivo a partir de un offset.
+
+Los respaldos de RotatingFileHandler (.1, .2, ...) no cambian hasta la
+siguiente rotación, así que de cada uno se guarda en memoria un índice
+liviano: por cada bloque de ~256 KB, su offset, la primera y la última fecha
+y los niveles presentes. Con él se saltan los bloques que no pueden
+contener resultados y se deja de leer al pasar la fecha 'since'.
+"""
+import os
+import re
+import threading
+
+from text_normalize import to_ascii
+
+RECORD_START = re.compile(br'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d{3} - ([A-Z]+) - ')
+
+# Los IDs de sesión llevan la fecha de creación: <nombre>-AAAAMMDD-HHMMSS
+_SESSION_TIME = re.compile(r'(\d{4})(\d\d)(\d\d)-(\d\d)(\d\d)(\d\d)')
+
+READ_BLOCK = 65536
+INDEX_BLOCK = 262144
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+
+def session_start(session_id):
+    """Fecha ('AAAA-MM-DD HH:MM:SS') codificada en un ID de sesión, o None"""
+    match = _SESSION_TIME.search(session_id or '')
+    if not match:
+        return None
+    return '{}-{}-{} {}:{}:{}'.format(*match.groups())
+
+
+def _lines_backwards(path, start=0, end=None):
+    """(offset, línea) desde `end` hacia atrás hasta `start`, sin el salto de línea"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell() if end is None else min(end, f.tell())
+        buf = b''
+        while pos > start:
+            size = min(READ_BLOCK, pos - start)
+            pos -= size
+            f.seek(pos)
+            buf = f.read(size) + buf
+            lines = buf.split(b'\n')
+            # La primera línea puede estar incompleta: queda para el próximo bloque
+            buf = lines[0]
+            offset = pos + len(buf) + 1
+            positioned = []
+            for line in lines[1:]:
+                positioned.append((offset, line))
+                offset += len(line) + 1
+            for item in reversed(positioned):
+                if item[1]:
+                    yield item
+        if buf:
+            yield start, buf
+
+
+def _records_backwards(path, start=0, end=None):
+    """Registros completos desde `end` hacia atrás"""
+    pending = []
+    for offset, line in _lines_backwards(path, start, end):
+        pending.append(line.rstrip(b'\r'))
+        match = RECORD_START.match(line)
+        if match:
+            yield {
+                'offset': offset,
+                'time': match.group(1).decode('ascii'),
+                'level': match.group(2).decode('ascii'),
+                'text': b'\n'.join(reversed(pending))
+            }
+            pending = []
+
+
+def _build_index(path):
+    blocks = []
+    current = None
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            match = RECORD_START.match(line)
+            if match:
+                time_text = match.group(1).decode('ascii')
+                if current is None or offset - current['start'] >= INDEX_BLOCK:
+                    if current is not None:
+                        current['end'] = offset
+                        blocks.append(current)
+                    current = {'start': offset, 'first': time_text, 'levels': set()}
+                current['last'] = time_text
+                current['levels'].add(match.group(2).decode('ascii'))
+            offset += len(line)
+    if current is not None:
+        current['end'] = offset
+        blocks.append(current)
+    return blocks
+
+
+class LogReader(object):
+    """Consultas sobre el log activo y sus respaldos"""
+
+    def __init__(self, log_file, backup_count):
+        self.log_file = log_file
+        self.backup_count = backup_count
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def files(self):
+        """Rutas del log, de la más nueva (índice 0, el log activo) a la más vieja"""
+        paths = [self.log_file] + ['{}.{}'.format(self.log_file, i)
+                                   for i in range(1, self.backup_count + 1)]
+        return [path for path in paths if os.path.exists(path)]
+
+    def _index(self, path):
+        st = os.stat(path)
+        key = (st.st_size, st.st_mtime)
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached and cached[0] == key:
+                return cached[1]
+        blocks = _build_index(path)
+        with self._lock:
+            self._indexes[path] = (key, blocks)
+        return blocks
+
+    def _ranges(self, file_index, path, end, min_level, since, until):
+        """Tramos (start, end) del archivo que pueden contener resultados, del final al inicio"""
+        if file_index == 0:
+            # El log activo cambia continuamente: se lee completo hacia atrás
+            return [(0, end)]
+        ranges = []
+        for block in reversed(self._index(path)):
+            if end is not None and block['start'] >= end:
+                continue
+            if since and block['last'] < since:
+                break
+            if until and block['first'] > until:
+                continue
+            if min_level and max(LEVELS.get(level, 0) for level in block['levels']) < min_level:
+                continue
+            block_end = block['end'] if end is None else min(block['end'], end)
+            ranges.append((block['start'], block_end))
+        return ranges
+
+    def query(self, limit=200, level=None, session=None, ip=None, text=None,
+              since=None, until=None, cursor=None):
+        """
+        Registros del más nuevo al más viejo que cumplen todos los filtros.
+        Devuelve (registros, cursor); el cursor ('<archivo>:<offset>') sirve
+        para pedir la página siguiente y es None si no hay más.
+        """
+        min_level = LEVELS.get((level or '').upper())
+        needles = [to_ascii(value).encode('ascii') for value in (session, ip, text) if value]
+        since = since or session_start(session)
+
+        files = self.files()
+        file_index, end = 0, None
+        if cursor:
+            file_index, end = [int(part) for part in cursor.split(':', 1)]
+
+        records = []
+        while file_index < len(files):
+            path = files[file_index]
+            for start, range_end in self._ranges(file_index, path, end, min_level, since, until):
+                for record in _records_backwards(path, start, range_end):
+                    if since and record['time'] < since:
+                        return records, None
+                    if until and record['time'] > until:
+                        continue
+                    if min_level and LEVELS.get(record['level'], 0) < min_level:
+                        continue
+                    if not all(needle in record['text'] for needle in needles):
+                        continue
+                    if len(records) == limit:
+                        return records, '{}:{}'.format(records[-1]['file'], records[-1]['offset'])
+                    record['file'] = file_index
+                    record['text'] = to_ascii(record['text'])
+                    records.append(record)
+            file_index, end = file_index + 1, None
+        return records, None
+
+    def read_page(self, file_index=0, offset=None, length=READ_BLOCK):
+        """
+        Tramo del log de `length` bytes desde `offset` (por defecto, el final
+        del archivo), ajustado a líneas completas. Devuelve
+        (texto, offset inicial, offset siguiente, tamaño del archivo).
+        """
+        files = self.files()
+        if not 0 <= file_index < len(files):
+            return '', 0, 0, 0
+        with open(files[file_index], 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if offset is None:
+                offset = max(0, size - length)
+            offset = max(0, min(offset, size))
+            f.seek(offset)
+            if offset > 0:
+                # Empezar en la línea siguiente si el offset cae en medio de una
+                f.seek(offset - 1)
+                skipped = f.readline()
+                offset += len(skipped) - 1
+            data = f.read(length)
+            if data and not data.endswith(b'\n'):
+                data += f.readline()
+        return to_ascii(data), offset, offset + len(data), size
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Manifiestos de sesiones de carpeta para revalidación incremental.
+
+Al terminar una validación de carpeta se guarda un manifiesto con el hash de
+cada archivo y, por artículo, una huella (hash del XML, de los activos que le
+corresponden y de la identidad del validador) junto con su resultado. Cuando
+se vuelve a subir el mismo número, los artículos cuya huella no cambió
+reutilizan el resultado anterior y solo se valida el resto.
+
+La sesión anterior se indica explícitamente (campo previous_session) o se
+busca por revista y número: ISSN, volumen y número del primer XML que los
+declare o, si no, el prefijo común de los nombres de archivo SciELO.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+logger = logging.getLogger('scielo_validator')
+
+_ISSN = re.compile(br'<issn[^>]*>\s*([0-9]{4}-?[0-9]{3}[0-9Xx])\s*</issn>')
+_VOLUME = re.compile(br'<volume[^>]*>\s*([^<]{1,20}?)\s*</volume>')
+_ISSUE = re.compile(br'<issue[^>]*>\s*([^<]{1,20}?)\s*</issue>')
+_SAFE_KEY = re.compile(r'[^a-z0-9-]+')
+
+# Bytes que se leen del inicio de cada XML para buscar los metadatos del número
+_HEAD_SIZE = 65536
+
+
+def _issue_from_xml(xml_path):
+    try:
+        with open(xml_path, 'rb') as f:
+            head = f.read(_HEAD_SIZE)
+    except (IOError, OSError):
+        return None
+    parts = [_ISSN.search(head), _VOLUME.search(head), _ISSUE.search(head)]
+    if not parts[0] or not (parts[1] or parts[2]):
+        return None
+    return '-'.join(match.group(1).decode('ascii', 'replace') if match else '' for match in parts)
+
+
+def _issue_from_names(xml_files):
+    # Paquetes SciELO: <issn>-<acrónimo>-<vol>-<num>-<orden>.xml; el número
+    # es todo menos el último segmento, y debe ser común a todos los XML
+    prefixes = set()
+    for xml_path in xml_files:
+        stem = os.path.splitext(os.path.basename(xml_path))[0]
+        if '-' not in stem:
+            return None
+        prefixes.add(stem.rsplit('-', 1)[0])
+    if len(prefixes) != 1:
+        return None
+    prefix = prefixes.pop()
+    return prefix if prefix.count('-') >= 2 else None
+
+
+def issue_key(xml_files):
+    """Identifica la revista y el número de una carga, o None"""
+    key = None
+    for xml_path in xml_files:
+        key = _issue_from_xml(xml_path)
+        if key:
+            break
+    key = key or _issue_from_names(xml_files)
+    if not key:
+        return None
+    return _SAFE_KEY.sub('_', key.lower()).strip('_') or None
+
+
+def article_fingerprint(validator_id, xml_path, assets, hashes):
+    """Huella de un artículo: cambia si cambia el XML, un activo o el validador"""
+    digest = hashlib.sha256()
+    digest.update(u'{}\0{}'.format(validator_id, hashes[xml_path]).encode('utf-8'))
+    for path in sorted(assets, key=os.path.basename):
+        digest.update(u'\0{}\0{}'.format(os.path.basename(path), hashes[path]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ManifestStore(object):
+    """
+    Manifiestos guardados como JSON, uno por sesión, más un índice por número
+    que apunta a la última sesión de cada revista y número.
+    """
+
+    def __init__(self, manifest_dir, max_age):
+        self.manifest_dir = manifest_dir
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        if not os.path.exists(manifest_dir):
+            os.makedirs(manifest_dir)
+
+    def _path(self, name):
+        return os.path.join(self.manifest_dir, name + '.json')
+
+    def _write(self, name, data):
+        # Escritura atómica para no dejar un manifiesto a medias
+        tmp_path = self._path('tmp-' + uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(data, sort_keys=True).encode('utf-8'))
+        path = self._path(name)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+    def _read(self, name):
+        try:
+            with open(self._path(name), 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, manifest):
+        """Guarda el manifiesto de una sesión y actualiza el índice del número"""
+        with self._lock:
+            self._write('session-' + manifest['session_id'], manifest)
+            if manifest.get('issue_key'):
+                self._write('issue-' + manifest['issue_key'], {'session_id': manifest['session_id']})
+
+    def alias(self, session_id, source_session_id):
+        """
+        Registra para `session_id` el manifiesto de otra sesión con el mismo
+        contenido (resultado tomado de la caché). Devuelve False si no existe.
+        """
+        manifest = self.load(source_session_id)
+        if manifest is None:
+            return False
+        manifest.update({'session_id': session_id, 'created': time.time()})
+        self.save(manifest)
+        return True
+
+    def load(self, session_id):
+        """Manifiesto de una sesión, o None si no existe o venció"""
+        if not session_id or not re.match(r'^[A-Za-z0-9_-]+$', session_id):
+            return None
+        manifest = self._read('session-' + session_id)
+        if manifest is None or time.time() - manifest.get('created', 0) > self.max_age:
+            return None
+        return manifest
+
+    def find_previous(self, session_id=None, issue=None):
+        """
+        Manifiesto de la sesión indicada o, si no se indicó o no existe, el
+        de la última sesión del mismo número.
+        """
+        manifest = self.load(session_id)
+        if manifest is None and issue:
+            pointer = self._read('issue-' + issue)
+            if pointer:
+                manifest = self.load(pointer.get('session_id'))
+        return manifest
+
+    def evict(self):
+        """Elimina los manifiestos vencidos y los temporales huérfanos"""
+        removed = 0
+        now = time.time()
+        for file_name in os.listdir(self.manifest_dir):
+            path = os.path.join(self.manifest_dir, file_name)
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info("Removed {} expired manifests".format(removed))
+        return removed
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Contadores e histogramas en memoria con salida en el formato de texto de
+Prometheus (versión 0.0.4), para el endpoint /metrics.
+
+Solo lo necesario para este servidor: métricas con etiquetas fijas,
+histogramas de buckets acumulativos y métricas cuyo valor se lee al
+momento de exportar (por ejemplo, las estadísticas de las cachés).
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Segundos: de milisegundos (búsquedas, serialización) a minutos (validador)
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Bytes: de 1 KiB a 1 GiB en potencias de 4
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))
+
+# Archivos por sesión
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + '}'
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("{} espera las etiquetas {}".format(self.name, self.labelnames))
+        return tuple(labels[name] for name in self.labelnames)
+
+    def header(self):
+        return ['# HELP {} {}'.format(self.name, self.documentation),
+                '# TYPE {} {}'.format(self.name, self.kind)]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [self.name + _labels(self.labelnames, key) + ' ' + _format_value(value)
+                for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        _Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa la duración del bloque en segundos"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def collect(self):
+        with self._lock:
+            values = sorted((key, (list(state['counts']), state['sum']))
+                            for key, state in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(self.name + '_bucket' +
+                             _labels(self.labelnames, key, [('le', _format_value(bound))]) +
+                             ' ' + _format_value(cumulative))
+            lines.append(self.name + '_sum' + _labels(self.labelnames, key) + ' ' + _format_value(total))
+            lines.append(self.name + '_count' + _labels(self.labelnames, key) + ' ' + _format_value(cumulative))
+        return lines
+
+
+class _Callback(_Metric):
+    """Métrica cuyo valor lo calcula `func` al exportar ({etiquetas: valor} o un número)"""
+
+    def __init__(self, name, documentation, kind, func, labelnames=()):
+        _Metric.__init__(self, name, documentation, labelnames)
+        self.kind = kind
+        self.func = func
+
+    def collect(self):
+        result = self.func()
+        if result is None:
+            return []
+        if not isinstance(result, dict):
+            result = {(): result}
+        return [self.name + _labels(self.labelnames, key) + ' ' + _format_value(value)
+                for key, value in sorted(result.items()) if value is not None]
+
+
+class Registry(object):
+    """Conjunto de métricas del proceso"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, kind, func, labelnames=()):
+        return self._add(_Callback(name, documentation, kind, func, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
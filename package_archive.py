@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Lectura de un paquete SciELO subido como un único archivo ZIP.
+
+Las entradas se leen de a una directamente desde el ZIP, sin extraerlo antes
+a disco, para pasarlas a la misma ingesta que los archivos de una carpeta.
+Antes de leer ninguna se revisa el directorio central y se rechaza el
+archivo completo si contiene:
+
+- rutas absolutas, con unidad de Windows o con '..' (path traversal);
+- entradas cifradas o enlaces simbólicos;
+- demasiadas entradas, un tamaño descomprimido total excesivo o una tasa de
+  compresión imposible para un paquete real (zip bombs).
+
+Como los tamaños declarados en el ZIP pueden ser falsos, además se cuentan
+los bytes realmente descomprimidos de cada entrada mientras se leen.
+"""
+import re
+import stat
+import tempfile
+import zipfile
+import zlib
+
+from text_normalize import to_ascii
+
+CHUNK_SIZE = 64 * 1024
+
+# Tipos MIME con los que se acepta un ZIP enviado como cuerpo de la petición
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed', 'application/octet-stream')
+
+# Las entradas pequeñas pueden comprimirse mucho (XML repetitivo, imágenes
+# en blanco); la tasa solo se revisa a partir de este tamaño
+RATIO_MIN_BYTES = 1024 * 1024
+
+# Directorios y archivos que agregan los compresores y no son del paquete
+_IGNORED_DIRS = frozenset(['__MACOSX'])
+_IGNORED_NAMES = frozenset(['.ds_store', 'thumbs.db', 'desktop.ini'])
+
+_DRIVE = re.compile(r'^[A-Za-z]:')
+
+
+class ArchiveError(Exception):
+    """El archivo no es un ZIP válido o no se acepta"""
+    status = 400
+
+
+class ArchiveTooLarge(ArchiveError):
+    """El contenido del ZIP supera los límites"""
+    status = 413
+
+
+def spool_stream(stream, max_bytes, temp_dir=None):
+    """
+    Copia el cuerpo de la petición a un archivo temporal (ZipFile necesita
+    moverse por el archivo) sin superar `max_bytes`. El archivo se borra al
+    cerrarlo.
+    """
+    spooled = tempfile.TemporaryFile(dir=temp_dir)
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise ArchiveTooLarge("ZIP larger than {} bytes".format(max_bytes))
+            spooled.write(chunk)
+    except Exception:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled
+
+
+def _entry_parts(name):
+    # Componentes de la ruta de una entrada; rechaza las que salen del paquete
+    path = name.replace('\\', '/')
+    if path.startswith('/') or _DRIVE.match(path):
+        raise ArchiveError("Absolute path in ZIP entry: {}".format(to_ascii(name)))
+    parts = [part for part in path.split('/') if part not in ('', '.')]
+    if '..' in parts:
+        raise ArchiveError("Path traversal in ZIP entry: {}".format(to_ascii(name)))
+    return parts
+
+
+class _LimitedReader(object):
+    """Lee una entrada contando los bytes reales descomprimidos"""
+
+    def __init__(self, archive, info, stream):
+        self._archive = archive
+        self._info = info
+        self._stream = stream
+        self.size = 0
+
+    def read(self, size=-1):
+        try:
+            data = self._stream.read(size)
+        except (zipfile.BadZipfile, zlib.error, EOFError) as e:
+            raise ArchiveError("Corrupt ZIP entry {}: {}".format(to_ascii(self._info.filename), e))
+        self.size += len(data)
+        if self.size > self._info.file_size:
+            raise ArchiveError("ZIP entry larger than declared: {}".format(to_ascii(self._info.filename)))
+        self._archive._count(len(data))
+        return data
+
+    def close(self):
+        self._stream.close()
+
+
+class PackageArchive(object):
+    """
+    Un ZIP de paquete abierto y revisado. `entries` son las entradas de
+    archivos del paquete (sin directorios ni archivos de sistema), en orden.
+
+    Uso:
+        with PackageArchive(f, max_entries, max_bytes, max_ratio) as archive:
+            for info in archive.entries:
+                stream = archive.open(info)
+                ...
+    """
+
+    def __init__(self, fileobj, max_entries, max_bytes, max_ratio):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_ratio = max_ratio
+        self._fileobj = fileobj
+        self._extracted = 0
+        try:
+            self._zip = zipfile.ZipFile(fileobj)
+        except (zipfile.BadZipfile, zipfile.LargeZipFile, ValueError, EOFError, IOError) as e:
+            fileobj.close()
+            raise ArchiveError("Invalid ZIP file: {}".format(e))
+        try:
+            self.entries = self._check(self._zip.infolist())
+        except Exception:
+            self.close()
+            raise
+        self.declared_bytes = sum(info.file_size for info in self.entries)
+
+    def _check(self, infos):
+        if len(infos) > self.max_entries:
+            raise ArchiveTooLarge("ZIP has {} entries (max {})".format(len(infos), self.max_entries))
+
+        entries = []
+        total = 0
+        for info in infos:
+            parts = _entry_parts(info.filename)
+            if info.flag_bits & 0x1:
+                raise ArchiveError("Encrypted ZIP entry: {}".format(to_ascii(info.filename)))
+            if stat.S_ISLNK(info.external_attr >> 16):
+                raise ArchiveError("Symbolic link in ZIP: {}".format(to_ascii(info.filename)))
+            if not parts or info.filename.endswith(('/', '\\')):
+                continue
+            if _IGNORED_DIRS.intersection(parts) or parts[-1].lower() in _IGNORED_NAMES:
+                continue
+
+            total += info.file_size
+            if total > self.max_bytes:
+                raise ArchiveTooLarge("ZIP expands to more than {} bytes".format(self.max_bytes))
+            if info.file_size >= RATIO_MIN_BYTES and \
+                    info.file_size > self.max_ratio * max(info.compress_size, 1):
+                raise ArchiveTooLarge("Suspicious compression ratio in ZIP entry: {}".format(to_ascii(info.filename)))
+            entries.append(info)
+        return entries
+
+    def _count(self, size):
+        self._extracted += size
+        if self._extracted > self.max_bytes:
+            raise ArchiveTooLarge("ZIP expands to more than {} bytes".format(self.max_bytes))
+
+    def open(self, info):
+        """Flujo de lectura de una entrada, con sus bytes contados"""
+        try:
+            stream = self._zip.open(info)
+        except (zipfile.BadZipfile, NotImplementedError, RuntimeError) as e:
+            raise ArchiveError("Cannot read ZIP entry {}: {}".format(to_ascii(info.filename), e))
+        return _LimitedReader(self, info, stream)
+
+    def close(self):
+        self._zip.close()
+        self._fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline de validación de paquetes, independiente de Flask.
+
+    ingesta (nombres seguros, reescritura de fuentes, hashes)
+      -> un subpaquete por artículo
+      -> xml_package_maker sobre cada artículo, con límites de recursos
+      -> hallazgos de la salida y de los reportes (findings.py)
+      -> reporte consolidado del paquete
+
+Las vistas de app.py y validate_cli.py validan los paquetes con
+validate_package(); el servidor agrega lo propio (caché de resultados,
+manifiestos, eventos en vivo, índice de reportes) con PackageHooks.
+
+La ejecución del validador se recibe como una función
+run(target, limits, on_progress, on_output, usage) con el contrato de
+process_runner.run_process: devuelve (exit_code, stdout, stderr,
+limit_exceeded).
+"""
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+
+import findings
+from article_split import run_concurrently, split_package
+from ingest import ingest_file
+from job_events import output_line
+from limits import CPU, LIMIT_MESSAGES, MB, MEMORY, WALL
+from process_runner import run_process
+from report_store import GZIP_SUFFIX, compress_in_place, read_report
+from text_normalize import sanitize_upload_names, to_ascii
+
+logger = logging.getLogger('scielo_validator')
+
+# Archivos que agregan los sistemas operativos y no son del paquete
+IGNORED_NAMES = frozenset(['.ds_store', 'thumbs.db', 'desktop.ini'])
+
+
+def subprocess_runner(python_path, package_maker):
+    """Función run() que lanza un proceso nuevo del validador en cada ejecución"""
+    def run(target, limits=None, on_progress=None, on_output=None, usage=None):
+        return run_process([python_path, package_maker, target], limits, on_progress, on_output, usage)
+    return run
+
+
+def package_entries(package_dir, skip_dirs=()):
+    """
+    Archivos de un paquete en disco como entradas para ingest_entries(), en
+    orden. Las subcarpetas se aplanan igual que en una carga de carpeta,
+    salvo las de `skip_dirs` (otros paquetes anidados).
+    """
+    skip_dirs = set(os.path.abspath(path) for path in skip_dirs)
+    entries = []
+    for root, dirs, files in os.walk(package_dir):
+        dirs[:] = sorted(name for name in dirs
+                         if os.path.abspath(os.path.join(root, name)) not in skip_dirs)
+        for name in sorted(files):
+            if name.startswith('.') or name.lower() in IGNORED_NAMES:
+                continue
+            path = os.path.join(root, name)
+            entries.append((os.path.relpath(path, package_dir), lambda path=path: open(path, 'rb')))
+    return entries
+
+
+def ingest_entries(session_dir, entries):
+    """
+    Guarda y sanitiza los archivos de un paquete en `session_dir` en una sola
+    pasada por bloques. `entries` es una lista de (nombre original, función
+    que abre su contenido). Devuelve (xml_files, support_files, file_hashes,
+    stats); stats trae 'bytes', 'rewrite_time' y 'font_terms' (total de
+    términos de fuente reemplazados).
+    """
+    xml_files = []
+    support_files = []
+    file_hashes = {}
+    stats = {'bytes': 0, 'rewrite_time': 0.0, 'font_terms': 0}
+
+    # Nombres seguros y sin colisiones para todo el paquete
+    safe_names = sanitize_upload_names([filename for filename, _ in entries])
+
+    for (filename, open_stream), safe_name in zip(entries, safe_names):
+        basename = re.split(r'[\\/]', filename)[-1]
+        ext = os.path.splitext(safe_name)[1]
+        file_path = os.path.join(session_dir, safe_name)
+        stream = open_stream()
+        try:
+            info = ingest_file(stream, file_path)
+        finally:
+            stream.close()
+        file_hashes[file_path] = info['sha256']
+        stats['bytes'] += info['size']
+        stats['rewrite_time'] += info['rewrite_time']
+
+        if ext == '.xml':
+            xml_files.append(file_path)
+        else:
+            support_files.append(file_path)
+
+        logger.info("Archivo guardado: {} (original: {}, {} bytes, codificacion: {})".format(
+            safe_name, to_ascii(basename), info['size'], info['encoding'] or 'binario'))
+        if info['font_terms']:
+            stats['font_terms'] += sum(info['font_terms'].values())
+            logger.info("Se reemplazaron terminos relacionados con fuentes en {}: {}".format(
+                safe_name, ', '.join('{}={}'.format(term, count)
+                                     for term, count in sorted(info['font_terms'].items()))))
+    return xml_files, support_files, file_hashes, stats
+
+
+def limit_message(limit, limits):
+    """Mensaje de error de una ejecución detenida por un límite"""
+    return "Error: {} durante la validacion (limites: {} s de tiempo real, {} s de CPU, {} MB de memoria)".format(
+        LIMIT_MESSAGES.get(limit or WALL), limits.get('wall'), limits.get('cpu') or '-',
+        limits['memory'] // MB if limits.get('memory') else '-')
+
+
+def limit_status(limit):
+    return {WALL: 'TIEMPO AGOTADO', CPU: 'LIMITE CPU', MEMORY: 'LIMITE MEMORIA'}.get(limit or WALL)
+
+
+def review_validator_output(stdout, stderr):
+    """
+    Convierte la salida del validador a ASCII y reemplaza los errores de
+    font-family por avisos en el texto que se muestra. El resultado de la
+    validación sale de los hallazgos (ver output_findings).
+    Devuelve (stdout, stderr).
+    """
+    # LOG ADICIONAL: Registrar salidas originales
+    if stdout:
+        logger.info("STDOUT ORIGINAL (primeros 500 caracteres): {}".format(stdout[:500]))
+    if stderr:
+        logger.warning("STDERR ORIGINAL (primeros 500 caracteres): {}".format(stderr[:500]))
+
+    # Convertir a ASCII seguro
+    stdout = to_ascii(stdout) if stdout else ""
+    stderr = to_ascii(stderr) if stderr else ""
+
+    # REVISIÓN ESPECIAL PARA FONT-FAMILY: Buscar específicamente en la salida
+    if 'font-family' in stderr:
+        logger.error("DETECCIÓN CRÍTICA: 'font-family' encontrado en stderr")
+        font_family_lines = [line for line in stderr.split('\n') if 'font-family' in line]
+        for line in font_family_lines:
+            logger.error("LÍNEA CON ERROR: {}".format(line))
+
+        # Reemplazar la primera línea con el error por un aviso
+        font_family_error_detail = font_family_lines[0]
+        stderr = stderr.replace(font_family_error_detail,
+                                "AVISO: Se encontró un atributo 'font-family' que ha sido ignorado")
+
+        if len(stderr.strip().split('\n')) < 5 and 'font-family' in stderr:
+            stderr = "AVISO: Se encontraron algunos atributos de estilo no estándar que han sido ignorados.\n"
+            stderr += "La validación estructural del XML es correcta."
+    return stdout, stderr
+
+
+def find_text_reports(directory):
+    """Reportes .report.txt generados en `directory`"""
+    return [os.path.join(root, file_name)
+            for root, dirs, files in os.walk(directory)
+            for file_name in sorted(files) if file_name.endswith('.report.txt')]
+
+
+def output_findings(exit_code, stdout, stderr, timed_out, report_paths=(), article=None, file_name=None):
+    """
+    Hallazgos de una ejecución del validador: su salida y sus reportes
+    (.report.txt y HTML, comprimidos o no). Una ejecución detenida por un
+    límite tiene un único hallazgo fatal (sus reportes están incompletos) y
+    una que termina con código distinto de cero sin ningún error reconocible
+    recibe uno con la regla 'exit-code'.
+    """
+    if timed_out:
+        message = to_ascii(stderr).strip().split('\n')[0] or "Limite superado"
+        return [findings.finding(findings.FATAL, message, rule='limit', article=article, file_name=file_name)]
+
+    groups = [findings.parse_text(stdout or '', article, file_name),
+              findings.parse_text(stderr or '', article, file_name)]
+    for path in report_paths:
+        try:
+            data = read_report(path)
+        except (IOError, OSError) as e:
+            logger.error("Error leyendo el reporte {}: {}".format(path, str(e)))
+            continue
+        if path.endswith(('.html', '.html' + GZIP_SUFFIX)):
+            groups.append(findings.parse_html(data, article, file_name))
+        else:
+            groups.append(findings.parse_text(data, article, file_name))
+    found = findings.merge(*groups)
+
+    # font-family no es un error estructural aunque el validador termine con error
+    font_family = any(item['rule'] == findings.FONT_FAMILY_RULE for item in found)
+    if exit_code != 0 and not findings.has_errors(found) and not font_family:
+        found.append(findings.finding(
+            findings.FATAL, "El validador termino con codigo de salida {}".format(exit_code),
+            rule='exit-code', article=article, file_name=file_name))
+    return found
+
+
+def find_html_reports(directory):
+    """Reportes HTML generados en `directory`, comprimidos en su lugar"""
+    html_files = []
+    for root, dirs, files in os.walk(directory):
+        for file_name in sorted(files):
+            if file_name.endswith('.html'):
+                html_files.append(compress_in_place(os.path.join(root, file_name)))
+                logger.info("Reporte HTML encontrado: {}".format(html_files[-1]))
+    return html_files
+
+
+class _NoSlot(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def validate_article(article, run, policy, deadline=None, slot=None, on_event=None, on_font_family=None):
+    """
+    Valida el subpaquete de un artículo con límites según su tamaño (ver
+    LimitPolicy) y sin pasar del `deadline` del paquete.
+
+    `slot()` devuelve el contexto dentro del cual corre el validador (un
+    slot de validator_pool en el servidor); `on_event(evento, datos)` recibe
+    los eventos 'article' (estado) y 'output' (cada línea de salida).
+    Devuelve el resultado del artículo como diccionario.
+    """
+    publish = on_event or (lambda event, data: None)
+    article_bytes = sum(os.path.getsize(path) for path in [article['xml']] + article['assets'])
+    limits = policy.for_package(article_bytes)
+    usage = {}
+    with (slot or _NoSlot)():
+        if deadline is not None:
+            limits['wall'] = round(min(limits['wall'], deadline - time.time()), 1)
+        start_time = time.time()
+        if limits['wall'] <= 0:
+            # El paquete agotó su presupuesto mientras el artículo esperaba turno
+            exit_code, stdout, stderr, timed_out = -1, b"", b"", True
+            usage['limit'] = WALL
+        else:
+            logger.info("Validando articulo {} en {} (limites: {})".format(
+                article['name'], article['dir'], limits))
+            publish('article', {'name': article['name'], 'status': 'VALIDANDO'})
+
+            def on_output(stream, line):
+                publish('output', {'article': article['name'], 'stream': stream,
+                                   'line': output_line(to_ascii(line))})
+            exit_code, stdout, stderr, timed_out = run(article['dir'], limits, None, on_output, usage)
+        duration = time.time() - start_time
+
+    if timed_out:
+        logger.warning("LIMITE: La validacion de {} supero el limite de {} ({})".format(
+            article['name'], usage.get('limit') or WALL, limits))
+        stderr = limit_message(usage.get('limit'), limits)
+    logger.info("Articulo {} validado - Codigo de salida: {} (uso: {})".format(
+        article['name'], exit_code, usage), extra={'duration': duration})
+
+    # Buscar reportes HTML generados automáticamente
+    html_files = find_html_reports(article['dir'])
+
+    found = output_findings(exit_code, stdout, stderr, timed_out,
+                            find_text_reports(article['dir']) + html_files, article['name'])
+    if on_font_family is not None and any(item['rule'] == findings.FONT_FAMILY_RULE for item in found):
+        on_font_family()
+    success = not timed_out and not findings.has_errors(found)
+    stdout, stderr = review_validator_output(stdout, stderr)
+
+    if timed_out:
+        status = limit_status(usage.get('limit'))
+    elif success:
+        status = 'VALIDO'
+    else:
+        status = 'CON ERRORES'
+    publish('article', {'name': article['name'], 'status': status, 'duration': round(duration, 2)})
+
+    return {
+        'name': article['name'],
+        'assets': [os.path.basename(path) for path in article['assets']],
+        'success': success,
+        'status': status,
+        'exit_code': exit_code,
+        'timed_out': timed_out,
+        'limit': usage.get('limit'),
+        'limits': limits,
+        'usage': usage,
+        'duration': duration,
+        'stdout': stdout,
+        'stderr': stderr,
+        'html_files': html_files,
+        'findings': found,
+        'counts': findings.counts(found),
+        'reused_from': None
+    }
+
+
+def article_failure(article, error):
+    """Resultado de un artículo cuya validación lanzó una excepción"""
+    message = "Error durante la validacion: {}".format(to_ascii(str(error)))
+    found = [findings.finding(findings.FATAL, message, rule='exception', article=article['name'])]
+    return {
+        'name': article['name'],
+        'assets': [os.path.basename(path) for path in article['assets']],
+        'success': False,
+        'status': 'FALLA',
+        'exit_code': -1,
+        'timed_out': False,
+        'limit': None,
+        'limits': None,
+        'usage': None,
+        'duration': 0.0,
+        'stdout': "",
+        'stderr': message,
+        'html_files': [],
+        'findings': found,
+        'counts': findings.counts(found),
+        'reused_from': None
+    }
+
+
+def article_summary(result):
+    """Datos de un artículo que se incluyen en la respuesta JSON"""
+    return {
+        'name': result['name'],
+        'status': result['status'],
+        'success': result['success'],
+        'exit_code': result['exit_code'],
+        'duration': round(result['duration'], 2),
+        'assets': len(result['assets']),
+        'reused': result['reused_from'] is not None,
+        'timed_out': result['timed_out'],
+        'limit': result['limit'],
+        'usage': result['usage'],
+        'counts': result['counts']
+    }
+
+
+def build_folder_report(session_id, xml_files, support_files, results, orphans, session_dir):
+    """Informe consolidado de una carpeta con una tabla de estado por artículo"""
+    consolidated_report = "REPORTE DE VALIDACIÓN DE CARPETA\n"
+    consolidated_report += "ID de sesión: {}\n".format(session_id)
+    consolidated_report += "Fecha: {}\n".format(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    consolidated_report += "Total de archivos XML: {}\n".format(len(xml_files))
+    consolidated_report += "Total de archivos de soporte: {}\n\n".format(len(support_files))
+
+    width = max([len('Articulo')] + [len(result['name']) for result in results])
+    consolidated_report += "RESUMEN POR ARTÍCULO:\n"
+    consolidated_report += "{:<{w}}  {:<15} {:>6} {:>8} {:>8} {:>8} {:>8}  {}\n".format(
+        'Articulo', 'Estado', 'Codigo', 'Tiempo', 'Errores', 'Avisos', 'Activos', 'Origen', w=width)
+    for result in results:
+        counts = result['counts']
+        consolidated_report += "{:<{w}}  {:<15} {:>6} {:>7.1f}s {:>8} {:>8} {:>8}  {}\n".format(
+            result['name'], result['status'], result['exit_code'], result['duration'],
+            counts[findings.FATAL] + counts[findings.ERROR], counts[findings.WARNING],
+            len(result['assets']), 'reutilizado' if result['reused_from'] else 'validado', w=width)
+    consolidated_report += "Artículos válidos: {} de {}\n".format(
+        sum(1 for result in results if result['success']), len(results))
+    reused_from = set(result['reused_from'] for result in results if result['reused_from'])
+    if reused_from:
+        consolidated_report += "Artículos sin cambios reutilizados de la sesión {}: {}\n".format(
+            ", ".join(sorted(reused_from)), sum(1 for result in results if result['reused_from']))
+    consolidated_report += "\n"
+
+    if orphans:
+        consolidated_report += "ARCHIVOS DE SOPORTE SIN ARTÍCULO:\n"
+        for path in orphans:
+            consolidated_report += "- {}\n".format(os.path.basename(path))
+        consolidated_report += "\n"
+
+    for result in results:
+        consolidated_report += "=== ARTÍCULO {}: {}{} ===\n".format(
+            result['name'], result['status'], ' (reutilizado)' if result['reused_from'] else '')
+        if result['assets']:
+            consolidated_report += "Activos: {}\n".format(", ".join(result['assets']))
+        counts = result['counts']
+        consolidated_report += "Hallazgos: {} fatales, {} errores, {} avisos\n".format(
+            counts[findings.FATAL], counts[findings.ERROR], counts[findings.WARNING])
+
+        if result['stderr']:
+            consolidated_report += "MENSAJES DE VALIDACIÓN:\n"
+            consolidated_report += result['stderr'] + "\n\n"
+
+        consolidated_report += "SALIDA DEL VALIDADOR:\n"
+        consolidated_report += result['stdout'] + "\n"
+
+    # Si hay reportes HTML, agregarlos al informe
+    html_files = [path for result in results for path in result['html_files']]
+    if html_files:
+        consolidated_report += "\nREPORTES HTML GENERADOS:\n"
+        for html_file in html_files:
+            consolidated_report += "- {}\n".format(os.path.relpath(html_file, session_dir))
+
+    return consolidated_report
+
+
+def ingest_package(package_dir, session_dir, skip_dirs=()):
+    """
+    Ingesta de un paquete que está en disco en `session_dir`. Devuelve lo
+    mismo que ingest_entries().
+    """
+    if not os.path.exists(session_dir):
+        os.makedirs(session_dir)
+    return ingest_entries(session_dir, package_entries(package_dir, skip_dirs))
+
+
+class PackageHooks(object):
+    """
+    Puntos de extensión de validate_package(). Por omisión no hacen nada:
+    el servidor los redefine para ocupar slots del validador, publicar los
+    eventos del trabajo y reutilizar artículos de una sesión anterior.
+    """
+
+    def slot(self, article):
+        """Contexto dentro del cual corre el validador para `article`"""
+        return _NoSlot()
+
+    def on_event(self, event, data):
+        pass
+
+    def on_font_family(self):
+        pass
+
+    def reuse(self, articles):
+        """Resultados ya conocidos de algunos artículos, por nombre"""
+        return {}
+
+    def on_progress(self, done, total):
+        pass
+
+
+def validate_package(session_dir, xml_files, support_files, run, policy, session_id=None, workers=1,
+                     hooks=None):
+    """
+    Valida un paquete ya guardado en `session_dir` (ver ingest_package): un
+    subpaquete por artículo, hasta `workers` artículos a la vez, dentro del
+    presupuesto de tiempo del paquete, y reporte consolidado. Devuelve un
+    diccionario con success, timed_out, report, articles (resultados
+    completos), subpackages (los artículos separados), findings (de todos
+    los artículos), orphans, html_files y timings (segundos por etapa).
+    """
+    hooks = hooks or PackageHooks()
+    session_id = session_id or os.path.basename(session_dir)
+    if not xml_files:
+        raise ValueError('No se encontraron archivos XML en el paquete')
+
+    start = time.time()
+    articles, orphans = split_package(session_dir, xml_files, support_files)
+    timings = {'split': time.time() - start}
+    for article in articles:
+        logger.info("Articulo {}: {} activos".format(article['name'], len(article['assets'])))
+    if orphans:
+        logger.warning("Archivos de soporte sin articulo: {}".format(
+            ", ".join(os.path.basename(path) for path in orphans)))
+
+    known = hooks.reuse(articles)
+    pending = [article for article in articles if article['name'] not in known]
+
+    # Presupuesto de tiempo del paquete completo según tamaño y artículos
+    package_bytes = sum(os.path.getsize(path) for path in xml_files + support_files)
+    budget = policy.job_budget(package_bytes, len(pending), workers)
+    deadline = time.time() + budget
+    logger.info("Presupuesto del paquete: {} s para {} articulos ({} bytes)".format(
+        budget, len(pending), package_bytes))
+
+    progress = {'done': 0}
+    progress_lock = threading.Lock()
+
+    def validate_one(article):
+        try:
+            result = validate_article(article, run, policy, deadline, slot=lambda: hooks.slot(article),
+                                      on_event=hooks.on_event, on_font_family=hooks.on_font_family)
+        except Exception as e:
+            logger.exception("Error validando el articulo {}".format(article['name']))
+            result = article_failure(article, e)
+        with progress_lock:
+            progress['done'] += 1
+            done = progress['done']
+        hooks.on_progress(done, len(pending))
+        return result
+
+    start = time.time()
+    for article, result in zip(pending, run_concurrently(validate_one, pending, workers)):
+        known[article['name']] = result if not isinstance(result, Exception) else article_failure(article, result)
+    timings['articles'] = time.time() - start
+    results = [known[article['name']] for article in articles]
+
+    return {
+        'success': all(result['success'] for result in results),
+        'timed_out': any(result['timed_out'] for result in results),
+        'report': build_folder_report(session_id, xml_files, support_files, results, orphans, session_dir),
+        'articles': results,
+        'subpackages': articles,
+        'findings': [item for result in results for item in result['findings']],
+        'orphans': orphans,
+        'html_files': [path for result in results for path in result['html_files']],
+        'timings': timings
+    }
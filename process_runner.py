@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Ejecución de procesos del validador leyendo su salida mientras corren.
+
+Un hilo por tubería (stdout y stderr) lee línea por línea a medida que el
+proceso escribe, de modo que el proceso nunca se bloquea con el buffer de la
+tubería lleno, y entrega cada línea a on_output(stream, línea) para mostrar
+el progreso en vivo.
+
+Se aplican los límites de tiempo real, CPU y memoria de limits.py: al
+superar uno se termina el árbol de procesos completo. El uso de recursos
+consumido se informa en el diccionario `usage`: en POSIX es el rusage exacto
+del proceso (os.wait4); en otros sistemas, la última muestra de psutil.
+"""
+import errno
+import os
+import subprocess
+import threading
+import time
+
+from limits import CPU, MEMORY, WALL, breached, kill_tree, limited_command, popen_options, psutil, sample_tree
+
+# Segundos que se espera a los hilos lectores después de terminar el proceso
+# (un nieto que heredó la tubería puede mantenerla abierta)
+READER_JOIN_TIMEOUT = 5.0
+
+
+def _drain(pipe, name, chunks, on_output):
+    try:
+        for line in iter(pipe.readline, b''):
+            chunks.append(line)
+            if on_output is not None:
+                try:
+                    on_output(name, line)
+                except Exception:
+                    pass
+    finally:
+        pipe.close()
+
+
+def _reap(process, block=False):
+    """
+    Recoge el proceso si terminó. Devuelve (terminó, rusage); rusage es None
+    donde no hay os.wait4.
+    """
+    if not hasattr(os, 'wait4'):
+        if block:
+            process.wait()
+        return process.poll() is not None, None
+    try:
+        pid, status, rusage = os.wait4(process.pid, 0 if block else os.WNOHANG)
+    except OSError as e:
+        if e.errno != errno.ECHILD:
+            raise
+        return process.poll() is not None, None
+    if pid == 0:
+        return False, None
+    # Popen ya no debe esperar al proceso: se le informa el código de salida
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return True, rusage
+
+
+def _rusage_limit(limits, process, rusage, stderr):
+    # Límites aplicados por el sistema (rlimits) cuando no hay psutil
+    if psutil is not None or not limits:
+        return None
+    if limits.get('cpu') and rusage is not None and \
+            rusage.ru_utime + rusage.ru_stime >= limits['cpu'] and process.returncode < 0:
+        return CPU
+    if limits.get('memory') and process.returncode != 0 and b'MemoryError' in stderr:
+        return MEMORY
+    return None
+
+
+def run_process(cmd, limits=None, on_progress=None, on_output=None, usage=None, poll_interval=0.5):
+    """
+    Ejecuta `cmd` y devuelve (exit_code, stdout, stderr, limit_exceeded).
+    `limits` es un diccionario de LimitPolicy ('wall', 'cpu', 'memory'; los
+    ausentes o None no se aplican). Si se supera un límite, se termina el
+    árbol de procesos y se devuelve la salida leída hasta ese momento con
+    exit_code -1; usage['limit'] indica cuál.
+    """
+    limits = limits or {}
+    start_time = time.time()
+    process = subprocess.Popen(limited_command(cmd, limits), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               **popen_options(limits))
+    outputs = {'stdout': [], 'stderr': []}
+    readers = []
+    for name in ('stdout', 'stderr'):
+        reader = threading.Thread(target=_drain, name='drain-{}-{}'.format(name, process.pid),
+                                  args=(getattr(process, name), name, outputs[name], on_output))
+        reader.daemon = True
+        reader.start()
+        readers.append(reader)
+
+    limit = None
+    peak = None
+    done, rusage = _reap(process)
+    while not done:
+        elapsed = time.time() - start_time
+        sample = sample_tree(process.pid)
+        if sample is not None:
+            peak = (sample[0], max(sample[1], peak[1] if peak else 0))
+        if limits.get('wall') and elapsed > limits['wall']:
+            limit = WALL
+        else:
+            limit = breached(limits, sample)
+        if limit:
+            kill_tree(process)
+            done, rusage = _reap(process, block=True)
+            break
+        if on_progress is not None:
+            on_progress(elapsed)
+        if readers[0].is_alive():
+            # Vuelve en cuanto el proceso cierra su salida (normalmente al terminar)
+            readers[0].join(poll_interval)
+        else:
+            time.sleep(0.05)
+        done, rusage = _reap(process)
+
+    for reader in readers:
+        reader.join(READER_JOIN_TIMEOUT)
+    stdout = b''.join(outputs['stdout'])
+    stderr = b''.join(outputs['stderr'])
+    limit = limit or _rusage_limit(limits, process, rusage, stderr)
+
+    if usage is not None:
+        usage['wall'] = round(time.time() - start_time, 3)
+        usage['limit'] = limit
+        if rusage is not None:
+            usage['cpu_user'] = round(rusage.ru_utime, 3)
+            usage['cpu_system'] = round(rusage.ru_stime, 3)
+            usage['cpu'] = round(rusage.ru_utime + rusage.ru_stime, 3)
+            # En Linux ru_maxrss está en KiB
+            usage['max_rss'] = rusage.ru_maxrss * 1024
+        elif peak is not None:
+            usage['cpu'] = round(peak[0], 3)
+            usage['max_rss'] = peak[1]
+
+    if limit:
+        return -1, stdout, stderr, True
+    return process.returncode, stdout, stderr, False
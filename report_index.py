@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Índice SQLite de los reportes generados.
+
+El pipeline de validación registra una fila por reporte (la sesión completa
+con article = '' y, en las validaciones de carpeta, una fila por artículo)
+con las rutas del HTML y del texto, el estado, los tamaños y las fechas.
+open_html_report() y download_report() resuelven un reporte con una sola
+consulta por clave primaria en lugar de recorrer TEMP_DIR.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('scielo_validator')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_id TEXT NOT NULL,
+    article TEXT NOT NULL DEFAULT '',
+    html_path TEXT,
+    txt_path TEXT,
+    status TEXT,
+    success INTEGER,
+    html_size INTEGER,
+    txt_size INTEGER,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (report_id, article)
+);
+CREATE INDEX IF NOT EXISTS reports_created ON reports (created);
+"""
+
+_COLUMNS = ('report_id', 'article', 'html_path', 'txt_path', 'status', 'success',
+            'html_size', 'txt_size', 'created', 'updated')
+
+
+def _size(path):
+    if not path:
+        return None
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+class ReportIndex(object):
+    """
+    Una conexión compartida protegida por un lock: las escrituras son pocas
+    (una por reporte) y las lecturas son consultas por clave primaria.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        try:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError:
+            pass
+
+    def record(self, report_id, article='', html_path=None, txt_path=None, status=None, success=None):
+        """
+        Registra o actualiza un reporte. Las rutas que no se indican conservan
+        su valor anterior; los tamaños se leen del disco.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO reports (report_id, article, created, updated) VALUES (?, ?, ?, ?)',
+                (report_id, article, now, now))
+            self._conn.execute(
+                'UPDATE reports SET html_path = COALESCE(?, html_path), txt_path = COALESCE(?, txt_path), '
+                'status = COALESCE(?, status), success = COALESCE(?, success), updated = ? '
+                'WHERE report_id = ? AND article = ?',
+                (html_path, txt_path, status, None if success is None else int(bool(success)), now,
+                 report_id, article))
+            row = self._get(report_id, article)
+            self._conn.execute(
+                'UPDATE reports SET html_size = ?, txt_size = ? WHERE report_id = ? AND article = ?',
+                (_size(row['html_path']), _size(row['txt_path']), report_id, article))
+
+    def _get(self, report_id, article):
+        row = self._conn.execute(
+            'SELECT {} FROM reports WHERE report_id = ? AND article = ?'.format(', '.join(_COLUMNS)),
+            (report_id, article)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def lookup(self, report_id, article=''):
+        """Fila del reporte como diccionario, o None si no está indexado"""
+        with self._lock:
+            return self._get(report_id, article)
+
+    def forget(self, report_ids):
+        """Elimina las filas (sesión y artículos) de los reportes indicados"""
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM reports WHERE report_id = ?',
+                                   [(report_id,) for report_id in report_ids])
+
+    def forget_older_than(self, max_age):
+        """Elimina las filas de reportes creados hace más de `max_age` segundos"""
+        with self._lock, self._conn:
+            removed = self._conn.execute('DELETE FROM reports WHERE created < ?',
+                                         (time.time() - max_age,)).rowcount
+        if removed:
+            logger.info("Removed {} expired report index rows".format(removed))
+        return removed
+
+    def stats(self):
+        with self._lock:
+            count, html_bytes, txt_bytes = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(html_size), 0), COALESCE(SUM(txt_size), 0) FROM reports'
+            ).fetchone()
+        return {'reports': count, 'html_bytes': html_bytes, 'txt_bytes': txt_bytes}
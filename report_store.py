@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Almacenamiento de reportes comprimidos con gzip.
+
+Los reportes consolidados y los HTML de xml_package_maker se guardan como
+`<nombre>.gz`. Al servirlos, si el cliente acepta gzip se envían los bytes
+guardados tal cual (Content-Encoding: gzip); si no, se descomprimen al
+vuelo. Las rutas sin `.gz` (reportes anteriores) se leen sin cambios.
+"""
+import gzip
+import io
+import os
+import shutil
+import uuid
+
+GZIP_SUFFIX = '.gz'
+
+# Nivel de compresión: los reportes son texto muy repetitivo y el nivel 6
+# comprime casi igual que el 9 en una fracción del tiempo
+COMPRESS_LEVEL = 6
+
+
+def is_compressed(path):
+    return path.endswith(GZIP_SUFFIX)
+
+
+def _atomic_target(dest):
+    directory = os.path.dirname(dest)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    return '{}.tmp-{}'.format(dest, uuid.uuid4().hex)
+
+
+def _replace(tmp_path, dest):
+    # os.rename no reemplaza un archivo existente en Windows
+    if os.path.exists(dest):
+        os.remove(dest)
+    os.rename(tmp_path, dest)
+
+
+def _gzip_writer(fileobj, name):
+    # mtime=0 hace que el mismo reporte produzca siempre los mismos bytes
+    return gzip.GzipFile(filename=name, mode='wb', compresslevel=COMPRESS_LEVEL,
+                         fileobj=fileobj, mtime=0)
+
+
+def compress_bytes(data, level=COMPRESS_LEVEL):
+    """`data` comprimido con gzip, en memoria"""
+    buf = io.BytesIO()
+    with gzip.GzipFile(mode='wb', compresslevel=level, fileobj=buf, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def store_bytes(dest, data):
+    """Guarda `data` comprimido en `dest` (que debe terminar en .gz)"""
+    tmp_path = _atomic_target(dest)
+    try:
+        with open(tmp_path, 'wb') as raw:
+            with _gzip_writer(raw, os.path.basename(dest)[:-len(GZIP_SUFFIX)]) as f:
+                f.write(data)
+        _replace(tmp_path, dest)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return dest
+
+
+def store_file(source, dest):
+    """
+    Copia `source` a `dest` (.gz) comprimiéndolo por bloques, o tal cual si
+    ya estaba comprimido.
+    """
+    tmp_path = _atomic_target(dest)
+    try:
+        with open(source, 'rb') as src:
+            with open(tmp_path, 'wb') as raw:
+                if is_compressed(source):
+                    shutil.copyfileobj(src, raw)
+                else:
+                    with _gzip_writer(raw, os.path.basename(source)) as f:
+                        shutil.copyfileobj(src, f)
+        _replace(tmp_path, dest)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return dest
+
+
+def compress_in_place(path):
+    """Reemplaza `path` por `path.gz` y devuelve la ruta nueva"""
+    if is_compressed(path):
+        return path
+    dest = store_file(path, path + GZIP_SUFFIX)
+    os.remove(path)
+    return dest
+
+
+def read_report(path):
+    """Contenido descomprimido de un reporte, esté o no comprimido"""
+    if is_compressed(path):
+        with open(path, 'rb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='rb') as f:
+                return f.read()
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def read_stored(path):
+    """Bytes tal como están en disco"""
+    with open(path, 'rb') as f:
+        return f.read()
+
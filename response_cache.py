@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Caché en memoria de las páginas de reporte ya generadas.
+
+Las claves incluyen la ruta, la fecha de modificación y el tamaño del archivo
+de origen, de modo que un reporte regenerado produce una clave nueva y la
+entrada anterior simplemente envejece. El total de bytes está acotado y se
+expulsan primero las entradas usadas hace más tiempo (LRU). Cada entrada
+lleva un ETag fuerte calculado sobre el contenido para responder 304 a las
+peticiones condicionales.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def make_etag(body):
+    """ETag fuerte (sin comillas) a partir del contenido"""
+    return hashlib.sha1(body).hexdigest()
+
+
+class ResponseCache(object):
+    """
+    LRU acotado por bytes. Las respuestas mayores que `max_entry_bytes` no se
+    guardan para no desplazar a todas las demás.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            # Volver a insertarla la deja como la más reciente
+            self._entries[key] = entry
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype, last_modified):
+        """Guarda una respuesta y devuelve su entrada"""
+        entry = {
+            'body': body,
+            'etag': make_etag(body),
+            'mimetype': mimetype,
+            'last_modified': last_modified
+        }
+        if len(body) > self.max_entry_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous['body'])
+            self._entries[key] = entry
+            self.total_bytes += len(body)
+            while self.total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted['body'])
+                self.evictions += 1
+        return entry
+
+    def get_or_render(self, key, render, mimetype, last_modified):
+        """Entrada de la caché o, si no está, la genera con render()"""
+        entry = self.get(key)
+        if entry is None:
+            entry = self.put(key, render(), mimetype, last_modified)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(float(self.hits) / requests, 3) if requests else 0.0
+            }
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Caché persistente de resultados de validación, direccionada por contenido.
+
+La clave es un SHA-256 sobre los bytes ya sanitizados de los XML, los hashes
+de los archivos de soporte y la identidad del validador, de modo que volver a
+subir el mismo paquete devuelve el reporte guardado sin lanzar el validador.
+Cada entrada es un directorio con el resultado en JSON y, si existe, una copia
+del reporte HTML.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from report_store import store_file
+
+logger = logging.getLogger('scielo_validator')
+
+
+def file_sha256(path, chunk_size=65536):
+    """Calcula el SHA-256 de un archivo leyéndolo por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _dir_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file_name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return total
+
+
+class ResultCache(object):
+    """
+    Caché de resultados con expulsión por antigüedad y por tamaño total.
+
+    Las entradas que no se usan en `max_age` segundos se eliminan, y si el
+    total supera `max_bytes` se eliminan primero las usadas hace más tiempo.
+    """
+
+    RESULT_FILE = 'result.json'
+    HTML_FILE = 'report.html.gz'
+    # Segundos mínimos entre dos recorridos de expulsión
+    EVICT_INTERVAL = 60
+    # Cambia cuando cambia el formato de los resultados guardados (2: reporte
+    # de carpeta con tabla por artículo; 3: HTML comprimido con gzip)
+    KEY_VERSION = 3
+
+    def __init__(self, cache_dir, validator_path, max_bytes, max_age):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.validator_id = self._validator_id(validator_path)
+        self._lock = threading.Lock()
+        self._last_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.entries = 0
+        self.total_bytes = 0
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def _validator_id(validator_path):
+        # Ruta, tamaño y fecha del validador: cambia al actualizarlo
+        version = os.environ.get('SCIELO_VALIDATOR_VERSION', '')
+        try:
+            st = os.stat(validator_path)
+            return u'{}|{}|{}|{}'.format(validator_path, st.st_size, int(st.st_mtime), version)
+        except OSError:
+            return u'{}|{}'.format(validator_path, version)
+
+    def package_key(self, xml_files, support_files=(), hashes=None):
+        """
+        Clave de la caché para un paquete ya sanitizado. `hashes` puede traer
+        el SHA-256 ya calculado de cada ruta para no volver a leer el archivo.
+        """
+        hashes = hashes or {}
+        digest = hashlib.sha256()
+        digest.update(u'{}|{}'.format(self.KEY_VERSION, self.validator_id).encode('utf-8'))
+        for kind, paths in (('xml', xml_files), ('support', support_files)):
+            for path in sorted(paths, key=os.path.basename):
+                digest.update(u'\0{}\0{}\0{}'.format(
+                    kind, os.path.basename(path), hashes.get(path) or file_sha256(path)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """
+        Devuelve el resultado guardado (con 'html_path' si hay HTML) o None.
+        """
+        entry_dir = self._entry_dir(key)
+        result_path = os.path.join(entry_dir, self.RESULT_FILE)
+        try:
+            with open(result_path, 'rb') as f:
+                entry = json.loads(f.read().decode('utf-8'))
+            if time.time() - entry.get('created', 0) > self.max_age:
+                entry = None
+            else:
+                # Marcar el acceso para la expulsión por uso
+                os.utime(result_path, None)
+        except (IOError, OSError, ValueError):
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        html_path = os.path.join(entry_dir, self.HTML_FILE)
+        entry['html_path'] = html_path if os.path.exists(html_path) else None
+        return entry
+
+    def put(self, key, result, html_path=None):
+        """Guarda un resultado (diccionario serializable) y su reporte HTML"""
+        entry = dict(result)
+        entry['key'] = key
+        entry['validator'] = self.validator_id
+        entry['created'] = time.time()
+
+        # Escribir en un directorio temporal y renombrarlo al final para que
+        # nunca se lea una entrada a medio escribir
+        tmp_dir = os.path.join(self.cache_dir, 'tmp-' + uuid.uuid4().hex)
+        try:
+            os.makedirs(tmp_dir)
+            if html_path:
+                store_file(html_path, os.path.join(tmp_dir, self.HTML_FILE))
+            with open(os.path.join(tmp_dir, self.RESULT_FILE), 'wb') as f:
+                f.write(json.dumps(entry).encode('utf-8'))
+
+            entry_dir = self._entry_dir(key)
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            elif not os.path.exists(os.path.dirname(entry_dir)):
+                os.makedirs(os.path.dirname(entry_dir))
+            os.rename(tmp_dir, entry_dir)
+        except (IOError, OSError) as e:
+            logger.error("Error storing cache entry {}: {}".format(key[:12], str(e)))
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        with self._lock:
+            self.stores += 1
+        self.maybe_evict()
+
+    def maybe_evict(self):
+        """Ejecuta evict() si pasó EVICT_INTERVAL desde el último recorrido"""
+        with self._lock:
+            if time.time() - self._last_evict < self.EVICT_INTERVAL:
+                return
+            self._last_evict = time.time()
+        self.evict()
+
+    def evict(self):
+        """Elimina entradas vencidas y las menos usadas si se excede max_bytes"""
+        now = time.time()
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            if prefix.startswith('tmp-'):
+                # Restos de escrituras interrumpidas
+                if now - os.path.getmtime(prefix_dir) > 3600:
+                    shutil.rmtree(prefix_dir, ignore_errors=True)
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    last_access = os.path.getmtime(os.path.join(entry_dir, self.RESULT_FILE))
+                except OSError:
+                    last_access = 0
+                entries.append((last_access, _dir_size(entry_dir), entry_dir))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+        for last_access, size, entry_dir in entries:
+            if now - last_access <= self.max_age and total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_bytes -= size
+            removed += 1
+
+        with self._lock:
+            self.evictions += removed
+            self.entries = len(entries) - removed
+            self.total_bytes = total_bytes
+        if removed:
+            logger.info("Result cache: evicted {} entries, {} bytes in use".format(removed, total_bytes))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(float(self.hits) / lookups, 3) if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'entries': self.entries,
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Fija los rlimits de CPU y memoria y se reemplaza por el comando indicado
+(solo POSIX):
+
+    python rlimit_exec.py CPU MEMORIA -- comando [argumentos...]
+
+CPU en segundos y MEMORIA en bytes; 0 es sin límite. El comando conserva el
+PID y el grupo de procesos, así que se termina igual que si se hubiera
+lanzado directamente. Reemplaza a un preexec_fn que llamaba a setrlimit:
+en el servidor, con varios hilos, el código Python entre fork y exec puede
+bloquearse (ver limits.popen_options).
+"""
+import os
+import resource
+import sys
+
+
+def main(argv):
+    cpu, memory = int(argv[1]), int(argv[2])
+    cmd = argv[4:]
+    if cpu:
+        # SIGXCPU al llegar al límite y SIGKILL unos segundos después
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu + 1, cpu + 5))
+    if memory:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    os.execvp(cmd[0], cmd)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
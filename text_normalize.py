@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Conversión de texto a ASCII puro y saneamiento de nombres de archivo.
+
+to_ascii() se aplica a toda la salida del validador, a los reportes y a cada
+valor de las respuestas JSON, por lo que debe ser barata: el texto que ya es
+ASCII se devuelve sin copiarlo, y el resto se convierte con dos operaciones
+en C (codificar a Latin-1 y traducir byte a byte con una tabla precalculada)
+en lugar de un reemplazo por cada carácter especial.
+"""
+import os
+import re
+import unicodedata
+
+if bytes is str:  # Python 2
+    text_type = unicode
+    _native = lambda data: data
+else:  # Python 3, solo para herramientas y benchmarks
+    text_type = str
+    _native = lambda data: data.decode('ascii')
+
+# Caracteres del español con una alternativa ASCII; el resto se convierte en '?'
+ASCII_REPLACEMENTS = {
+    u'\xe1': 'a', u'\xe9': 'e', u'\xed': 'i', u'\xf3': 'o', u'\xfa': 'u',
+    u'\xc1': 'A', u'\xc9': 'E', u'\xcd': 'I', u'\xd3': 'O', u'\xda': 'U',
+    u'\xf1': 'n', u'\xd1': 'N', u'\xfc': 'u', u'\xdc': 'U',
+    u'\xbf': '?', u'\xa1': '!', u'\xe7': 'c', u'\xc7': 'C'
+}
+
+
+def _build_latin1_table():
+    # Tabla de 256 bytes: ASCII sin cambios, los reemplazos conocidos (todos
+    # dentro de Latin-1) y '?' para cualquier otro byte alto
+    table = [chr(i) if i < 128 else '?' for i in range(256)]
+    for char, replacement in ASCII_REPLACEMENTS.items():
+        table[ord(char)] = replacement
+    return ''.join(table).encode('latin-1')
+
+_LATIN1_TABLE = _build_latin1_table()
+
+# Marcas diacríticas combinantes que quedan tras la descomposición NFKD
+_COMBINING_MARKS = re.compile(u'[\u0300-\u036f]')
+
+_NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+_FILENAME_UNSAFE = re.compile(r'[^A-Za-z0-9._\- ]')
+
+# Caracteres no permitidos en rutas de Windows
+_WINDOWS_PATH_UNSAFE = re.compile(r'[<>:"/\\|?*]')
+
+# Nombres de archivos subidos: solo letras, dígitos, punto, guion y guion bajo
+_UPLOAD_NAME_UNSAFE = re.compile(r'[^A-Za-z0-9._-]+')
+
+_WINDOWS_RESERVED_NAMES = frozenset(
+    ['CON', 'PRN', 'AUX', 'NUL'] +
+    ['COM{}'.format(i) for i in range(1, 10)] +
+    ['LPT{}'.format(i) for i in range(1, 10)])
+
+# Longitud máxima del nombre sin extensión y de la extensión de un archivo
+# subido, para no acercarse al límite de rutas de Windows
+MAX_UPLOAD_STEM_LENGTH = 80
+MAX_UPLOAD_EXT_LENGTH = 16
+
+
+def _unicode_to_ascii(text):
+    try:
+        # Camino rápido: el texto ya es ASCII
+        return text.encode('ascii')
+    except UnicodeEncodeError:
+        # Fuera de Latin-1 no hay alternativa: '?' igual que al codificar a ASCII
+        return text.encode('latin-1', 'replace').translate(_LATIN1_TABLE)
+
+
+def fold_accents(text):
+    """
+    Descompone el texto (NFKD) y elimina las marcas diacríticas, de modo que
+    'São' se convierte en 'Sao' en lugar de 'S?o'.
+    """
+    return _COMBINING_MARKS.sub(u'', unicodedata.normalize('NFKD', text))
+
+
+def to_ascii(text, fold=False):
+    """
+    Convierte cualquier texto a ASCII puro, reemplazando caracteres no-ASCII con alternativas seguras.
+    Maneja correctamente cadenas Unicode en Python 2.7.
+
+    Con fold=True, los caracteres sin reemplazo conocido se descomponen
+    (NFKD) antes de sustituirlos por '?'.
+    """
+    if text is None:
+        return ""
+
+    # Convertir a string si no lo es
+    if not isinstance(text, (bytes, text_type)):
+        try:
+            text = str(text)
+        except Exception:
+            return repr(text)
+
+    try:
+        if isinstance(text, bytes):
+            try:
+                text.decode('ascii')
+                return _native(text)
+            except UnicodeDecodeError:
+                text = text.decode('utf-8', 'replace')
+
+        if fold:
+            text = fold_accents(text)
+        return _native(_unicode_to_ascii(text))
+    except Exception:
+        pass
+
+    # Último recurso: descartar cualquier byte no ASCII
+    try:
+        return _NON_ASCII.sub('_', str(text))
+    except Exception:
+        return repr(text)
+
+
+def sanitize_filename(filename):
+    """
+    Sanitiza un nombre de archivo para que solo contenga caracteres ASCII seguros.
+    """
+    if filename is None:
+        return ""
+
+    safe_name = _FILENAME_UNSAFE.sub('_', to_ascii(filename)).strip()
+
+    # Si el nombre quedó vacío, usar un valor por defecto
+    return safe_name or "file"
+
+
+def sanitize_windows_path(path):
+    """
+    Sanitiza una ruta de archivo para que sea compatible con Windows.
+    Reemplaza caracteres no permitidos y caracteres no ASCII.
+    """
+    if path is None:
+        return ""
+
+    # Convertir a string si no lo es
+    if not isinstance(path, (bytes, text_type)):
+        path = str(path)
+
+    # Dividir la ruta en partes (directorios)
+    if '/' in path:
+        parts = path.split('/')
+    elif '\\' in path:
+        parts = path.split('\\')
+    else:
+        parts = [path]
+
+    sanitized_parts = []
+    for part in parts:
+        if not part:
+            continue
+        sanitized = _WINDOWS_PATH_UNSAFE.sub('_', to_ascii(part)).strip()
+        sanitized_parts.append(sanitized or "dir")
+
+    # Reconstruir la ruta con el separador del sistema
+    if sanitized_parts:
+        return os.path.join(*sanitized_parts)
+    return "dir"
+
+
+def sanitize_upload_name(filename):
+    """
+    Nombre seguro, sin directorios, para un archivo subido. Conserva los
+    nombres que ya son seguros (como los de los paquetes SciELO) para que las
+    referencias dentro del XML sigan siendo válidas.
+    """
+    basename = re.split(r'[\\/]', filename or '')[-1]
+    name, ext = os.path.splitext(basename)
+
+    stem = _UPLOAD_NAME_UNSAFE.sub('_', to_ascii(name, fold=True)).strip('._')
+    stem = stem[:MAX_UPLOAD_STEM_LENGTH] or 'file'
+    if stem.upper() in _WINDOWS_RESERVED_NAMES:
+        stem = '_' + stem
+
+    ext = _UPLOAD_NAME_UNSAFE.sub('', to_ascii(ext, fold=True)).lower()[:MAX_UPLOAD_EXT_LENGTH]
+    if ext == '.':
+        ext = ''
+    return stem + ext
+
+
+def sanitize_upload_names(filenames):
+    """
+    Sanea todos los nombres de una carga en una sola llamada y garantiza que
+    no se repitan (sin distinguir mayúsculas, como en Windows). En caso de
+    colisión se agrega '-2', '-3', ... antes de la extensión; el primer
+    archivo conserva el nombre. Devuelve los nombres en el mismo orden.
+    """
+    used = set()
+    result = []
+    for filename in filenames:
+        safe_name = sanitize_upload_name(filename)
+        stem, ext = os.path.splitext(safe_name)
+        candidate = safe_name
+        suffix = 2
+        while candidate.lower() in used:
+            candidate = '{}-{}{}'.format(stem, suffix, ext)
+            suffix += 1
+        used.add(candidate.lower())
+        result.append(candidate)
+    return result
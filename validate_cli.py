@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Validación sin servidor de un árbol completo de paquetes SciELO.
+
+Cada carpeta bajo RAIZ que contiene al menos un XML es un paquete (sus
+subcarpetas sin XML, como img/, forman parte de él). Los paquetes se validan
+en paralelo en un pool de procesos con el mismo pipeline que usa el servidor
+(pipeline.py): nombres seguros, reescritura de fuentes, un subpaquete por
+artículo, límites de recursos y reporte consolidado.
+
+    python validate_cli.py RAIZ [--out validacion] [--processes 4]
+                                [--python C:\\Python27\\python.exe]
+                                [--validator C:\\scielo\\bin\\xml\\xml_package_maker.py]
+
+En la carpeta --out quedan:
+
+- state.jsonl: una línea por paquete terminado. Al volver a ejecutar se
+  saltan los paquetes ya validados sin error cuyo contenido (nombres,
+  tamaños y fechas) y validador no cambiaron; --restart empieza de cero.
+- summary.csv: una fila por paquete.
+- reports/<paquete>.txt y reports/<paquete>/<articulo>/*.html: reportes de
+  cada paquete; reports/<paquete>.findings.json: sus hallazgos (ver
+  findings.py).
+- work/: directorios de trabajo, que se borran salvo con --keep-work.
+
+Los límites de recursos se configuran con las mismas variables
+SCIELO_LIMIT_* que el servidor. Sale con 0 si todos los paquetes son
+válidos, 1 si alguno no lo es y 130 si se interrumpe.
+"""
+from __future__ import print_function
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+
+import findings
+from article_split import ARTICLES_DIR
+from limits import LimitPolicy
+from pipeline import ingest_package, subprocess_runner, validate_package
+from report_store import GZIP_SUFFIX, read_report
+from text_normalize import to_ascii
+
+logger = logging.getLogger('scielo_validator')
+
+# Mismos valores por omisión que la configuración de app.py
+XML_PACKAGE_MAKER = r"C:\scielo\bin\xml\xml_package_maker.py"
+
+STATE_FILE = 'state.jsonl'
+SUMMARY_FILE = 'summary.csv'
+
+SUMMARY_FIELDS = ('package', 'success', 'articles', 'valid', 'with_errors', 'timeouts', 'fatal', 'errors',
+                  'warnings', 'duration', 'report', 'error', 'finished')
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9._-]+')
+
+# Configuración de cada proceso del pool (ver _init_worker)
+_worker = {}
+
+
+def find_packages(root):
+    """
+    Carpetas bajo `root` que contienen algún XML, con las carpetas de otros
+    paquetes anidados dentro de cada una. Devuelve [(ruta relativa, carpeta,
+    carpetas a saltar)] en orden.
+    """
+    package_dirs = []
+    for current, dirs, files in os.walk(root):
+        dirs.sort()
+        if any(name.lower().endswith('.xml') for name in files):
+            package_dirs.append(current)
+
+    packages = []
+    for package_dir in package_dirs:
+        nested = [other for other in package_dirs
+                  if other != package_dir and other.startswith(os.path.join(package_dir, ''))]
+        rel = os.path.relpath(package_dir, root).replace(os.sep, '/')
+        packages.append((rel, package_dir, nested))
+    return packages
+
+
+def package_signature(package_dir, skip_dirs, validator_path):
+    """Huella barata del paquete: nombres, tamaños y fechas de sus archivos y del validador"""
+    digest = hashlib.sha256()
+    skip = set(os.path.abspath(path) for path in skip_dirs)
+    for current, dirs, files in os.walk(package_dir):
+        dirs[:] = sorted(name for name in dirs if os.path.abspath(os.path.join(current, name)) not in skip)
+        for name in sorted(files):
+            st = os.stat(os.path.join(current, name))
+            rel = os.path.relpath(os.path.join(current, name), package_dir)
+            digest.update(u'{}\0{}\0{}\0'.format(rel, st.st_size, int(st.st_mtime)).encode('utf-8'))
+    try:
+        st = os.stat(validator_path)
+        validator_id = u'{}|{}|{}'.format(validator_path, st.st_size, int(st.st_mtime))
+    except OSError:
+        validator_id = validator_path
+    digest.update(validator_id.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def safe_package_name(rel):
+    """Nombre de archivo para los reportes de un paquete"""
+    return _SAFE_NAME.sub('_', to_ascii(rel, fold=True).replace('/', '__')).strip('._') or 'root'
+
+
+def load_state(path):
+    """Último registro de cada paquete en state.jsonl"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                # Línea a medias de una ejecución interrumpida
+                continue
+            done[record['package']] = record
+    return done
+
+
+def write_summary(path, records):
+    if bytes is str:  # Python 2
+        f = open(path, 'wb')
+    else:
+        f = open(path, 'w', newline='')
+    with f:
+        writer = csv.DictWriter(f, SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for record in records:
+            writer.writerow(dict((field, to_ascii(record.get(field))) for field in SUMMARY_FIELDS))
+
+
+def _write_bytes(path, data):
+    if not isinstance(data, bytes):
+        data = data.encode('ascii')
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _init_worker(config):
+    # Cada proceso del pool arma su propio runner (las funciones anidadas no
+    # se pueden enviar entre procesos)
+    _worker.update(config)
+    _worker['run'] = subprocess_runner(config['python'], config['validator'])
+    _worker['policy'] = LimitPolicy.from_env()
+    _configure_logging(config['verbose'])
+
+
+def _validate_task(task):
+    """Valida un paquete en un proceso del pool y devuelve su registro"""
+    rel, package_dir, skip_dirs, signature = task
+    name = safe_package_name(rel)
+    out = _worker['out']
+    session_dir = os.path.join(out, 'work', name)
+    reports_dir = os.path.join(out, 'reports')
+    record = {'package': rel, 'signature': signature, 'success': False, 'error': None}
+    start = time.time()
+
+    # Restos de una ejecución interrumpida
+    shutil.rmtree(session_dir, ignore_errors=True)
+    try:
+        xml_files, support_files, file_hashes, stats = ingest_package(package_dir, session_dir, skip_dirs)
+        result = validate_package(session_dir, xml_files, support_files, _worker['run'], _worker['policy'],
+                                  session_id=name)
+        report_path = os.path.join(reports_dir, name + '.txt')
+        _write_bytes(report_path, to_ascii(result['report']))
+        _write_bytes(os.path.join(reports_dir, name + findings.FINDINGS_SUFFIX), findings.dumps(result['findings']))
+        if result['html_files']:
+            # Un subdirectorio por artículo: todos generan reportes con el mismo nombre
+            articles_dir = os.path.join(session_dir, ARTICLES_DIR)
+            for path in result['html_files']:
+                dest = os.path.join(reports_dir, name, os.path.relpath(path, articles_dir))
+                if dest.endswith(GZIP_SUFFIX):
+                    dest = dest[:-len(GZIP_SUFFIX)]
+                if not os.path.exists(os.path.dirname(dest)):
+                    os.makedirs(os.path.dirname(dest))
+                _write_bytes(dest, read_report(path))
+
+        articles = result['articles']
+        counts = findings.counts(result['findings'])
+        record.update({
+            'success': result['success'],
+            'articles': len(articles),
+            'valid': sum(1 for article in articles if article['success']),
+            'with_errors': sum(1 for article in articles if not article['success'] and not article['timed_out']),
+            'timeouts': sum(1 for article in articles if article['timed_out']),
+            'fatal': counts[findings.FATAL],
+            'errors': counts[findings.ERROR],
+            'warnings': counts[findings.WARNING],
+            'report': os.path.relpath(report_path, out)
+        })
+    except Exception as e:
+        logger.exception("Error validando el paquete {}".format(rel))
+        record['error'] = to_ascii(str(e))
+    finally:
+        if not _worker['keep_work']:
+            shutil.rmtree(session_dir, ignore_errors=True)
+    record['duration'] = round(time.time() - start, 2)
+    record['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    return record
+
+
+def _configure_logging(verbose):
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(processName)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO if verbose else logging.WARNING)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('root', help='carpeta con los paquetes a validar')
+    parser.add_argument('--out', default='validacion', help='carpeta de resultados (por omision: validacion)')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='paquetes validados a la vez (por omision: un proceso por CPU)')
+    parser.add_argument('--python', default=sys.executable,
+                        help='interprete de Python 2.7 para xml_package_maker')
+    parser.add_argument('--validator', default=XML_PACKAGE_MAKER, help='ruta de xml_package_maker.py')
+    parser.add_argument('--restart', action='store_true', help='ignorar state.jsonl y validar todo')
+    parser.add_argument('--keep-work', action='store_true', help='conservar los directorios de trabajo')
+    parser.add_argument('--verbose', action='store_true', help='mostrar el log detallado')
+    args = parser.parse_args(argv)
+    _configure_logging(args.verbose)
+
+    root = os.path.abspath(args.root)
+    out = os.path.abspath(args.out)
+    for path in (out, os.path.join(out, 'work'), os.path.join(out, 'reports')):
+        if not os.path.exists(path):
+            os.makedirs(path)
+    state_path = os.path.join(out, STATE_FILE)
+    if args.restart and os.path.exists(state_path):
+        os.remove(state_path)
+    done = load_state(state_path)
+
+    packages = find_packages(root)
+    tasks = []
+    for rel, package_dir, skip_dirs in packages:
+        signature = package_signature(package_dir, skip_dirs, args.validator)
+        previous = done.get(rel)
+        if previous and previous['signature'] == signature and not previous.get('error'):
+            continue
+        tasks.append((rel, package_dir, skip_dirs, signature))
+    print("{} paquetes en {}: {} por validar, {} ya validados".format(
+        len(packages), root, len(tasks), len(packages) - len(tasks)))
+
+    config = {'out': out, 'python': args.python, 'validator': args.validator,
+              'keep_work': args.keep_work, 'verbose': args.verbose}
+    interrupted = False
+    pool = multiprocessing.Pool(max(1, args.processes), _init_worker, (config,))
+    try:
+        with open(state_path, 'ab') as state:
+            for count, record in enumerate(pool.imap_unordered(_validate_task, tasks), 1):
+                # Registrar cada paquete en cuanto termina para poder reanudar
+                state.write((json.dumps(record, sort_keys=True) + '\n').encode('utf-8'))
+                state.flush()
+                os.fsync(state.fileno())
+                done[record['package']] = record
+                status = 'ERROR: ' + record['error'] if record['error'] else \
+                    'valido' if record['success'] else 'con errores'
+                print("[{}/{}] {} - {} ({} s)".format(count, len(tasks), record['package'], status,
+                                                       record['duration']))
+        pool.close()
+    except KeyboardInterrupt:
+        interrupted = True
+        pool.terminate()
+    finally:
+        pool.join()
+
+    records = [done[rel] for rel, _, _ in packages if rel in done]
+    write_summary(os.path.join(out, SUMMARY_FILE), records)
+    print("{} de {} paquetes validos; resumen en {}".format(
+        sum(1 for record in records if record['success']), len(packages), os.path.join(out, SUMMARY_FILE)))
+    if interrupted:
+        return 130
+    return 0 if len(records) == len(packages) and all(record['success'] for record in records) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
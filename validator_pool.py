@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Control de concurrencia para los procesos de xml_package_maker.
+
+Cada ejecución del validador lanza un intérprete de Python 2.7 pesado, por lo
+que se limita el número de procesos simultáneos (slots) y el número de
+solicitudes que pueden esperar turno. Cuando la espera está llena, la solicitud
+se rechaza de inmediato con una estimación de cuándo reintentar.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolFull(Exception):
+    """No hay lugar en la cola de espera del validador"""
+
+    def __init__(self, retry_after):
+        Exception.__init__(self, "Validator queue is full")
+        self.retry_after = retry_after
+
+
+class ValidatorPool(object):
+    """
+    Limita los procesos del validador a `slots` simultáneos y admite como
+    máximo `queue_size` solicitudes adicionales esperando un slot.
+
+    Uso:
+        pool.admit()            # lanza PoolFull si no hay lugar
+        try:
+            with pool.slot():
+                ... ejecutar el validador ...
+        finally:
+            pool.release()
+    """
+
+    # Duración inicial supuesta de una validación, antes de medir ninguna
+    DEFAULT_RUN_SECONDS = 30.0
+
+    def __init__(self, slots, queue_size):
+        self.slots = max(1, int(slots))
+        self.queue_size = max(0, int(queue_size))
+        self._semaphore = threading.BoundedSemaphore(self.slots)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.completed = 0
+        self.avg_run_seconds = self.DEFAULT_RUN_SECONDS
+
+    def admit(self):
+        """Reserva un lugar para una solicitud o lanza PoolFull"""
+        with self._lock:
+            if self.admitted >= self.slots + self.queue_size:
+                self.rejected += 1
+                raise PoolFull(self._retry_after())
+            self.admitted += 1
+
+    def release(self):
+        """Libera el lugar reservado con admit()"""
+        with self._lock:
+            self.admitted = max(0, self.admitted - 1)
+
+    @contextmanager
+    def slot(self):
+        """Espera un slot libre y lo mantiene mientras corre el validador"""
+        with self._lock:
+            self.waiting += 1
+        self._semaphore.acquire()
+        start_time = time.time()
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+        try:
+            yield
+        finally:
+            duration = time.time() - start_time
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                # Media móvil exponencial para estimar el tiempo de espera
+                self.avg_run_seconds = 0.8 * self.avg_run_seconds + 0.2 * duration
+            self._semaphore.release()
+
+    def _retry_after(self):
+        # Debe llamarse con _lock adquirido
+        rounds = math.ceil(float(self.admitted - self.slots + 1) / self.slots)
+        return int(min(300, max(5, rounds * self.avg_run_seconds)))
+
+    def status(self):
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'busy': self.running,
+                'available': self.slots - self.running,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'queue_size': self.queue_size,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'avg_run_seconds': round(self.avg_run_seconds, 1)
+            }
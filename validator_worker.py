@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Worker persistente de xml_package_maker.
+
+Se ejecuta con el mismo intérprete que el validador (Python 2.7 de SciELO):
+
+    python validator_worker.py C:\\scielo\\bin\\xml\\xml_package_maker.py
+
+Importa una sola vez la pila del validador y luego atiende trabajos recibidos
+como líneas JSON por la entrada estándar:
+
+    {"id": "...", "args": ["<ruta>"], "stdout": "<archivo>", "stderr": "<archivo>"}
+
+Cada trabajo ejecuta el script del validador como si fuera __main__, con la
+salida y los errores redirigidos a los archivos indicados, y responde con una
+línea JSON por la salida estándar original:
+
+    {"id": "...", "exit_code": 0, "duration": 1.2, "cpu": 1.1, "rss": 123456}
+
+Los módulos ya importados quedan en sys.modules, por lo que a partir del
+segundo trabajo no se paga el arranque del intérprete ni las importaciones.
+"""
+import json
+import os
+import runpy
+import sys
+import time
+import traceback
+
+# Módulos que se importan al arrancar, separados por comas
+DEFAULT_PRELOAD = 'lxml.etree,packtools'
+
+
+def _rss():
+    """Memoria residente del worker en bytes, si se puede medir"""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except Exception:
+        pass
+    try:
+        import resource
+        # Pico de memoria; en Linux ru_maxrss está en KiB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return None
+
+
+def _cpu_time():
+    # Tiempo de CPU (usuario + sistema) consumido por el worker
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _exit_code(code):
+    # Misma convención que el intérprete al recibir SystemExit
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write('{}\n'.format(code))
+    return 1
+
+
+def preload():
+    loaded = []
+    names = os.environ.get('SCIELO_WORKER_PRELOAD', DEFAULT_PRELOAD)
+    for name in [n.strip() for n in names.split(',') if n.strip()]:
+        try:
+            __import__(name)
+            loaded.append(name)
+        except Exception:
+            pass
+    return loaded
+
+
+def run_job(maker, request, quiet_fd):
+    out_fd = os.open(request['stdout'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    err_fd = os.open(request['stderr'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    saved_err = os.dup(2)
+    saved_argv = sys.argv
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(out_fd, 1)
+    os.dup2(err_fd, 2)
+
+    start_time = time.time()
+    start_cpu = _cpu_time()
+    exit_code = 0
+    try:
+        sys.argv = [maker] + list(request.get('args', []))
+        runpy.run_path(maker, run_name='__main__')
+    except SystemExit as e:
+        exit_code = _exit_code(e.code)
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sys.argv = saved_argv
+        os.dup2(quiet_fd, 1)
+        os.dup2(saved_err, 2)
+        for fd in (out_fd, err_fd, saved_err):
+            os.close(fd)
+
+    return {
+        'id': request.get('id'),
+        'exit_code': exit_code,
+        'duration': round(time.time() - start_time, 3),
+        'cpu': round(_cpu_time() - start_cpu, 3),
+        'rss': _rss()
+    }
+
+
+def main():
+    maker = os.path.abspath(sys.argv[1])
+    # Como al ejecutar el script directamente, su carpeta va primero en sys.path
+    sys.path.insert(0, os.path.dirname(maker))
+
+    # Las respuestas salen por una copia de la salida estándar original; la
+    # salida estándar queda apuntando a devnull para que ningún print suelto
+    # se mezcle con el protocolo
+    protocol = os.fdopen(os.dup(1), 'w')
+    quiet_fd = os.open(os.devnull, os.O_RDWR)
+    os.dup2(quiet_fd, 1)
+
+    def send(message):
+        protocol.write(json.dumps(message) + '\n')
+        protocol.flush()
+
+    send({'ready': True, 'pid': os.getpid(), 'preloaded': preload(), 'rss': _rss()})
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        request = json.loads(line)
+        if request.get('cmd') == 'exit':
+            break
+        send(run_job(maker, request, quiet_fd))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Grupo de workers persistentes de xml_package_maker.
+
+Cada worker es un proceso validator_worker.py que ya importó la pila del
+validador y recibe trabajos por una tubería. Un worker se recicla después de
+`max_jobs` trabajos o si su memoria supera `max_rss`, y se descarta si se
+agota el tiempo o si muere; en ese caso quien llama puede recurrir a lanzar
+un proceso nuevo como antes.
+
+De los límites de limits.py, el de tiempo real se aplica siempre; los de CPU
+y memoria solo con psutil (un worker atiende muchos trabajos, así que no se
+le pueden fijar rlimits por trabajo).
+"""
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from limits import WALL, breached, kill_tree, popen_options, sample_tree
+
+logger = logging.getLogger('scielo_validator')
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'validator_worker.py')
+
+# Segundos que se espera a que un worker nuevo termine de importar
+STARTUP_TIMEOUT = 120
+
+
+class WorkerUnavailable(Exception):
+    """El worker no arrancó o murió durante un trabajo"""
+
+
+class _OutputTail(object):
+    """Lee las líneas nuevas de un archivo de salida mientras el worker escribe"""
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.offset = 0
+        self.partial = b''
+
+    def emit(self, on_output, final=False):
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        if final and self.partial:
+            lines.append(self.partial)
+            self.partial = b''
+        for line in lines:
+            on_output(self.name, line + b'\n')
+
+
+class WarmWorker(object):
+    """Un proceso validator_worker.py y su canal de respuestas"""
+
+    def __init__(self, python_path, maker_path, log_path):
+        self.jobs = 0
+        self.rss = None
+        self._responses = queue.Queue()
+        log = open(log_path, 'ab')
+        try:
+            self.process = subprocess.Popen(
+                [python_path, WORKER_SCRIPT, maker_path],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=log, **popen_options(None))
+        except OSError as e:
+            raise WorkerUnavailable("could not start worker: {}".format(e))
+        finally:
+            log.close()
+
+        reader = threading.Thread(target=self._read_responses, name='warm-worker-reader')
+        reader.daemon = True
+        reader.start()
+
+        ready = self._next_response(STARTUP_TIMEOUT)
+        if not ready or not ready.get('ready'):
+            self.kill()
+            raise WorkerUnavailable("worker did not become ready")
+        self.pid = ready.get('pid')
+        self.rss = ready.get('rss')
+        logger.info("Warm worker {} ready (preloaded: {})".format(
+            self.pid, ', '.join(ready.get('preloaded') or []) or 'none'))
+
+    def _read_responses(self):
+        # Una respuesta JSON por línea; None marca el fin del proceso
+        for line in iter(self.process.stdout.readline, b''):
+            try:
+                self._responses.put(json.loads(line.decode('utf-8')))
+            except ValueError:
+                continue
+        self._responses.put(None)
+
+    def _next_response(self, timeout):
+        try:
+            return self._responses.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, args, limits=None, on_progress=None, usage=None, on_output=None):
+        """
+        Ejecuta un trabajo. Devuelve (exit_code, stdout, stderr,
+        limit_exceeded); lanza WorkerUnavailable si el worker muere. Si se
+        pasa el diccionario `usage`, se completa con el uso de recursos del
+        trabajo; si se pasa on_output, recibe cada línea de salida mientras
+        el trabajo corre.
+        """
+        limits = limits or {}
+        job_id = uuid.uuid4().hex
+        out_fd, stdout_path = tempfile.mkstemp(prefix='xpm-', suffix='.out')
+        err_fd, stderr_path = tempfile.mkstemp(prefix='xpm-', suffix='.err')
+        os.close(out_fd)
+        os.close(err_fd)
+        try:
+            request = json.dumps({'id': job_id, 'args': list(args),
+                                  'stdout': stdout_path, 'stderr': stderr_path})
+            try:
+                self.process.stdin.write((request + '\n').encode('utf-8'))
+                self.process.stdin.flush()
+            except (IOError, OSError) as e:
+                raise WorkerUnavailable("worker pipe closed: {}".format(e))
+
+            tails = [_OutputTail(stdout_path, 'stdout'), _OutputTail(stderr_path, 'stderr')]
+            start_time = time.time()
+            start_sample = sample_tree(self.process.pid)
+            while True:
+                response = self._next_response(0.5)
+                if on_output is not None:
+                    for tail in tails:
+                        tail.emit(on_output, final=bool(response))
+                elapsed = time.time() - start_time
+                if response is None:
+                    raise WorkerUnavailable("worker exited during job")
+                if response is not False and response.get('id') == job_id:
+                    break
+                limit = None
+                if limits.get('wall') and elapsed > limits['wall']:
+                    limit = WALL
+                elif start_sample is not None:
+                    sample = sample_tree(self.process.pid)
+                    if sample is not None:
+                        limit = breached(limits, (sample[0] - start_sample[0], sample[1]))
+                if limit:
+                    self.kill()
+                    if usage is not None:
+                        usage.update({'wall': round(elapsed, 3), 'limit': limit})
+                    with open(stdout_path, 'rb') as f:
+                        stdout = f.read()
+                    with open(stderr_path, 'rb') as f:
+                        stderr = f.read()
+                    return -1, stdout, stderr, True
+                if on_progress is not None:
+                    on_progress(elapsed)
+
+            self.jobs += 1
+            self.rss = response.get('rss')
+            if usage is not None:
+                usage.update({'wall': response.get('duration'), 'cpu': response.get('cpu'),
+                              'max_rss': response.get('rss'), 'limit': None})
+            with open(stdout_path, 'rb') as f:
+                stdout = f.read()
+            with open(stderr_path, 'rb') as f:
+                stderr = f.read()
+            return response['exit_code'], stdout, stderr, False
+        finally:
+            for path in (stdout_path, stderr_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stop(self):
+        """Pide al worker que termine y lo mata si no lo hace"""
+        try:
+            self.process.stdin.write(b'{"cmd": "exit"}\n')
+            self.process.stdin.close()
+        except (IOError, OSError):
+            pass
+        deadline = time.time() + 5
+        while self.alive() and time.time() < deadline:
+            time.sleep(0.1)
+        self.kill()
+
+    def kill(self):
+        if self.alive():
+            kill_tree(self.process)
+
+
+class WarmWorkerPool(object):
+    """
+    Mantiene hasta `size` workers ociosos. La concurrencia la limita
+    ValidatorPool, de modo que nunca hay más trabajos simultáneos que slots.
+    """
+
+    def __init__(self, python_path, maker_path, log_path, size, max_jobs, max_rss):
+        self.python_path = python_path
+        self.maker_path = maker_path
+        self.log_path = log_path
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self._idle = []
+        self._lock = threading.Lock()
+        self.started = 0
+        self.recycled = 0
+        self.failures = 0
+        self.completed = 0
+        self.busy = 0
+
+    def _checkout(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive():
+                    self.busy += 1
+                    return worker
+        worker = WarmWorker(self.python_path, self.maker_path, self.log_path)
+        with self._lock:
+            self.started += 1
+            self.busy += 1
+        return worker
+
+    def _checkin(self, worker):
+        recycle = (worker.jobs >= self.max_jobs or
+                   (self.max_rss and worker.rss and worker.rss > self.max_rss))
+        with self._lock:
+            self.busy -= 1
+            if not recycle and len(self._idle) < self.size:
+                self._idle.append(worker)
+                return
+            self.recycled += 1
+        logger.info("Recycling warm worker {} after {} jobs (rss: {})".format(
+            worker.pid, worker.jobs, worker.rss))
+        stopper = threading.Thread(target=worker.stop, name='warm-worker-stop')
+        stopper.daemon = True
+        stopper.start()
+
+    def run(self, args, limits=None, on_progress=None, usage=None, on_output=None):
+        """
+        Ejecuta el validador con `args` en un worker caliente. Devuelve
+        (exit_code, stdout, stderr, limit_exceeded) o lanza WorkerUnavailable.
+        """
+        worker = self._checkout()
+        try:
+            result = worker.run(args, limits, on_progress, usage, on_output)
+        except WorkerUnavailable:
+            worker.kill()
+            with self._lock:
+                self.busy -= 1
+                self.failures += 1
+            raise
+
+        if result[3]:
+            # Tiempo agotado: el worker ya fue eliminado
+            with self._lock:
+                self.busy -= 1
+                self.failures += 1
+        else:
+            with self._lock:
+                self.completed += 1
+            self._checkin(worker)
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.stop()
+
+    def status(self):
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'busy': self.busy,
+                'started': self.started,
+                'recycled': self.recycled,
+                'failures': self.failures,
+                'completed': self.completed,
+                'max_jobs': self.max_jobs,
+                'max_rss': self.max_rss
+            }